@@ -0,0 +1,147 @@
+import gzip
+import hashlib
+import threading
+from bisect import bisect_left
+
+import brotli
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags, quote_etag
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from recipes.cache import get_versions
+from recipes.models import Ingredient
+
+
+def normalize(name):
+    """Ключ поиска: регистр не учитывается, "ё" не отличается от "е"."""
+    return name.strip().casefold().replace("ё", "е")
+
+
+class IngredientCatalogue:
+    """Каталог ингредиентов в памяти процесса с поиском по префиксу.
+
+    Загружается при первом обращении одним запросом и перестраивается,
+    когда меняется версия области "ingredients" (см. api.signals).
+    Поиск - двоичный по отсортированному списку нормализованных названий,
+    без обращения к БД. Полный список заранее отрендерен в JSON и сжат
+    gzip и brotli, так что нефильтрованный запрос отдаётся из памяти.
+    """
+
+    def __init__(self):
+        self.version = None
+        self.lock = threading.Lock()
+        # (ингредиенты по id, отсортированные ключи, id в порядке ключей)
+        self.index = ({}, [], [])
+        # (ETag, тело ответа для каждого Content-Encoding)
+        self.payload = (None, {})
+
+    def ensure_fresh(self):
+        version = get_versions("ingredients")["ingredients"]
+        if version == self.version:
+            return
+        with self.lock:
+            if version != self.version:
+                self.load()
+                self.version = version
+
+    def load(self):
+        ingredients = {
+            ingredient["id"]: ingredient
+            for ingredient in Ingredient.objects.values("id", "name", "measurement_unit")
+        }
+        keys = sorted(
+            (normalize(ingredient["name"]), ingredient_id)
+            for ingredient_id, ingredient in ingredients.items()
+        )
+        # Индекс заменяется одним присваиванием, чтобы параллельные запросы
+        # не увидели каталог в промежуточном состоянии.
+        self.index = (
+            ingredients, [key for key, _ in keys], [ingredient_id for _, ingredient_id in keys]
+        )
+        body = JSONRenderer().render([ingredients[key] for key in sorted(ingredients)])
+        self.payload = (quote_etag(hashlib.sha256(body).hexdigest()), {
+            "br": brotli.compress(body, quality=11),
+            "gzip": gzip.compress(body, compresslevel=9, mtime=0),
+            "identity": body,
+        })
+
+    def search(self, prefix, limit=None):
+        """Ингредиенты, название которых начинается с prefix, в порядке id."""
+        self.ensure_fresh()
+        prefix = normalize(prefix)
+        ingredients, keys, ids = self.index
+        start = bisect_left(keys, prefix)
+        # Все ключи с этим префиксом меньше, чем префикс + максимальный символ
+        end = bisect_left(keys, prefix + "\U0010ffff", start)
+        return [ingredients[ingredient_id] for ingredient_id in sorted(ids[start:end])[:limit]]
+
+    def get_many(self, ids):
+        """Ингредиенты с данными id, если каталог загружен и актуален, иначе None.
+
+        Каталог здесь не загружается: при первом обращении дешевле один
+        запрос id__in, чем загрузка всего справочника.
+        """
+        if self.version is None or get_versions("ingredients")["ingredients"] != self.version:
+            return None
+        ingredients = self.index[0]
+        return {
+            ingredient_id: ingredients[ingredient_id]
+            for ingredient_id in ids if ingredient_id in ingredients
+        }
+
+    def response(self, request):
+        """Полный каталог в подходящей клиенту кодировке, либо 304."""
+        self.ensure_fresh()
+        etag, bodies = self.payload
+        if etag in parse_etags(request.headers.get("If-None-Match", "")):
+            response = HttpResponseNotModified()
+        else:
+            encoding = self.choose_encoding(request.headers.get("Accept-Encoding", ""))
+            response = HttpResponse(bodies[encoding], content_type="application/json")
+            if encoding != "identity":
+                response["Content-Encoding"] = encoding
+        response["ETag"] = etag
+        patch_vary_headers(response, ("Accept-Encoding",))
+        return response
+
+    @staticmethod
+    def choose_encoding(accept_encoding):
+        accepted = set()
+        for item in accept_encoding.split(","):
+            coding, _, params = item.strip().partition(";")
+            if params.strip().replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+                accepted.add(coding.strip().lower())
+        for encoding in ("br", "gzip"):
+            if encoding in accepted:
+                return encoding
+        return "identity"
+
+
+ingredient_catalogue = IngredientCatalogue()
+
+
+class IngredientCatalogueMixin:
+    """list ингредиентов через каталог в памяти процесса.
+
+    Запрос без параметров получает готовый сжатый ответ, поиск по ?name=
+    идёт по индексу; необязательный параметр ``limit`` ограничивает число
+    результатов поиска. Запросы с другими параметрами (например, ordering)
+    обрабатываются обычными фильтрами.
+    """
+    catalogue_query_params = {"name", "limit"}
+
+    def list(self, request, *args, **kwargs):
+        params = request.query_params
+        if not params:
+            return ingredient_catalogue.response(request)
+        if "name" not in params or set(params) - self.catalogue_query_params:
+            return super().list(request, *args, **kwargs)
+        try:
+            limit = int(params["limit"]) if "limit" in params else None
+        except ValueError:
+            limit = None
+        if limit is not None and limit < 1:
+            limit = None
+        return Response(ingredient_catalogue.search(params["name"], limit))
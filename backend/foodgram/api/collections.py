@@ -0,0 +1,99 @@
+from functools import partial
+
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+
+from recipes.cache import bump_versions, user_scope
+from recipes.counters import change_counter
+from recipes.models import Component, Favorite, Recipe, ShoppingCart
+from recipes.shopping import refresh_shopping_lists
+from users.models import Subscription
+
+User = get_user_model()
+
+
+def favorites_changed(user_id, recipe_ids, delta):
+    change_counter(Recipe, "favorites_count", recipe_ids, delta)
+    transaction.on_commit(partial(bump_versions, user_scope("favorites", user_id)))
+
+
+def carts_changed(user_id, recipe_ids, delta):
+    refresh_shopping_lists([user_id], Component.objects.filter(
+        recipe__in=recipe_ids
+    ).values_list("ingredient_id", flat=True).distinct())
+    transaction.on_commit(partial(bump_versions, user_scope("carts", user_id)))
+
+
+def subscriptions_changed(user_id, author_ids, delta):
+    change_counter(User, "subscriptions_count", [user_id], delta * len(author_ids))
+    change_counter(User, "followers_count", author_ids, delta)
+    transaction.on_commit(partial(bump_versions, user_scope("subscriptions", user_id)))
+
+
+# Коллекции пользователя: модель -> (поле цели, обработчик изменений).
+# Сырые INSERT и DELETE не отправляют сигналы, поэтому обработчик делает
+# то же, что receivers из api.signals, recipes.signals и users.signals.
+COLLECTIONS = {
+    Favorite: ("recipe", favorites_changed),
+    ShoppingCart: ("recipe", carts_changed),
+    Subscription: ("subscribed_to", subscriptions_changed),
+}
+
+
+def _columns(collection):
+    quote = connection.ops.quote_name
+    field = collection._meta.get_field(COLLECTIONS[collection][0])
+    target = field.related_model._meta
+    return {
+        "table": quote(collection._meta.db_table),
+        "user": quote(collection._meta.get_field("user").column),
+        "target": quote(field.column),
+        "target_table": quote(target.db_table),
+        "target_pk": quote(target.pk.column),
+    }
+
+
+def add_to_collection(collection, user_id, target_ids):
+    """Добавляет цели в коллекцию пользователя одним запросом.
+
+    INSERT ... SELECT ... ON CONFLICT DO NOTHING RETURNING: уже добавленные
+    и несуществующие цели пропускаются без ошибок и повторных запросов.
+    Возвращает id действительно добавленных целей.
+    """
+    if not target_ids:
+        return []
+    placeholders = ", ".join(["%s"] * len(target_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "INSERT INTO {table} ({user}, {target}) "
+            "SELECT %s, {target_pk} FROM {target_table} "
+            "WHERE {target_pk} IN ({placeholders}) "
+            "ON CONFLICT DO NOTHING RETURNING {target}".format(
+                placeholders=placeholders, **_columns(collection)
+            ),
+            [user_id, *target_ids],
+        )
+        added = [row[0] for row in cursor.fetchall()]
+    if added:
+        COLLECTIONS[collection][1](user_id, added, 1)
+    return added
+
+
+def remove_from_collection(collection, user_id, target_ids):
+    """Удаляет цели из коллекции пользователя одним DELETE ... RETURNING.
+
+    Возвращает id действительно удалённых целей.
+    """
+    if not target_ids:
+        return []
+    placeholders = ", ".join(["%s"] * len(target_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "DELETE FROM {table} WHERE {user} = %s AND {target} IN ({placeholders}) "
+            "RETURNING {target}".format(placeholders=placeholders, **_columns(collection)),
+            [user_id, *target_ids],
+        )
+        removed = [row[0] for row in cursor.fetchall()]
+    if removed:
+        COLLECTIONS[collection][1](user_id, removed, -1)
+    return removed
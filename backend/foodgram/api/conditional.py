@@ -0,0 +1,41 @@
+import hashlib
+
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import quote_etag
+
+from recipes.cache import get_versions
+
+
+class ConditionalGetMixin:
+    """Условные GET-запросы (ETag) для list и retrieve.
+
+    ETag строится из версий областей данных, которые возвращает
+    ``get_version_scopes()``, без обращения к БД: ответ 304 отдаётся
+    до фильтрации, пагинации и сериализации. Last-Modified не
+    отправляется: с точностью до секунды он не различил бы две записи
+    в одну секунду.
+    """
+
+    def get_version_scopes(self):
+        raise NotImplementedError
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional(super().retrieve, request, *args, **kwargs)
+
+    def conditional(self, handler, request, *args, **kwargs):
+        versions = get_versions(*self.get_version_scopes())
+        etag = quote_etag(hashlib.sha1(repr((
+            request.get_full_path(), request.user.id, sorted(versions.items())
+        )).encode()).hexdigest())
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+        # Ответ со своим (например, строгим по содержимому) ETag его сохраняет
+        response.setdefault("ETag", etag)
+        patch_vary_headers(response, ("Authorization",))
+        return response
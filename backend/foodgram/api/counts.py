@@ -0,0 +1,60 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.db import connections
+
+from recipes.cache import get_versions
+
+COUNT_KEY = "foodgram:counts:{}"
+
+
+class CountStrategy:
+    """Подсчёт числа объектов для пагинации.
+
+    Значение кэшируется по SQL запроса (в нём уже есть фильтры и, при
+    необходимости, id пользователя) и версиям областей данных, которые
+    перечисляет представление в ``get_count_scopes()``. Изменение данных
+    меняет версию, и старое значение просто перестаёт читаться.
+    Для нефильтрованных списков больших таблиц вместо COUNT(*) берётся
+    оценка планировщика PostgreSQL. После подсчёта ``exact`` показывает,
+    точное ли значение.
+    """
+
+    def __init__(self, scopes):
+        self.scopes = scopes
+        self.exact = True
+
+    def count(self, queryset):
+        if queryset.query.is_empty():
+            return 0
+        try:
+            sql, params = queryset.query.sql_with_params()
+        except EmptyResultSet:
+            return 0
+        key = COUNT_KEY.format(hashlib.sha1(
+            repr((sql, params, sorted(get_versions(*self.scopes).items()))).encode()
+        ).hexdigest())
+        cached = cache.get(key)
+        if cached is None:
+            estimated = self.estimate(queryset)
+            cached = (queryset.count(), True) if estimated is None else (estimated, False)
+            cache.set(key, cached, settings.FOODGRAM_COUNT_CACHE_TIMEOUT)
+        count, self.exact = cached
+        return count
+
+    def estimate(self, queryset):
+        """Оценка pg_class.reltuples для нефильтрованного списка, если она велика."""
+        connection = connections[queryset.db]
+        if connection.vendor != "postgresql" or queryset.query.where:
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                [queryset.model._meta.db_table],
+            )
+            row = cursor.fetchone()
+        if row is None or row[0] < settings.FOODGRAM_ESTIMATED_COUNT_THRESHOLD:
+            return None
+        return row[0]
@@ -0,0 +1,88 @@
+import csv
+import io
+import json
+
+from django.utils import timezone
+from django.utils.text import capfirst
+
+from recipes.models import Recipe, ShoppingListItem
+
+
+class ShoppingListExport:
+    """Список покупок пользователя, выдаваемый частями.
+
+    Продукты читаются из готового агрегата ShoppingListItem, рецепты -
+    одним запросом с автором; строки ответа формируются по мере чтения.
+    """
+    content_types = {
+        "txt": "text/plain; charset=utf-8",
+        "csv": "text/csv; charset=utf-8",
+        "json": "application/json",
+    }
+
+    def __init__(self, user):
+        self.user = user
+        self.date = timezone.localtime()
+
+    def products(self):
+        return (
+            ShoppingListItem.objects
+            .filter(user=self.user)
+            .values_list("ingredient__name", "ingredient__measurement_unit", "amount")
+            .order_by("ingredient__name")
+            .iterator()
+        )
+
+    def recipes(self):
+        return (
+            Recipe.objects
+            .filter(shopping_carts__user=self.user)
+            .values_list("name", "author__username")
+            .iterator()
+        )
+
+    def render(self, format):
+        return getattr(self, f"render_{format}")()
+
+    def render_txt(self):
+        yield f"Список покупок от {self.date:%d.%m.%Y (%H:%M)}\n\nПродукты:\n"
+        empty = True
+        for number, (name, unit, amount) in enumerate(self.products(), start=1):
+            empty = False
+            yield f"{number}. {capfirst(name)} — {amount} {unit}\n"
+        if empty:
+            yield "Нет продуктов в корзине"
+        yield "\nРецепты:\n"
+        empty = True
+        for name, username in self.recipes():
+            empty = False
+            yield f"- {name} (@{username})\n"
+        if empty:
+            yield "Нет рецептов в корзине"
+
+    def render_csv(self):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(("name", "amount", "measurement_unit"))
+        for name, unit, amount in self.products():
+            writer.writerow((name, amount, unit))
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue()
+
+    def render_json(self):
+        yield '{"date": %s, "products": [' % json.dumps(self.date.isoformat())
+        separator = ""
+        for name, unit, amount in self.products():
+            yield separator + json.dumps(
+                {"name": name, "amount": amount, "measurement_unit": unit},
+                ensure_ascii=False,
+            )
+            separator = ", "
+        yield '], "recipes": ['
+        separator = ""
+        for name, username in self.recipes():
+            yield separator + json.dumps({"name": name, "author": username}, ensure_ascii=False)
+            separator = ", "
+        yield "]}"
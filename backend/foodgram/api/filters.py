@@ -1,5 +1,6 @@
 from django_filters import FilterSet, NumberFilter, TypedChoiceFilter
 from recipes.models import Recipe
+from recipes.search import search_recipes
 from rest_framework.filters import SearchFilter
 
 BOOLEAN_PARAMS = {
@@ -34,3 +35,13 @@ class RecipeFilter(FilterSet):
 
 class NameSearchFilter(SearchFilter):
     search_param = "name"
+
+
+class RecipeSearchFilter(SearchFilter):
+    """Поиск рецептов по ?search= в названии, описании и ингредиентах."""
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, "").strip()
+        if not query:
+            return queryset
+        return search_recipes(queryset, query)
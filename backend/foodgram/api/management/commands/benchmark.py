@@ -0,0 +1,411 @@
+import base64
+import io
+import json
+import os
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+import tracemalloc
+from itertools import count
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.http import Http404, HttpResponseBase
+from django.shortcuts import redirect
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.authtoken.models import Token
+
+from api.pagination import LimitPageNumberPagination
+from recipes.shortlinks import encode
+from recipes.models import Ingredient, Recipe
+from recipes.views import redirect_to_recipe
+
+User = get_user_model()
+
+# Пользователи, созданные generate_dataset
+GENERATED_USERNAME = r'^gen[0-9]+_'
+IMPORT_BENCHMARK = 'import: ingredients, existing'
+
+
+class Benchmark:
+    """Сценарий: execute() измеряется, cleanup(результат) - нет."""
+
+    def __init__(self, name, run, cleanup=None, concurrent=False):
+        self.name = name
+        self.run = run
+        self.cleanup = cleanup
+        # Запросы из других потоков: замер вне откатываемой транзакции
+        self.concurrent = concurrent
+
+    def __call__(self):
+        result = self.execute()
+        if self.cleanup is not None:
+            self.cleanup(result)
+
+    def execute(self):
+        # Замеры идут в откатываемой транзакции, поэтому on_commit-обработчики
+        # (поиск, кэш, обработка изображений) выполняются сразу и входят в замер
+        with TestCase.captureOnCommitCallbacks(execute=True):
+            return self.run()
+
+
+def redirect_with_query(request, recipe_id):
+    """Переадресация по короткой ссылке с запросом EXISTS на каждый переход."""
+    if not Recipe.objects.filter(pk=recipe_id).exists():
+        raise Http404
+    return redirect(f"/recipes/{recipe_id}/")
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark hot API paths in-process (wall time, queries, peak allocations); '
+        'save the results as a JSON baseline or compare them with one. Changes are '
+        'rolled back and uploads go to a temporary MEDIA_ROOT; runs only on a test or '
+        'generate_dataset database unless --allow-write is given'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=20, help='Measured runs per benchmark')
+        parser.add_argument('--warmup', type=int, default=2, help='Unmeasured runs first')
+        parser.add_argument(
+            '--filter', default='', help='Run only benchmarks whose name contains this text'
+        )
+        parser.add_argument(
+            '--user', type=int,
+            help='User id to make requests as (by default - the most subscribed user)'
+        )
+        parser.add_argument(
+            '--ingredients-file',
+            default=str(settings.BASE_DIR / 'data' / 'db_ingredients.json'),
+            help='Ingredients file for the import benchmark'
+        )
+        parser.add_argument(
+            '--allow-write', action='store_true',
+            help='Run on a database with real users (the concurrent benchmark commits '
+                 'its paired add/remove requests)'
+        )
+        parser.add_argument('--save', help='Write the results to this JSON baseline file')
+        parser.add_argument('--compare', help='Compare the results with this JSON baseline')
+        parser.add_argument(
+            '--tolerance', type=float, default=0.25,
+            help='Allowed relative growth of time and peak memory (0.25 = 25%%)'
+        )
+
+    def handle(self, *args, **options):
+        if not options['allow_write'] and not self.dedicated_database():
+            raise CommandError(
+                'The database has users not created by generate_dataset: run the benchmark '
+                'on a dedicated database or pass --allow-write'
+            )
+        ingredients_file = options['ingredients_file']
+        if options['filter'] in IMPORT_BENCHMARK and not os.path.isfile(ingredients_file):
+            raise CommandError(
+                f"Ingredients file {ingredients_file} not found: pass --ingredients-file "
+                f"or exclude the import benchmark with --filter"
+            )
+        media_root = tempfile.mkdtemp(prefix='benchmark-media-')
+        try:
+            # Обработка изображений - сразу, в той же транзакции: фоновые
+            # потоки не видят неподтверждённых строк и пережили бы MEDIA_ROOT
+            with override_settings(MEDIA_ROOT=media_root, FOODGRAM_IMAGE_WORKERS=0):
+                results = self.run_benchmarks(options)
+        finally:
+            shutil.rmtree(media_root, ignore_errors=True)
+
+        meta = {
+            'vendor': connection.vendor,
+            'users': User.objects.count(),
+            'recipes': Recipe.objects.count(),
+            'repeat': options['repeat'],
+        }
+        if options['save']:
+            with open(options['save'], 'w', encoding='utf-8') as file:
+                json.dump({'meta': meta, 'results': results}, file, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Baseline saved to {options['save']}"))
+        if options['compare']:
+            self.compare(options['compare'], meta, results, options['tolerance'])
+
+    @staticmethod
+    def dedicated_database():
+        """Тестовая база или база только с данными generate_dataset."""
+        name = os.path.basename(str(connection.settings_dict['NAME']))
+        return (
+            name.startswith('test')
+            or not User.objects.exclude(username__regex=GENERATED_USERNAME).exists()
+        )
+
+    def run_benchmarks(self, options):
+        self.prepare(options['user'])
+        results = {}
+        selected = [
+            benchmark for benchmark in self.benchmarks(options['ingredients_file'])
+            if options['filter'] in benchmark.name
+        ]
+        try:
+            with transaction.atomic():
+                # Рецепт для замеров обновления и все изменения замеров откатываются
+                self.edited_recipe = self.request(
+                    'post', '/api/recipes/', self.recipe_payload(self.ingredient_ids[:50], 1), 201
+                ).json()['id']
+                for benchmark in selected:
+                    if benchmark.concurrent:
+                        continue
+                    results[benchmark.name] = self.measure(
+                        benchmark, max(options['repeat'], 1), options['warmup']
+                    )
+                    self.print_result(benchmark.name, results[benchmark.name])
+                transaction.set_rollback(True)
+            # Параллельным потокам нужны подтверждённые данные, поэтому эти
+            # замеры - после отката; каждое добавление в них отменяется удалением
+            for benchmark in selected:
+                if benchmark.concurrent:
+                    results[benchmark.name] = self.measure(
+                        benchmark, max(options['repeat'], 1), options['warmup']
+                    )
+                    self.print_result(benchmark.name, results[benchmark.name])
+        finally:
+            if self.token_created:
+                Token.objects.filter(user=self.user).delete()
+        return results
+
+    def prepare(self, user_id):
+        """Пользователь, рецепты и параметры запросов из текущих данных."""
+        users = User.objects.filter(pk=user_id) if user_id else User.objects.order_by(
+            '-subscriptions_count', 'id'
+        )
+        self.user = users.first()
+        recipes = Recipe.objects.order_by('-favorites_count', 'id')
+        self.recipe = recipes.first()
+        if self.user is None or self.recipe is None:
+            raise CommandError('No users or recipes: run generate_dataset first')
+        # Токен нужен и параллельным потокам, поэтому создаётся вне транзакции
+        token, self.token_created = Token.objects.get_or_create(user=self.user)
+        self.client = Client(HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.other_recipes = list(
+            recipes.exclude(favorites__user=self.user).values_list('id', flat=True)[:50]
+        )
+        self.ingredient_ids = list(Ingredient.objects.order_by('id').values_list('id', flat=True))
+        self.ingredient_prefix = Ingredient.objects.order_by('id').first().name[:5]
+        self.search_word = self.recipe.name.split()[0]
+
+        total = Recipe.objects.count()
+        page_size = LimitPageNumberPagination.page_size
+        self.last_page = max((total + page_size - 1) // page_size, 1)
+        position = Recipe.objects.order_by('-publish_date', '-id').values_list(
+            'publish_date', 'id'
+        )[max(total - 2 * page_size, 0)]
+        token = json.dumps({'p': list(position), 'r': 0}, default=str)
+        self.deep_cursor = base64.urlsafe_b64encode(token.encode()).decode().rstrip('=')
+
+        image = io.BytesIO()
+        Image.new('RGB', (8, 8), (200, 10, 10)).save(image, 'PNG')
+        self.image = 'data:image/png;base64,' + base64.b64encode(image.getvalue()).decode()
+        self.edits = count()
+
+    def recipe_payload(self, ingredient_ids, amount):
+        return {
+            'name': 'Benchmark', 'text': 'Benchmark', 'cooking_time': 10, 'image': self.image,
+            'ingredients': [
+                {'id': ingredient_id, 'amount': amount} for ingredient_id in ingredient_ids
+            ],
+        }
+
+    def request(self, method, url, data=None, status=200, client=None):
+        response = getattr(client or self.client, method)(
+            url, data=json.dumps(data) if data is not None else None,
+            content_type='application/json',
+        )
+        if response.streaming:
+            b''.join(response.streaming_content)
+        if response.status_code != status:
+            raise CommandError(
+                f"{method.upper()} {url}: {response.status_code} instead of {status}: "
+                f"{response.content[:300]!r}"
+            )
+        return response
+
+    def get(self, url, status=200):
+        return lambda: self.request('get', url, status=status)
+
+    def benchmarks(self, ingredients_file):
+        recipe_id = self.recipe.id
+        favorite_id = self.other_recipes[0] if self.other_recipes else recipe_id
+        factory_request = RequestFactory().get(f'/s/{recipe_id}/')
+        benchmarks = [
+            Benchmark('recipes: list', self.get('/api/recipes/')),
+            Benchmark('recipes: list, deep page', self.get(f'/api/recipes/?page={self.last_page}')),
+            Benchmark(
+                'recipes: list, deep cursor', self.get(f'/api/recipes/?cursor={self.deep_cursor}')
+            ),
+            Benchmark('recipes: detail', self.get(f'/api/recipes/{recipe_id}/')),
+            Benchmark(
+                'recipes: filter by author',
+                self.get(f'/api/recipes/?author={self.recipe.author_id}'),
+            ),
+            Benchmark('recipes: is_favorited', self.get('/api/recipes/?is_favorited=1')),
+            Benchmark(
+                'recipes: is_in_shopping_cart', self.get('/api/recipes/?is_in_shopping_cart=1')
+            ),
+            Benchmark('recipes: search', self.get(f'/api/recipes/?search={self.search_word}')),
+            Benchmark(
+                'users: subscriptions, recipes_limit=3',
+                self.get('/api/users/subscriptions/?recipes_limit=3'),
+            ),
+            Benchmark('ingredients: catalogue', self.get('/api/ingredients/')),
+            Benchmark('ingredients: keystroke search', lambda: [
+                self.request('get', f'/api/ingredients/?name={self.ingredient_prefix[:length]}')
+                for length in range(1, len(self.ingredient_prefix) + 1)
+            ]),
+        ]
+        benchmarks.extend(
+            Benchmark(
+                f'shopping cart: download {format}',
+                self.get(f'/api/recipes/download_shopping_cart/?format={format}'),
+            )
+            for format in ('txt', 'csv', 'json')
+        )
+        benchmarks += [
+            Benchmark(
+                'recipes: create',
+                lambda: self.request(
+                    'post', '/api/recipes/', self.recipe_payload(self.ingredient_ids[:10], 5), 201
+                ).json()['id'],
+                lambda created_id: Recipe.objects.filter(pk=created_id).delete(),
+            ),
+            Benchmark('recipes: update 50 ingredients', lambda: self.request(
+                'patch', f'/api/recipes/{self.edited_recipe}/',
+                self.recipe_payload(self.ingredient_ids[:50], next(self.edits) % 2 + 2),
+            )),
+            Benchmark('favorite: add and remove', lambda: (
+                self.request('post', f'/api/recipes/{favorite_id}/favorite/', status=201),
+                self.request('delete', f'/api/recipes/{favorite_id}/favorite/', status=204),
+            )),
+            Benchmark('favorite: batch add and remove 50', lambda: (
+                self.request('post', '/api/recipes/favorite/batch/', {'ids': self.other_recipes}),
+                self.request('delete', '/api/recipes/favorite/batch/', {'ids': self.other_recipes}),
+            )),
+            Benchmark(
+                'shortlink: /r/<code>/ request', self.get(f'/r/{encode(recipe_id)}/', status=302)
+            ),
+            Benchmark(
+                'shortlink: view, bitmap', lambda: redirect_to_recipe(factory_request, recipe_id)
+            ),
+            Benchmark(
+                'shortlink: view, EXISTS query',
+                lambda: redirect_with_query(factory_request, recipe_id),
+            ),
+        ]
+        # Разбор файла и вставка с пропуском уже загруженных ингредиентов
+        benchmarks.append(Benchmark(IMPORT_BENCHMARK, lambda: call_command(
+            'import_ingredients', ingredients_file,
+            stdout=io.StringIO(), stderr=io.StringIO(),
+        )))
+        if connection.vendor == 'postgresql':
+            # Одновременные запросы к одной коллекции: в SQLite запись
+            # блокирует всю базу, поэтому замер только для PostgreSQL
+            benchmarks.append(Benchmark(
+                'favorite: 8 concurrent add and remove', self.concurrent_toggles,
+                concurrent=True,
+            ))
+        return benchmarks
+
+    def concurrent_toggles(self, threads=8):
+        errors = []
+
+        def toggle(recipe_id):
+            try:
+                client = Client(HTTP_AUTHORIZATION=self.client.defaults['HTTP_AUTHORIZATION'])
+                self.request('post', f'/api/recipes/{recipe_id}/favorite/', None, 201, client)
+                self.request('delete', f'/api/recipes/{recipe_id}/favorite/', None, 204, client)
+            except CommandError as error:
+                errors.append(error)
+            finally:
+                connection.close()
+
+        workers = [
+            threading.Thread(target=toggle, args=(recipe_id,))
+            for recipe_id in self.other_recipes[:threads]
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        if errors:
+            raise errors[0]
+
+    def measure(self, benchmark, repeat, warmup):
+        for _ in range(warmup):
+            benchmark()
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = benchmark.execute()
+            times.append(time.perf_counter() - start)
+            if benchmark.cleanup is not None:
+                benchmark.cleanup(result)
+        # Подсчёт запросов и трассировка памяти замедляют код, поэтому
+        # для них - отдельный прогон
+        tracemalloc.start()
+        try:
+            with CaptureQueriesContext(connection) as queries:
+                result = benchmark.execute()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        if benchmark.cleanup is not None:
+            benchmark.cleanup(result)
+        measured = {
+            'time_ms': round(statistics.median(times) * 1000, 3),
+            'min_ms': round(min(times) * 1000, 3),
+            'queries': len(queries),
+            'peak_kb': round(peak / 1024, 1),
+        }
+        # Попадания в кэш представлений рецептов (после прогрева)
+        if isinstance(result, HttpResponseBase) and result.has_header('X-Recipe-Cache'):
+            measured['recipe_cache'] = result['X-Recipe-Cache']
+        return measured
+
+    def print_result(self, name, result):
+        self.stdout.write(
+            f"{name:<42} {result['time_ms']:>10.2f} ms (min {result['min_ms']:.2f}, "
+            f"{1000 / max(result['time_ms'], 0.001):,.0f}/s)  "
+            f"{result['queries']:>3} queries  {result['peak_kb']:>9.1f} KiB peak"
+            + (f"  recipe cache: {result['recipe_cache']}" if 'recipe_cache' in result else '')
+        )
+
+    def compare(self, path, meta, results, tolerance):
+        try:
+            with open(path, encoding='utf-8') as file:
+                baseline = json.load(file)
+        except (OSError, ValueError) as error:
+            raise CommandError(f"Can't read baseline {path}: {error}")
+        if baseline.get('meta', {}) | {'repeat': meta['repeat']} != meta:
+            self.stderr.write(
+                f"Warning: baseline was recorded on different data: {baseline.get('meta')}"
+            )
+        regressions = 0
+        for name, result in results.items():
+            base = baseline.get('results', {}).get(name)
+            if base is None:
+                self.stdout.write(f"{name}: no baseline")
+                continue
+            problems = []
+            if result['time_ms'] > base['time_ms'] * (1 + tolerance):
+                problems.append(f"time {base['time_ms']:.2f} -> {result['time_ms']:.2f} ms")
+            if result['queries'] > base['queries']:
+                problems.append(f"queries {base['queries']} -> {result['queries']}")
+            if result['peak_kb'] > base['peak_kb'] * (1 + tolerance):
+                problems.append(f"peak {base['peak_kb']} -> {result['peak_kb']} KiB")
+            if problems:
+                regressions += 1
+                self.stdout.write(self.style.ERROR(f"REGRESSION {name}: {'; '.join(problems)}"))
+        if regressions:
+            raise CommandError(f"{regressions} benchmarks regressed beyond the tolerance")
+        self.stdout.write(self.style.SUCCESS('No regressions against the baseline'))
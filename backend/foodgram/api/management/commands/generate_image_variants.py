@@ -0,0 +1,109 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.utils import timezone
+
+from recipes.images import (
+    IMAGE_FIELDS, delete_variants, image_changed, make_variants, process_image, update_image
+)
+from users.models import ImageStatus
+
+
+class Command(BaseCommand):
+    help = (
+        'Generate missing image variants for existing recipe images and avatars '
+        'and reprocess uploads whose background job was lost'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=multiprocessing.cpu_count(),
+            help='Number of worker processes'
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Regenerate variants that already exist'
+        )
+        parser.add_argument(
+            '--pending-age',
+            type=int,
+            default=10,
+            help='Reprocess uploads still pending after this many minutes'
+        )
+
+    def handle(self, *args, **options):
+        self.process_stale(timedelta(minutes=options['pending_age']))
+        jobs = []
+        for model, field in IMAGE_FIELDS:
+            images = model.objects.exclude(**{field: ''}).exclude(
+                **{f'{field}__isnull': True}
+            ).exclude(**{f'{field}_status': ImageStatus.PENDING})
+            if not options['force']:
+                images = images.filter(**{f'{field}_variants': {}})
+            jobs.extend(
+                (model, field, pk, name, variants)
+                for pk, name, variants in images.values_list('pk', field, f'{field}_variants')
+            )
+        if not jobs:
+            self.stdout.write(self.style.SUCCESS('All images already have variants'))
+            return
+        # Процессы только читают и пишут файлы; соединения с БД не должны
+        # достаться им по наследству при fork
+        connections.close_all()
+        done = failed = 0
+        with ProcessPoolExecutor(max_workers=max(options['workers'], 1)) as pool:
+            futures = {
+                pool.submit(make_variants, job[3], job[0]._meta.get_field(job[1]).upload_to): job
+                for job in jobs
+            }
+            for future in as_completed(futures):
+                model, field, pk, name, old_variants = futures[future]
+                try:
+                    variants = future.result()
+                except Exception as error:
+                    failed += 1
+                    self.stderr.write(f"{model._meta.label} {pk} ({name}): {error}")
+                    continue
+                # Изображение могли заменить за время работы команды
+                if update_image(model, pk, field, name, **{f'{field}_variants': variants}):
+                    delete_variants(old_variants)
+                    image_changed(model, pk)
+                else:
+                    delete_variants(variants)
+                done += 1
+                if done % 100 == 0:
+                    self.stdout.write(f"{done}/{len(jobs)}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated variants for {done} images, failed: {failed}"
+        ))
+
+    def process_stale(self, age):
+        """Обрабатывает загрузки, задача которых пропала вместе с процессом.
+
+        Очередь recipes.images живёт в памяти процесса gunicorn: при его
+        перезапуске строки остаются в состоянии pending. Загрузки моложе
+        age, возможно, ещё обрабатываются и пропускаются.
+        """
+        deadline = timezone.now() - age
+        stale = 0
+        for model, field in IMAGE_FIELDS:
+            storage = model._meta.get_field(field).storage
+            pending = model.objects.filter(**{f'{field}_status': ImageStatus.PENDING}).exclude(
+                **{field: ''}
+            ).exclude(**{f'{field}__isnull': True}).values_list('pk', field)
+            for pk, name in pending:
+                try:
+                    if storage.get_modified_time(name) > deadline:
+                        continue
+                except OSError:
+                    pass  # файла нет - process_image отметит ошибку
+                process_image(model._meta.label, pk, field, name)
+                stale += 1
+        if stale:
+            self.stdout.write(f"Reprocessed {stale} pending images")
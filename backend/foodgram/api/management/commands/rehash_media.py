@@ -0,0 +1,118 @@
+import posixpath
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from api.storage import LOCK_NAME, is_hashed
+from recipes.images import IMAGE_FIELDS, image_changed, update_image
+
+
+def in_place(name, directory):
+    """Имя по содержимому лежит в <directory>/<2 символа хэша>/."""
+    return is_hashed(name) and (
+        posixpath.dirname(posixpath.dirname(name)) == directory.rstrip('/')
+    )
+
+
+def walk(directory):
+    """Все файлы хранилища внутри directory."""
+    if not default_storage.exists(directory):
+        return
+    directories, files = default_storage.listdir(directory)
+    for name in files:
+        yield posixpath.join(directory, name)
+    for subdirectory in directories:
+        yield from walk(posixpath.join(directory, subdirectory))
+
+
+class Command(BaseCommand):
+    help = (
+        'Rename existing recipe images and avatars to content-hash names '
+        'and optionally delete unreferenced files'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report how many files would be renamed'
+        )
+        parser.add_argument(
+            '--prune',
+            action='store_true',
+            help='Delete content-hash files that no row references '
+                 '(older than FOODGRAM_MEDIA_GRACE_PERIOD)'
+        )
+
+    def handle(self, *args, **options):
+        renamed = {}  # старое имя -> имя по содержимому
+        missing = 0
+
+        def rehash(name, directory):
+            nonlocal missing
+            if not name or in_place(name, directory):
+                return name
+            if name not in renamed:
+                if not default_storage.exists(name):
+                    missing += 1
+                    self.stderr.write(f"Missing file: {name}")
+                    return name
+                if options['dry_run']:
+                    renamed[name] = name
+                else:
+                    # Каталог - из upload_to поля: ранние версии сохраняли
+                    # уже хэшированное имя, и каталоги хэша вкладывались
+                    target = posixpath.join(directory, posixpath.basename(name))
+                    with default_storage.open(name) as content:
+                        renamed[name] = default_storage.save(target, content)
+            return renamed[name]
+
+        updated = 0
+        for model, field in IMAGE_FIELDS:
+            directory = model._meta.get_field(field).upload_to
+            variants_directory = posixpath.join(directory, 'variants')
+            variants_field = f'{field}_variants'
+            for pk, name, variants in model.objects.exclude(**{field: ''}).values_list(
+                'pk', field, variants_field
+            ).iterator():
+                new_name = rehash(name, directory)
+                new_variants = {
+                    key: rehash(value, variants_directory) for key, value in variants.items()
+                }
+                if options['dry_run'] or (new_name, new_variants) == (name, variants):
+                    continue
+                if update_image(
+                    model, pk, field, name, **{field: new_name, variants_field: new_variants}
+                ):
+                    image_changed(model, pk)
+                    updated += 1
+
+        if options['dry_run']:
+            self.stdout.write(f"Files to rename: {len(renamed)}, missing: {missing}")
+            return
+        # Старые файлы больше ни на что не ссылаются; delete() проверит это
+        # ещё раз и оставит файлы, на которые ссылаются другие записи
+        for name in renamed:
+            default_storage.delete(name)
+        self.stdout.write(self.style.SUCCESS(
+            f"Renamed {len(renamed)} files, updated {updated} rows, missing: {missing}"
+        ))
+        if options['prune']:
+            self.prune()
+
+    def prune(self):
+        referenced = set()
+        for model, field in IMAGE_FIELDS:
+            for name, variants in model.objects.values_list(field, f'{field}_variants'):
+                referenced.add(name)
+                referenced.update(variants.values())
+        deleted = 0
+        for model, field in IMAGE_FIELDS:
+            for name in walk(model._meta.get_field(field).upload_to.rstrip('/')):
+                if name in referenced or not is_hashed(name) or name.endswith(LOCK_NAME):
+                    continue
+                # delete() под блокировкой ещё раз проверяет ссылки и
+                # пропускает файлы моложе FOODGRAM_MEDIA_GRACE_PERIOD
+                default_storage.delete(name)
+                deleted += not default_storage.exists(name)
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} unreferenced files"))
@@ -1,6 +1,237 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import json
+from functools import cached_property, partial
+from operator import attrgetter
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.paginator import EmptyPage, Page, PageNotAnInteger, Paginator
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from api.counts import CountStrategy
+
+
+class EstimatedPage(Page):
+    """Страница при оценочном count: есть ли следующая, известно по выборке."""
+
+    def __init__(self, object_list, number, paginator, has_next):
+        super().__init__(object_list, number, paginator)
+        self._has_next = has_next
+
+    def has_next(self):
+        return self._has_next
+
+    def end_index(self):
+        return self.start_index() + len(self) - 1 if self.object_list else 0
+
+
+class CountStrategyPaginator(Paginator):
+    """Paginator, делегирующий подсчёт объектов стратегии CountStrategy.
+
+    Оценка числа объектов может оказаться меньше настоящего, поэтому при
+    неточном count номер страницы с ним не сравнивается: страница
+    выбирается с запасом в один объект, и конец списка - это пустая
+    страница или страница без следующей.
+    """
+
+    def __init__(self, object_list, per_page, count_strategy, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.count_strategy = count_strategy
+
+    @cached_property
+    def count(self):
+        return self.count_strategy.count(self.object_list)
+
+    def validate_number(self, number):
+        # Обращение к count заполняет count_strategy.exact
+        if self.count is not None and self.count_strategy.exact:
+            return super().validate_number(number)
+        try:
+            if isinstance(number, float) and not number.is_integer():
+                raise ValueError
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger(self.error_messages["invalid_page"])
+        if number < 1:
+            raise EmptyPage(self.error_messages["min_page"])
+        return number
+
+    def page(self, number):
+        number = self.validate_number(number)
+        if self.count_strategy.exact:
+            return super().page(number)
+        bottom = (number - 1) * self.per_page
+        object_list = list(self.object_list[bottom:bottom + self.per_page + 1])
+        if not object_list and number > 1:
+            raise EmptyPage(self.error_messages["no_results"])
+        return EstimatedPage(
+            object_list[:self.per_page], number, self,
+            has_next=len(object_list) > self.per_page,
+        )
 
 
 class LimitPageNumberPagination(PageNumberPagination):
+    """Постраничная пагинация с параметром limit.
+
+    Если представление определяет ``get_count_scopes()``, общее число
+    объектов считается через CountStrategy, а поле ``count_exact`` ответа
+    сообщает, точное ли оно или оценочное.
+    """
     page_size = 6
     page_size_query_param = "limit"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count_strategy = None
+        if hasattr(view, "get_count_scopes"):
+            self.count_strategy = CountStrategy(view.get_count_scopes())
+            self.django_paginator_class = partial(
+                CountStrategyPaginator, count_strategy=self.count_strategy
+            )
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        if self.count_strategy is not None:
+            response.data["count_exact"] = self.count_strategy.exact
+        return response
+
+
+class KeysetPagination(BasePagination):
+    """Курсорная пагинация по составному ключу.
+
+    Ключ задаётся атрибутом представления ``keyset_ordering``
+    (по умолчанию - дата публикации и id). Вместо OFFSET страница
+    выбирается условием "строго после ключа", поэтому глубина страницы
+    и размер таблицы не влияют на стоимость запроса, а COUNT(*) не нужен.
+    """
+    page_size = LimitPageNumberPagination.page_size
+    page_size_query_param = "limit"
+    cursor_query_param = "cursor"
+    ordering = ("-publish_date", "-id")
+    invalid_cursor_message = "Некорректный курсор."
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.ordering = tuple(getattr(view, "keyset_ordering", self.ordering))
+        self.fields = [field.lstrip("-") for field in self.ordering]
+        self.page_size = self.get_page_size(request)
+        position, reverse = self.decode_cursor(request, queryset)
+
+        ordering = self.ordering if not reverse else [self._flip(f) for f in self.ordering]
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(self._after(position, ordering))
+        page = list(queryset[:self.page_size + 1])
+        has_more = len(page) > self.page_size
+        page = page[:self.page_size]
+        if reverse:
+            page.reverse()
+
+        self.has_next = has_more if not reverse else True
+        self.has_previous = position is not None and (has_more if reverse else True)
+        self.page = page
+        return page
+
+    def get_paginated_response(self, data):
+        return Response({
+            "next": self.get_next_link(),
+            "previous": self.get_previous_link(),
+            "results": data,
+        })
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return page_size if page_size > 0 else self.page_size
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def encode_cursor(self, item, reverse):
+        position = [
+            item[field] if isinstance(item, dict) else attrgetter(field)(item)
+            for field in self.fields
+        ]
+        # default=str сохраняет микросекунды дат, в отличие от DjangoJSONEncoder
+        token = json.dumps({"p": position, "r": int(reverse)}, default=str)
+        cursor = base64.urlsafe_b64encode(token.encode()).decode().rstrip("=")
+        return replace_query_param(
+            self.request.build_absolute_uri(), self.cursor_query_param, cursor
+        )
+
+    def decode_cursor(self, request, queryset):
+        """Возвращает позицию (значения ключа) и направление обхода."""
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None, False
+        try:
+            token = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+            position = [
+                self._to_python(queryset, field, value)
+                for field, value in zip(self.fields, token["p"], strict=True)
+            ]
+            return position, bool(token["r"])
+        except (TypeError, ValueError, KeyError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    @staticmethod
+    def _to_python(queryset, field, value):
+        """Значение ключа из курсора по типу поля модели или аннотации."""
+        if value is None:
+            raise ValueError("Empty cursor value")
+        try:
+            output_field = queryset.model._meta.get_field(field)
+        except FieldDoesNotExist:
+            output_field = queryset.query.annotations[field].output_field
+        # to_python отклоняет значения не того типа (например, словарь
+        # вместо числа), и курсор считается некорректным
+        return output_field.to_python(value)
+
+    @staticmethod
+    def _flip(field):
+        return field[1:] if field.startswith("-") else f"-{field}"
+
+    def _after(self, position, ordering):
+        """Условие (a, b, ...) "после" позиции с учётом направления каждого поля."""
+        condition = Q()
+        equal = Q()
+        for field, value in zip(ordering, position):
+            name = field.lstrip("-")
+            lookup = "lt" if field.startswith("-") else "gt"
+            condition |= equal & Q(**{f"{name}__{lookup}": value})
+            equal &= Q(**{name: value})
+        return condition
+
+
+class OptionalCursorPagination(BasePagination):
+    """Постраничная пагинация с переключением на курсорную.
+
+    Курсорный режим включается параметром ``?pagination=cursor``;
+    ссылки next/previous в этом режиме содержат непрозрачный ``cursor``.
+    """
+    mode_query_param = "pagination"
+    page_number_class = LimitPageNumberPagination
+    cursor_class = KeysetPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        cursor_mode = (
+            request.query_params.get(self.mode_query_param) == "cursor"
+            or self.cursor_class.cursor_query_param in request.query_params
+        )
+        self.delegate = self.cursor_class() if cursor_mode else self.page_number_class()
+        return self.delegate.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return self.delegate.get_paginated_response(data)
@@ -0,0 +1,127 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.http import Http404
+from rest_framework.response import Response
+
+from api.serializers.image import variants_requested
+from api.serializers.recipes.recipe import RecipeReadOnlySerializer
+from api.viewer import get_viewer
+from recipes.cache import get_versions, recipe_scope
+from recipes.models import Recipe
+
+REPRESENTATION_KEY = "foodgram:recipe:{id}:{version}:{base_url}:{variants:d}"
+
+
+class RecipeRepresentationCache:
+    """Кэш представлений RecipeReadOnlySerializer, общих для всех пользователей.
+
+    В кэше лежит представление с обнулёнными флагами is_favorited,
+    is_in_shopping_cart и author.is_subscribed; при выдаче они
+    подставляются из снимка связей текущего пользователя (api.viewer).
+    Ключ включает версию рецепта, поэтому изменения рецепта, его
+    ингредиентов или автора делают старую запись недостижимой. Число
+    попаданий и промахов запроса отдаётся в заголовке X-Recipe-Cache.
+    """
+
+    def __init__(self, request):
+        self.request = request
+        self.hits = 0
+        self.misses = 0
+
+    def represent(self, recipe_ids, queryset):
+        """Возвращает представления рецептов в порядке recipe_ids.
+
+        Рецепты, которых нет в кэше, загружаются из queryset одним запросом;
+        несуществующие id пропускаются.
+        """
+        base_url = self.request.build_absolute_uri("/")
+        variants = variants_requested(self.request)
+        versions = get_versions(*map(recipe_scope, recipe_ids))
+        keys = {
+            recipe_id: REPRESENTATION_KEY.format(
+                id=recipe_id, version=versions[recipe_scope(recipe_id)],
+                base_url=base_url, variants=variants,
+            )
+            for recipe_id in recipe_ids
+        }
+        cached = cache.get_many(keys.values())
+        missing = [recipe_id for recipe_id, key in keys.items() if key not in cached]
+        if missing:
+            serializer = RecipeReadOnlySerializer(
+                queryset.filter(pk__in=missing), many=True, context={"request": self.request}
+            )
+            loaded = {item["id"]: self.base(item) for item in serializer.data}
+            cache.set_many(
+                {keys[recipe_id]: data for recipe_id, data in loaded.items()},
+                settings.FOODGRAM_RECIPE_CACHE_TIMEOUT,
+            )
+            cached.update((keys[recipe_id], data) for recipe_id, data in loaded.items())
+
+        self.misses = len(missing)
+        self.hits = len(keys) - self.misses
+        viewer = get_viewer(self.request)
+        return [
+            self.overlay(cached[key], viewer) for key in keys.values() if key in cached
+        ]
+
+    @staticmethod
+    def base(data):
+        """Представление рецепта без флагов текущего пользователя."""
+        return {
+            **data,
+            "author": {**data["author"], "is_subscribed": False},
+            "ingredients": [dict(component) for component in data["ingredients"]],
+            "is_favorited": False,
+            "is_in_shopping_cart": False,
+        }
+
+    @staticmethod
+    def overlay(base, viewer):
+        """Подставляет флаги текущего пользователя в общее представление."""
+        return {
+            **base,
+            "author": {
+                **base["author"],
+                "is_subscribed": base["author"]["id"] in viewer.subscribed_ids,
+            },
+            "is_favorited": base["id"] in viewer.favorite_ids,
+            "is_in_shopping_cart": base["id"] in viewer.cart_ids,
+        }
+
+    @property
+    def header(self):
+        """Значение заголовка ответа со статистикой кэша за запрос."""
+        return f"hits={self.hits}, misses={self.misses}"
+
+
+class RecipeRepresentationMixin:
+    """list и retrieve рецептов через RecipeRepresentationCache."""
+
+    def list(self, request, *args, **kwargs):
+        # Пагинируются только ключи рецептов, а представления берутся из кэша;
+        # из БД загружаются лишь рецепты, которых в кэше нет. В выборке -
+        # поля ключа курсорной пагинации (при поиске - и релевантность).
+        keyset = {field.lstrip("-") for field in self.keyset_ordering}
+        recipes = self.filter_queryset(Recipe.objects.all()).values("id", *keyset - {"id"})
+        page = self.paginate_queryset(recipes)
+        representations = RecipeRepresentationCache(request)
+        data = representations.represent(
+            [recipe["id"] for recipe in (recipes if page is None else page)],
+            self.get_queryset(),
+        )
+        response = Response(data) if page is None else self.get_paginated_response(data)
+        response["X-Recipe-Cache"] = representations.header
+        return response
+
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            recipe_id = int(self.kwargs["pk"])
+        except ValueError:
+            raise Http404
+        representations = RecipeRepresentationCache(request)
+        data = representations.represent([recipe_id], self.get_queryset())
+        if not data:
+            raise Http404
+        response = Response(data[0])
+        response["X-Recipe-Cache"] = representations.header
+        return response
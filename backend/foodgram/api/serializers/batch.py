@@ -0,0 +1,13 @@
+from rest_framework import serializers
+
+BATCH_SIZE = 100
+
+
+class IdListSerializer(serializers.Serializer):
+    """Тело пакетного запроса: {"ids": [1, 2, ...]}."""
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), allow_empty=False, max_length=BATCH_SIZE
+    )
+
+    def validate_ids(self, value):
+        return list(dict.fromkeys(value))  # без повторов, в исходном порядке
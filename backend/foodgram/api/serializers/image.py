@@ -1,21 +1,139 @@
 import base64
+import binascii
+import re
+from tempfile import SpooledTemporaryFile
 
-from django.core.files.base import ContentFile
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image
 from rest_framework import serializers
 
+from recipes.images import delete_variants, schedule_processing
+from users.models import ImageStatus
+
+# Размер части base64 при декодировании; кратен 4
+DECODE_CHUNK_SIZE = 64 * 1024
+
 
 class Base64ImageField(serializers.ImageField):
+    """Изображение в виде data URL: data:image/<формат>;base64,<данные>.
+
+    Данные декодируются частями во временный файл (в памяти до 1 Мб),
+    размер в байтах (FOODGRAM_IMAGE_MAX_BYTES) и пикселях проверяется до
+    полного декодирования изображения Pillow.
+    """
+    default_error_messages = {
+        "invalid_base64": "Некорректные данные base64.",
+        "too_large": "Размер изображения больше {max_size} байт.",
+        "too_many_pixels": "Изображение больше {max_pixels} пикселей.",
+    }
+
     def to_internal_value(self, data):
-        # Если полученный объект строка, и эта строка
-        # начинается с 'data:image'...
         if isinstance(data, str) and data.startswith("data:image"):
-            # ...начинаем декодировать изображение из base64.
-            # Сначала нужно разделить строку на части.
-            format, imgstr = data.split(";base64,")
-            # И извлечь расширение файла.
-            ext = format.split("/")[-1]
-            # Затем декодировать сами данные и поместить результат в файл,
-            # которому дать название по шаблону.
-            data = ContentFile(base64.b64decode(imgstr), name="temp." + ext)
-
+            header, _, encoded = data.partition(";base64,")
+            ext = header.split("/")[-1]
+            if not re.fullmatch(r"[a-z0-9]{1,10}", ext):
+                ext = "jpg"
+            data = File(self.decode(encoded), name="temp." + ext)
+            self.check_pixels(data)
         return super().to_internal_value(data)
+
+    def decode(self, encoded):
+        max_size = settings.FOODGRAM_IMAGE_MAX_BYTES
+        # Переносы строк и пробелы внутри base64 допустимы (например, MIME
+        # по 76 символов) - убираем их до проверки размера и алфавита
+        encoded = "".join(encoded.split())
+        # Оценка размера до декодирования: 4 символа base64 - 3 байта
+        if len(encoded) // 4 * 3 > max_size + 2:
+            self.fail("too_large", max_size=max_size)
+        buffer = SpooledTemporaryFile(max_size=1024 * 1024)
+        try:
+            for start in range(0, len(encoded), DECODE_CHUNK_SIZE):
+                buffer.write(base64.b64decode(
+                    encoded[start:start + DECODE_CHUNK_SIZE], validate=True
+                ))
+        except (binascii.Error, ValueError):
+            buffer.close()
+            self.fail("invalid_base64")
+        if buffer.tell() > max_size:
+            buffer.close()
+            self.fail("too_large", max_size=max_size)
+        buffer.seek(0)
+        return buffer
+
+    def check_pixels(self, file):
+        """Проверяет размеры по заголовку, не декодируя пиксели."""
+        max_pixels = settings.FOODGRAM_IMAGE_MAX_PIXELS
+        try:
+            with Image.open(file) as image:
+                width, height = image.size
+        except Exception:
+            return  # некорректное изображение отклонит ImageField
+        finally:
+            file.seek(0)
+        if width * height > max_pixels:
+            self.fail("too_many_pixels", max_pixels=max_pixels)
+
+
+class ProcessedImagesMixin:
+    """ModelSerializer, отправляющий загруженные изображения на обработку.
+
+    ``processed_image_fields`` - поля модели с изображениями, у каждого
+    есть поле состояния ``<поле>_status`` (см. recipes.images).
+    """
+    processed_image_fields = ()
+
+    def save(self, **kwargs):
+        uploaded = [field for field in self.processed_image_fields
+                    if self.validated_data.get(field)]
+        stale_variants = []
+        for field in uploaded:
+            kwargs[f"{field}_status"] = ImageStatus.PENDING
+            kwargs[f"{field}_variants"] = {}
+            if self.instance is not None:
+                stale_variants.append(getattr(self.instance, f"{field}_variants"))
+        instance = super().save(**kwargs)
+        for field in uploaded:
+            schedule_processing(instance, field)
+        for variants in stale_variants:
+            transaction.on_commit(lambda variants=variants: delete_variants(variants))
+        return instance
+
+
+def variants_requested(request):
+    """Клиент запросил варианты изображений параметром ?variants=1."""
+    return request is not None and request.query_params.get("variants") in ("1", "true")
+
+
+class ImageVariantsField(serializers.Field):
+    """Ссылки на варианты изображения: {"thumbnail": url, "card": url, ...}."""
+
+    def __init__(self, **kwargs):
+        kwargs["read_only"] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, variants):
+        request = self.context.get("request")
+        urls = {}
+        for variant, name in variants.items():
+            url = default_storage.url(name)
+            urls[variant] = request.build_absolute_uri(url) if request is not None else url
+        return urls
+
+
+class ImageVariantsMixin:
+    """Сериализатор, отдающий поля ImageVariantsField только по ?variants=1.
+
+    Без параметра ответ не меняется, так что существующие клиенты его
+    не замечают.
+    """
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if not variants_requested(self.context.get("request")):
+            for name, field in list(fields.items()):
+                if isinstance(field, ImageVariantsField):
+                    del fields[name]
+        return fields
@@ -1,8 +1,20 @@
 # recipes/serializers.py
+from functools import partial
+
+from django.db import transaction
+from django.db.models import Prefetch, prefetch_related_objects
+from recipes.cache import bump_versions, recipe_scope
+from recipes.counters import change_counter
 from recipes.models import Component, Ingredient, Recipe
+from recipes.search import schedule_search_documents
+from recipes.shopping import refresh_for_recipe
 from rest_framework import serializers
 from api.serializers.users import FoodgramUserSerializer
-from ..image import Base64ImageField
+from api.catalogue import ingredient_catalogue
+from api.viewer import get_viewer
+from ..image import (
+    Base64ImageField, ImageVariantsField, ImageVariantsMixin, ProcessedImagesMixin
+)
 
 
 class IngredientSerializer(serializers.ModelSerializer):
@@ -11,8 +23,58 @@ class IngredientSerializer(serializers.ModelSerializer):
         fields = ("id", "name", "measurement_unit")
 
 
+def resolve_ingredients(ids):
+    """Ингредиенты по id одним запросом или из каталога в памяти процесса."""
+    found = ingredient_catalogue.get_many(ids)
+    if found is None:
+        return Ingredient.objects.in_bulk(ids)
+    return {ingredient_id: Ingredient(**fields) for ingredient_id, fields in found.items()}
+
+
+class IngredientPrimaryKeyField(serializers.PrimaryKeyRelatedField):
+    """id ингредиента; при разборе списка берётся из заранее найденных."""
+
+    def to_internal_value(self, data):
+        resolved = getattr(self.parent, "resolved_ingredients", None)
+        if resolved is None:
+            return super().to_internal_value(data)
+        try:
+            if isinstance(data, bool):
+                raise TypeError
+            ingredient = resolved.get(int(data))
+        except (TypeError, ValueError):
+            self.fail("incorrect_type", data_type=type(data).__name__)
+        if ingredient is None:
+            self.fail("does_not_exist", pk_value=data)
+        return ingredient
+
+
+class ComponentListSerializer(serializers.ListSerializer):
+    """Список компонентов: все ингредиенты находятся до проверки элементов.
+
+    Вместо запроса на каждый элемент - один запрос id__in (или каталог),
+    ошибки по отсутствующим id те же, что у PrimaryKeyRelatedField.
+    """
+
+    def to_internal_value(self, data):
+        if not isinstance(data, list):
+            return super().to_internal_value(data)
+        ids = set()
+        for item in data:
+            try:
+                if isinstance(item, dict) and not isinstance(item.get("id"), bool):
+                    ids.add(int(item.get("id")))
+            except (TypeError, ValueError):
+                continue
+        self.child.resolved_ingredients = resolve_ingredients(ids)
+        try:
+            return super().to_internal_value(data)
+        finally:
+            self.child.resolved_ingredients = None
+
+
 class ComponentSerializer(serializers.ModelSerializer):
-    id = serializers.PrimaryKeyRelatedField(source="ingredient", queryset=Ingredient.objects.all())
+    id = IngredientPrimaryKeyField(source="ingredient", queryset=Ingredient.objects.all())
     name = serializers.CharField(source="ingredient.name", read_only=True)
     measurement_unit = serializers.CharField(source="ingredient.measurement_unit", read_only=True)
     amount = serializers.IntegerField(min_value=1)
@@ -20,14 +82,16 @@ class ComponentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Component
         fields = ("id", "name", "measurement_unit", "amount")
+        list_serializer_class = ComponentListSerializer
 
 
-class RecipeReadOnlySerializer(serializers.ModelSerializer):
+class RecipeReadOnlySerializer(ImageVariantsMixin, serializers.ModelSerializer):
     """Сериализатор для чтения рецептов."""
     id = serializers.IntegerField(read_only=True)
     author = FoodgramUserSerializer(read_only=True)
     ingredients = ComponentSerializer(source="components", many=True, read_only=True)
     image = Base64ImageField(read_only=True)
+    image_variants = ImageVariantsField()
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
 
@@ -41,26 +105,23 @@ class RecipeReadOnlySerializer(serializers.ModelSerializer):
             "is_in_shopping_cart",
             "name",
             "image",
+            "image_status",
+            "image_variants",
             "text",
             "cooking_time",
         )
         read_only_fields = fields
 
     def get_is_favorited(self, recipe):
-        user = self.context["request"].user
-        if user.is_anonymous:
-            return False
-        return recipe.favorites.filter(user=user).exists()
+        return recipe.id in get_viewer(self.context.get("request")).favorite_ids
 
     def get_is_in_shopping_cart(self, recipe):
-        user = self.context["request"].user
-        if user.is_anonymous:
-            return False
-        return recipe.shopping_carts.filter(user=user).exists()
+        return recipe.id in get_viewer(self.context.get("request")).cart_ids
 
 
-class RecipeSerializer(serializers.ModelSerializer):
+class RecipeSerializer(ProcessedImagesMixin, serializers.ModelSerializer):
     """Сериализатор для рецептов. Вывод делегируется RecipeReadOnlySerializer."""
+    processed_image_fields = ("image",)
     ingredients = ComponentSerializer(source="components", many=True, required=True)
     image = Base64ImageField()
     cooking_time = serializers.IntegerField(min_value=1)
@@ -91,31 +152,90 @@ class RecipeSerializer(serializers.ModelSerializer):
             )
         return super().validate(data)
 
-    def create_components(self, recipe, components):
-        """Создание компонентов рецепта."""
-        Component.objects.bulk_create(
-            Component(
-                recipe=recipe,
-                ingredient=component["ingredient"],
-                amount=component["amount"]
-            ) for component in components
-        )
+    def save_components(self, recipe, components, created=False):
+        """Приводит компоненты рецепта к переданному списку.
+
+        Сохранённый и переданный списки сравниваются, записывается только
+        разница: новые ингредиенты, изменённые количества и удалённые
+        ингредиенты. Возвращает True, если что-то изменилось.
+        """
+        # Компоненты, загруженные вместе с рецептом (get_queryset), не
+        # запрашиваются повторно
+        prefetched = getattr(recipe, "_prefetched_objects_cache", {}).get("components")
+        if created:
+            stored = {}
+        elif prefetched is not None:
+            stored = {
+                component.ingredient_id: (component.id, component.amount)
+                for component in prefetched
+            }
+        else:
+            stored = {
+                ingredient_id: (component_id, amount)
+                for component_id, ingredient_id, amount
+                in recipe.components.order_by().values_list("id", "ingredient_id", "amount")
+            }
+        submitted = {component["ingredient"].id: component["amount"] for component in components}
+        added = [ingredient_id for ingredient_id in submitted if ingredient_id not in stored]
+        removed = [ingredient_id for ingredient_id in stored if ingredient_id not in submitted]
+        changed = [
+            ingredient_id for ingredient_id, amount in submitted.items()
+            if ingredient_id in stored and stored[ingredient_id][1] != amount
+        ]
+        if not (added or removed or changed):
+            return False
+        if added:
+            Component.objects.bulk_create(
+                Component(
+                    recipe=recipe, ingredient_id=ingredient_id, amount=submitted[ingredient_id]
+                ) for ingredient_id in added
+            )
+        if changed:
+            Component.objects.bulk_update(
+                [
+                    Component(id=stored[ingredient_id][0], amount=submitted[ingredient_id])
+                    for ingredient_id in changed
+                ],
+                ["amount"],
+            )
+        if removed:
+            # delete() отправляет post_delete для каждой строки: счётчики,
+            # списки покупок и поисковый документ обновляют receivers
+            Component.objects.filter(recipe=recipe, ingredient__in=removed).delete()
+        # bulk_create и bulk_update не отправляют сигналы - обновляем
+        # поисковый документ, списки покупок, счётчики и кэш рецепта явно
+        if added:
+            schedule_search_documents([recipe.id])
+        if added or changed:
+            refresh_for_recipe(recipe.id, [*added, *changed])
+        change_counter(Ingredient, "recipes_count", added, 1)
+        transaction.on_commit(partial(bump_versions, "recipes", recipe_scope(recipe.id)))
+        return True
 
     def create(self, validated_data):
         # Чтобы не передать components в super().create
         components = validated_data.pop("components")  # Нужен именно pop !
-        recipe = super().create(validated_data)
-        self.create_components(recipe, components)
+        with transaction.atomic():
+            recipe = super().create(validated_data)
+            self.save_components(recipe, components, created=True)
         return recipe
 
     def update(self, recipe, validated_data):
         # Чтобы не передать components в super().update
         components = validated_data.pop("components")  # Нужен именно pop !
-        recipe.components.all().delete()
-        self.create_components(recipe, components)
-        recipe = super().update(recipe, validated_data)
+        with transaction.atomic():
+            self.save_components(recipe, components)
+            # Рецепт сохраняется, только если изменились его поля
+            if any(getattr(recipe, field) != value for field, value in validated_data.items()):
+                recipe = super().update(recipe, validated_data)
         return recipe
 
     def to_representation(self, instance):
         """Возвращает данные в формате RecipeReadSerializer."""
+        # После create и update (DRF сбрасывает кэш prefetch_related)
+        # компоненты загружаются одним запросом вместе с ингредиентами
+        if "components" not in getattr(instance, "_prefetched_objects_cache", {}):
+            prefetch_related_objects([instance], Prefetch(
+                "components", queryset=Component.objects.select_related("ingredient")
+            ))
         return RecipeReadOnlySerializer(instance, context=self.context).data
@@ -1,10 +1,12 @@
 from recipes.models import Recipe
 from rest_framework import serializers
+from ..image import ImageVariantsField, ImageVariantsMixin
 
 
-class RecipeShortSerializer(serializers.ModelSerializer):
+class RecipeShortSerializer(ImageVariantsMixin, serializers.ModelSerializer):
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = Recipe
-        fields = ("id", "name", "image", "cooking_time")
+        fields = ("id", "name", "image", "image_variants", "cooking_time")
         read_only_fields = fields
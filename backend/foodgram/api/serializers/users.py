@@ -1,60 +1,85 @@
 from django.contrib.auth import get_user_model
+from django.db.models import Prefetch
 from djoser.serializers import UserSerializer
 from rest_framework import serializers
+from recipes.models import Recipe
 from .recipes.shared import RecipeShortSerializer
-from users.models import Subscription
-from .image import Base64ImageField
+from api.viewer import get_viewer
+from .image import (
+    Base64ImageField, ImageVariantsField, ImageVariantsMixin, ProcessedImagesMixin
+)
 
 User = get_user_model()
 
 
-RECIPES_LIMIT = 10**10
+def get_recipes_limit(request):
+    """Параметр recipes_limit запроса; None - без ограничения."""
+    try:
+        limit = int(request.query_params['recipes_limit'])
+    except (AttributeError, KeyError, ValueError):
+        return None
+    return limit if limit >= 0 else None
 
 
-class FoodgramUserSerializer(UserSerializer):
+def limited_recipes(limit):
+    """Prefetch не более limit последних рецептов каждого автора.
+
+    Срез Django выполняет одним запросом для всех авторов страницы:
+    ROW_NUMBER() OVER (PARTITION BY author_id ORDER BY publish_date DESC).
+    """
+    recipes = Recipe.objects.only(
+        'id', 'name', 'image', 'image_variants', 'cooking_time', 'author_id'
+    ).order_by('-publish_date', '-id')
+    if limit is not None:
+        recipes = recipes[:limit]
+    return Prefetch('recipes', queryset=recipes, to_attr='limited_recipes')
+
+
+class FoodgramUserSerializer(ImageVariantsMixin, ProcessedImagesMixin, UserSerializer):
     """Сериализатор для пользователей с аватаром и подписками."""
+    processed_image_fields = ('avatar',)
     avatar = Base64ImageField(required=False, allow_null=True)
+    avatar_variants = ImageVariantsField()
     is_subscribed = serializers.SerializerMethodField()
 
     class Meta(UserSerializer.Meta):
         model = User
         fields: tuple[str, ...] = ('id', 'email', 'username',
                                    'first_name', 'last_name',
-                                   'avatar', 'is_subscribed')
+                                   'avatar', 'avatar_variants', 'is_subscribed')
 
     def get_is_subscribed(self, user):
         """Проверяет, подписан ли текущий пользователь на данного пользователя."""
-        request = self.context.get('request')
-        return (
-            request
-            and request.user.is_authenticated
-            and Subscription.objects.filter(user=request.user, subscribed_to=user).exists()
-        )
+        return user.id in get_viewer(self.context.get('request')).subscribed_ids
 
 
 class UserWithRecipesSerializer(FoodgramUserSerializer):
     """Сериализатор для пользователей с рецептами."""
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.IntegerField(source='recipes.count', read_only=True)
+    recipes_count = serializers.IntegerField(read_only=True)
 
     class Meta(FoodgramUserSerializer.Meta):
         fields = FoodgramUserSerializer.Meta.fields + ('recipes', 'recipes_count')
 
     def get_recipes(self, user):
-        """Возвращает список рецептов с учётом параметра recipes_limit."""
-        request = self.context.get('request')
-        recipes_limit = request.query_params.get('recipes_limit', RECIPES_LIMIT)
-        try:
-            limit = int(recipes_limit)
-        except ValueError:
-            limit = RECIPES_LIMIT
-        return RecipeShortSerializer(user.recipes.all()[:limit], many=True).data
+        """Рецепты автора с учётом параметра recipes_limit.
+
+        Обычно они уже загружены через limited_recipes(); без предзагрузки
+        рецепты запрашиваются отдельно.
+        """
+        recipes = getattr(user, 'limited_recipes', None)
+        if recipes is None:
+            limit = get_recipes_limit(self.context.get('request'))
+            recipes = user.recipes.all()[:limit]
+        return RecipeShortSerializer(recipes, many=True, context=self.context).data
 
 
-class AvatarSerializer(serializers.ModelSerializer):
+class AvatarSerializer(ProcessedImagesMixin, serializers.ModelSerializer):
     """Сериализатор для управления аватаром."""
+    processed_image_fields = ('avatar',)
     avatar = Base64ImageField(required=True, allow_null=False)
 
     class Meta:
         model = User
-        fields = ('avatar',)
+        fields = ('avatar', 'avatar_status')
+        read_only_fields = ('avatar_status',)
@@ -0,0 +1,67 @@
+from functools import partial
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from recipes.cache import bump_versions, recipe_scope, user_scope
+from recipes.models import Component, Favorite, Ingredient, Recipe, ShoppingCart
+from recipes.shortlinks import invalidate_map
+from users.models import Subscription
+
+User = get_user_model()
+
+
+# Версии повышаются только после фиксации: иначе параллельный запрос успеет
+# прочитать старые строки и закэшировать их под новой версией
+@receiver((post_save, post_delete), sender=Recipe)
+def recipe_changed(sender, instance, created=True, **kwargs):
+    scopes = ["recipes", recipe_scope(instance.id)]
+    if created:  # создание или удаление (у post_delete нет created)
+        scopes.append("recipe_ids")
+    transaction.on_commit(partial(bump_versions, *scopes))
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    # Выгруженная карта nginx ещё перенаправляет на удалённый рецепт
+    transaction.on_commit(invalidate_map)
+
+
+@receiver((post_save, post_delete), sender=Component)
+def component_changed(sender, instance, **kwargs):
+    transaction.on_commit(partial(bump_versions, "recipes", recipe_scope(instance.recipe_id)))
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def ingredient_changed(sender, instance, **kwargs):
+    # Название и единица измерения входят в представления рецептов
+    transaction.on_commit(partial(bump_versions, "ingredients", "recipes", *map(
+        recipe_scope,
+        Component.objects.filter(ingredient=instance).values_list("recipe_id", flat=True),
+    )))
+
+
+@receiver((post_save, post_delete), sender=User)
+def user_changed(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and set(update_fields) == {"last_login"}:
+        return  # вход пользователя не меняет его публичные данные
+    transaction.on_commit(partial(bump_versions, "users", *map(
+        recipe_scope, Recipe.objects.filter(author=instance).values_list("id", flat=True)
+    )))
+
+
+@receiver((post_save, post_delete), sender=Favorite)
+def favorites_changed(sender, instance, **kwargs):
+    transaction.on_commit(partial(bump_versions, user_scope("favorites", instance.user_id)))
+
+
+@receiver((post_save, post_delete), sender=ShoppingCart)
+def shopping_cart_changed(sender, instance, **kwargs):
+    transaction.on_commit(partial(bump_versions, user_scope("carts", instance.user_id)))
+
+
+@receiver((post_save, post_delete), sender=Subscription)
+def subscriptions_changed(sender, instance, **kwargs):
+    transaction.on_commit(partial(bump_versions, user_scope("subscriptions", instance.user_id)))
@@ -0,0 +1,108 @@
+import fcntl
+import hashlib
+import os
+import posixpath
+import re
+import tempfile
+import time
+from contextlib import contextmanager
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+
+# Имя файла по содержимому: <каталог>/<2 символа хэша>/<sha256>.<расширение>
+HASHED_NAME = re.compile(r"(^|/)[0-9a-f]{2}/[0-9a-f]{64}(\.[\w]+)?$")
+
+LOCK_NAME = ".content-hash.lock"
+
+
+def is_hashed(name):
+    return bool(HASHED_NAME.search(name))
+
+
+class ContentHashStorage(FileSystemStorage):
+    """Файловое хранилище с именами по SHA-256 содержимого.
+
+    Одинаковые файлы хранятся один раз, а URL меняется вместе с
+    содержимым, поэтому nginx может отдавать их с Cache-Control:
+    immutable. Файл удаляется, только когда на него не ссылается ни одна
+    запись: число ссылок хранит таблица recipes.FileReference.
+
+    Запись, ссылающаяся на уже существующий файл, может быть ещё не
+    зафиксирована, поэтому сохранение обновляет время изменения файла, а
+    delete() не трогает файлы моложе FOODGRAM_MEDIA_GRACE_PERIOD. Время и
+    удаление проверяются под файловой блокировкой, которую берёт и
+    сохранение; запросы к БД идут до неё и загрузки не ждут их.
+    Оставшиеся файлы без ссылок удаляет ``rehash_media --prune``.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # Итоговое имя определяет содержимое (см. _save), суффиксы не нужны
+        return name
+
+    def hashed_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        digest = digest.hexdigest()
+        directory, filename = posixpath.split(name.replace("\\", "/"))
+        ext = os.path.splitext(filename)[1].lower()
+        return posixpath.join(directory, digest[:2], digest + ext)
+
+    @contextmanager
+    def lock(self):
+        """Блокировка хранилища, общая для процессов и потоков."""
+        os.makedirs(self.location, exist_ok=True)
+        with open(os.path.join(self.location, LOCK_NAME), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _save(self, name, content):
+        name = self.hashed_name(name, content)
+        full_path = self.path(name)
+        with self.lock():
+            if self.exists(name):
+                # Новая ссылка на существующий файл: свежее время изменения
+                # не даст delete() удалить его до фиксации этой ссылки
+                os.utime(full_path)
+                return name
+        directory = os.path.dirname(full_path)
+        os.makedirs(directory, exist_ok=True)
+        # Запись во временный файл и атомарная замена: параллельная загрузка
+        # того же содержимого не увидит недописанный файл
+        with tempfile.NamedTemporaryFile(dir=directory, delete=False) as temporary:
+            for chunk in content.chunks():
+                temporary.write(chunk)
+        os.chmod(temporary.name, self.file_permissions_mode or 0o644)
+        with self.lock():
+            os.replace(temporary.name, full_path)
+        return name
+
+    def delete(self, name):
+        """Удаляет файл, если на него не ссылаются и его не сохраняли недавно."""
+        if not name or self.is_referenced(name):
+            return
+        with self.lock():
+            if self.is_recent(name):
+                return
+            super().delete(name)
+
+    def is_recent(self, name):
+        try:
+            modified = os.path.getmtime(self.path(name))
+        except OSError:
+            return False
+        return time.time() - modified < settings.FOODGRAM_MEDIA_GRACE_PERIOD
+
+    @staticmethod
+    def is_referenced(name):
+        """Ссылается ли на файл хотя бы одна запись."""
+        # Строки с нулём не удаляются: увеличение счётчика (INSERT ... ON
+        # CONFLICT DO NOTHING, затем UPDATE) могло бы не найти строку
+        return apps.get_model("recipes", "FileReference").objects.filter(
+            name=name, count__gt=0
+        ).exists()
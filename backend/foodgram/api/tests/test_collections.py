@@ -0,0 +1,289 @@
+import threading
+import unittest
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TransactionTestCase
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from recipes.counters import COUNTERS, actual_count
+from recipes.models import (
+    Component, Favorite, Ingredient, Recipe, ShoppingCart, ShoppingListItem
+)
+from recipes.shopping import live_totals, refresh_shopping_lists
+from users.models import Subscription
+
+from .test_recipes import RecipeAPITestCase
+
+User = get_user_model()
+
+THREADS = 8
+
+
+class CollectionQueryCountTests(RecipeAPITestCase):
+    """Число запросов к БД при добавлении и удалении из коллекций."""
+
+    def test_favorite(self):
+        self.authenticate()
+        recipe = self.recipes[1]
+        url = f"/api/recipes/{recipe.id}/favorite/"
+        # Токен, рецепт, INSERT ... RETURNING (DELETE ... RETURNING), счётчик
+        with self.assertNumQueries(4):
+            self.assertEqual(self.client.post(url).status_code, 201)
+        with self.assertNumQueries(3):
+            self.assertEqual(self.client.post(url).status_code, 400)
+        with self.assertNumQueries(4):
+            self.assertEqual(self.client.delete(url).status_code, 204)
+        with self.assertNumQueries(3):
+            self.assertEqual(self.client.delete(url).status_code, 400)
+
+    def test_subscribe(self):
+        author = User.objects.create_user(
+            username="other", email="other@example.com", password="password",
+            first_name="Другой", last_name="Автор",
+        )
+        self.authenticate()
+        url = f"/api/users/{author.id}/subscribe/"
+        # Токен, автор, INSERT ... RETURNING, два счётчика, а для ответа -
+        # рецепты автора и подписки пользователя (is_subscribed)
+        with self.assertNumQueries(7):
+            self.assertEqual(self.client.post(url).status_code, 201)
+        with self.assertNumQueries(3):
+            self.assertEqual(self.client.post(url).status_code, 400)
+        with self.assertNumQueries(5):
+            self.assertEqual(self.client.delete(url).status_code, 204)
+
+
+class CollectionBatchTests(RecipeAPITestCase):
+    """Пакетные запросы: статус каждого id как у одиночного запроса."""
+
+    def assert_batch(self, method, url, ids, expected, queries):
+        with self.assertNumQueries(queries):
+            response = getattr(self.client, method)(url, {"ids": ids}, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(item["id"], item["status"]) for item in response.data["results"]], expected
+        )
+        return response.data["results"]
+
+    def test_favorite_batch(self):
+        self.authenticate()
+        url = "/api/recipes/favorite/batch/"
+        new, present, missing = self.recipes[1], self.recipes[0], 10 ** 6
+        ids = [new.id, present.id, missing, new.id]
+        # Токен, рецепты пакета, INSERT ... RETURNING (DELETE ... RETURNING),
+        # счётчик избранного
+        results = self.assert_batch(
+            "post", url, ids, [(new.id, 201), (present.id, 400), (missing, 404)], 4
+        )
+        self.assertEqual(results[1]["errors"], f"Рецепт {present.name} уже в Избранное")
+        self.assertEqual(results[2]["errors"], "Рецепт не найден")
+        self.assertTrue(Favorite.objects.filter(user=self.user, recipe=new).exists())
+        new.refresh_from_db()
+        self.assertEqual(new.favorites_count, 1)
+
+        results = self.assert_batch(
+            "delete", url, [new.id, self.recipes[3].id, missing],
+            [(new.id, 204), (self.recipes[3].id, 400), (missing, 404)], 4,
+        )
+        self.assertEqual(results[1]["errors"], f"В Избранное нет рецепта {self.recipes[3].name}")
+        self.assertFalse(Favorite.objects.filter(user=self.user, recipe=new).exists())
+
+    def test_shopping_cart_batch(self):
+        self.authenticate()
+        url = "/api/recipes/shopping_cart/batch/"
+        new, present, missing = self.recipes[1], self.recipes[0], 10 ** 6
+        # Токен, рецепты пакета, INSERT ... RETURNING, ингредиенты рецептов,
+        # пересчёт списка покупок (блокировка пользователя, суммы, текущие
+        # строки, запись - в точке сохранения)
+        self.assert_batch(
+            "post", url, [new.id, present.id, missing],
+            [(new.id, 201), (present.id, 400), (missing, 404)], 10,
+        )
+        self.assertTrue(ShoppingCart.objects.filter(user=self.user, recipe=new).exists())
+        self.assertEqual(
+            dict(ShoppingListItem.objects.filter(user=self.user).values_list(
+                "ingredient_id", "amount"
+            )),
+            {ingredient_id: amount for user_id, ingredient_id, amount in live_totals()
+             if user_id == self.user.id},
+        )
+        self.assert_batch(
+            "delete", url, [new.id, self.recipes[2].id],
+            [(new.id, 204), (self.recipes[2].id, 400)], 10,
+        )
+        self.assertFalse(ShoppingCart.objects.filter(user=self.user, recipe=new).exists())
+
+    def test_invalid_body(self):
+        self.authenticate()
+        for body in ({}, {"ids": []}, {"ids": ["a"]}, {"ids": [0]}, {"ids": list(range(1, 102))}):
+            with self.subTest(body=body):
+                response = self.client.post(
+                    "/api/recipes/favorite/batch/", body, format="json"
+                )
+                self.assertEqual(response.status_code, 400)
+                self.assertIn("ids", response.data)
+
+
+class ShoppingListRefreshTests(RecipeAPITestCase):
+    """Изменение состава рецепта обновляет списки покупок всех, у кого он в корзине."""
+
+    def setUp(self):
+        super().setUp()
+        self.recipe = self.recipes[0]
+        self.other = User.objects.create_user(
+            username="other", email="other@example.com", password="password",
+            first_name="Другой", last_name="Покупатель",
+        )
+        ShoppingCart.objects.create(user=self.other, recipe=self.recipe)
+        # Корзины класса созданы bulk_create, без сигналов
+        refresh_shopping_lists(
+            [self.user.id, self.other.id], Ingredient.objects.values_list("id", flat=True)
+        )
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Token {Token.objects.create(user=self.author).key}"
+        )
+
+    def assert_lists(self):
+        stored = set(ShoppingListItem.objects.values_list("user_id", "ingredient_id", "amount"))
+        self.assertEqual(stored, set(live_totals()))
+        self.assertTrue(ShoppingListItem.objects.filter(user=self.other).exists())
+
+    def test_components_changed(self):
+        ingredients = list(Ingredient.objects.order_by("id"))
+        new = Ingredient.objects.create(name="Новый", measurement_unit="г")
+        # Первое количество меняется, второй ингредиент удаляется, новый добавляется
+        data = [{"id": ingredients[0].id, "amount": 7}, *(
+            {"id": ingredient.id, "amount": 100} for ingredient in ingredients[2:]
+        ), {"id": new.id, "amount": 30}]
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                f"/api/recipes/{self.recipe.id}/", {"ingredients": data}, format="json"
+            )
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assert_lists()
+        self.assertEqual(
+            ShoppingListItem.objects.get(user=self.other, ingredient=new).amount, 30
+        )
+        self.assertFalse(
+            ShoppingListItem.objects.filter(user=self.other, ingredient=ingredients[1]).exists()
+        )
+
+    def test_recipe_deleted(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(f"/api/recipes/{self.recipe.id}/")
+        self.assertEqual(response.status_code, 204)
+        stored = set(ShoppingListItem.objects.values_list("user_id", "ingredient_id", "amount"))
+        self.assertEqual(stored, set(live_totals()))
+        self.assertFalse(ShoppingListItem.objects.filter(user=self.other).exists())
+
+
+@unittest.skipUnless(
+    connection.vendor == "postgresql", "Параллельные транзакции проверяются в PostgreSQL"
+)
+class CollectionConcurrencyTests(TransactionTestCase):
+    """Одновременные повторные запросы не создают дублей и не сбивают счётчики."""
+
+    def setUp(self):
+        self.author = User.objects.create_user(
+            username="author", email="author@example.com", password="password",
+            first_name="Автор", last_name="Рецептов",
+        )
+        self.users = [
+            User.objects.create_user(
+                username=f"user{number}", email=f"user{number}@example.com",
+                password="password", first_name="Пользователь", last_name=str(number),
+            )
+            for number in range(THREADS)
+        ]
+        self.tokens = [Token.objects.create(user=user).key for user in self.users]
+        self.ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f"Ингредиент {number}", measurement_unit="г")
+            for number in range(3)
+        )
+        self.recipes = [
+            Recipe.objects.create(
+                author=self.author, name=f"Рецепт {number}", text="Описание", cooking_time=5
+            )
+            for number in range(2)
+        ]
+        # create, а не bulk_create: счётчики ведут сигналы
+        for recipe in self.recipes:
+            for ingredient in self.ingredients:
+                Component.objects.create(recipe=recipe, ingredient=ingredient, amount=10)
+
+    def run_parallel(self, requests):
+        """Выполняет запросы (токен, метод, url) одновременно, каждый в своём потоке."""
+        barrier = threading.Barrier(len(requests))
+        statuses = [None] * len(requests)
+
+        def send(index, token, method, url):
+            client = APIClient()
+            client.credentials(HTTP_AUTHORIZATION=f"Token {token}")
+            try:
+                barrier.wait()
+                statuses[index] = getattr(client, method)(url).status_code
+            finally:
+                connection.close()
+
+        threads = [
+            threading.Thread(target=send, args=(index, *request))
+            for index, request in enumerate(requests)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return sorted(statuses)
+
+    def assert_consistent(self):
+        for model, field, related_model, foreign_key in COUNTERS:
+            drifted = model.objects.exclude(**{field: actual_count(related_model, foreign_key)})
+            self.assertFalse(drifted.exists(), f"{model._meta.label}.{field}")
+        expected = {(user, ingredient): amount for user, ingredient, amount in live_totals()}
+        stored = {
+            (user, ingredient): amount
+            for user, ingredient, amount in ShoppingListItem.objects.values_list(
+                "user_id", "ingredient_id", "amount"
+            )
+        }
+        self.assertEqual(stored, expected)
+
+    def test_double_taps(self):
+        token = self.tokens[0]
+        for collection, url in (
+            (Favorite, f"/api/recipes/{self.recipes[0].id}/favorite/"),
+            (ShoppingCart, f"/api/recipes/{self.recipes[0].id}/shopping_cart/"),
+            (Subscription, f"/api/users/{self.author.id}/subscribe/"),
+        ):
+            with self.subTest(collection=collection.__name__):
+                statuses = self.run_parallel([(token, "post", url)] * THREADS)
+                self.assertEqual(statuses, [201] + [400] * (THREADS - 1))
+                self.assertEqual(collection.objects.filter(user=self.users[0]).count(), 1)
+                self.assert_consistent()
+                statuses = self.run_parallel([(token, "delete", url)] * THREADS)
+                self.assertEqual(statuses, [204] + [400] * (THREADS - 1))
+                self.assertFalse(collection.objects.filter(user=self.users[0]).exists())
+                self.assert_consistent()
+
+    def test_many_users_toggle(self):
+        requests = []
+        for token in self.tokens:
+            for recipe in self.recipes:
+                requests.append((token, "post", f"/api/recipes/{recipe.id}/favorite/"))
+                requests.append((token, "post", f"/api/recipes/{recipe.id}/shopping_cart/"))
+            requests.append((token, "post", f"/api/users/{self.author.id}/subscribe/"))
+        self.assertEqual(self.run_parallel(requests), [201] * len(requests))
+        self.assert_consistent()
+        for recipe in self.recipes:
+            recipe.refresh_from_db()
+            self.assertEqual(recipe.favorites_count, THREADS)
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.followers_count, THREADS)
+
+        requests = [(token, "delete", url) for token, method, url in requests]
+        self.assertEqual(self.run_parallel(requests), [204] * len(requests))
+        self.assert_consistent()
+        self.assertFalse(Favorite.objects.exists())
+        self.assertFalse(ShoppingListItem.objects.exists())
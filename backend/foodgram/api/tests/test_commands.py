@@ -0,0 +1,43 @@
+import io
+
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+
+from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart
+from users.models import Subscription
+
+User = get_user_model()
+
+
+class GenerateDatasetTests(TestCase):
+    """generate_dataset создаёт ровно запрошенное число записей."""
+
+    @classmethod
+    def setUpTestData(cls):
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f"Ингредиент {number}", measurement_unit="г")
+            for number in range(30)
+        )
+
+    def generate(self, **options):
+        options = {
+            "users": 20, "recipes": 30, "favorites": 200, "carts": 50,
+            "subscriptions": 300, "images": 0, **options,
+        }
+        call_command("generate_dataset", stdout=io.StringIO(), **options)
+
+    def test_exact_counts(self):
+        # 300 подписок из 380 возможных: активные пользователи упираются
+        # в число авторов, остаток достаётся остальным
+        self.generate()
+        self.assertEqual(User.objects.count(), 20)
+        self.assertEqual(Recipe.objects.count(), 30)
+        self.assertEqual(Favorite.objects.count(), 200)
+        self.assertEqual(ShoppingCart.objects.count(), 50)
+        self.assertEqual(Subscription.objects.count(), 300)
+
+    def test_too_many(self):
+        with self.assertRaises(CommandError):
+            self.generate(subscriptions=20 * 19 + 1)
+        self.assertFalse(User.objects.exists())
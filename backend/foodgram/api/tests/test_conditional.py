@@ -0,0 +1,126 @@
+from django.core.cache import cache
+
+from recipes.cache import VERSION_KEY, get_versions, recipe_scope, user_scope
+from recipes.models import Favorite, Ingredient
+
+from .test_recipes import RecipeAPITestCase
+
+
+class ConditionalGetTests(RecipeAPITestCase):
+    """304 по совпавшему If-None-Match и новый ETag после изменения данных."""
+
+    def assert_not_modified(self, url, queries):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response["ETag"]
+        # 304 без сериализации: только проверка токена, если он передан
+        with self.assertNumQueries(queries):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+        return etag
+
+    def assert_modified(self, url, etag):
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        return response
+
+    def test_not_modified(self):
+        urls = (
+            "/api/recipes/",
+            f"/api/recipes/{self.recipes[0].id}/",
+            "/api/ingredients/",
+            "/api/ingredients/?name=Инг",
+            "/api/users/",
+            f"/api/users/{self.author.id}/",
+        )
+        for authenticated in (False, True):
+            if authenticated:
+                self.authenticate()
+            for url in urls:
+                with self.subTest(url=url, authenticated=authenticated):
+                    self.assert_not_modified(url, queries=int(authenticated))
+
+    def test_recipe_changed(self):
+        recipe = self.recipes[-1]  # первый в ленте
+        for url in ("/api/recipes/", f"/api/recipes/{recipe.id}/"):
+            with self.subTest(url=url):
+                etag = self.assert_not_modified(url, queries=0)
+                recipe.name = f"{recipe.name}!"
+                with self.captureOnCommitCallbacks(execute=True):
+                    recipe.save()
+                response = self.assert_modified(url, etag)
+                names = [item["name"] for item in response.data.get("results", [response.data])]
+                self.assertIn(recipe.name, names)
+
+    def test_viewer_flags_changed(self):
+        self.authenticate()
+        recipe = self.recipes[1]
+        url = f"/api/recipes/{recipe.id}/"
+        etag = self.assert_not_modified(url, queries=1)
+        self.assertFalse(Favorite.objects.filter(user=self.user, recipe=recipe).exists())
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.post(f"{url}favorite/").status_code, 201)
+        response = self.assert_modified(url, etag)
+        self.assertTrue(response.data["is_favorited"])
+
+    def test_ingredient_changed(self):
+        url = "/api/ingredients/"
+        etag = self.assert_not_modified(url, queries=0)
+        with self.captureOnCommitCallbacks(execute=True):
+            Ingredient.objects.create(name="Новый ингредиент", measurement_unit="шт")
+        response = self.assert_modified(url, etag)
+        self.assertIn("Новый ингредиент", [item["name"] for item in response.json()])
+
+    def test_versions_bumped_after_commit(self):
+        # Запрос между изменением и фиксацией не должен получить новую версию
+        # вместе со старыми строками
+        recipe = self.recipes[0]
+        self.client.force_authenticate(self.author)
+        scopes = (recipe_scope(recipe.id), user_scope("favorites", self.author.id))
+        before = get_versions(*scopes)
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.patch(
+                f"/api/recipes/{recipe.id}/",
+                {"name": "Новое название", "ingredients": [
+                    {"id": component.ingredient_id, "amount": component.amount + 1}
+                    for component in recipe.components.all()
+                ]},
+                format="json",
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(
+                self.client.post(f"/api/recipes/{recipe.id}/favorite/").status_code, 201
+            )
+            self.assertEqual(get_versions(*scopes), before)
+        self.assertTrue(callbacks)
+        for callback in callbacks:
+            callback()
+        after = get_versions(*scopes)
+        for scope in scopes:
+            self.assertNotEqual(after[scope], before[scope], scope)
+
+    def test_padded_pk(self):
+        # "01" - тот же рецепт 1: его ETag устаревает вместе с "1"
+        recipe = self.recipes[0]
+        url = f"/api/recipes/0{recipe.id}/"
+        etag = self.assert_not_modified(url, queries=0)
+        recipe.name = f"{recipe.name}!"
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.save()
+        self.assert_modified(url, etag)
+
+    def test_unknown_pk(self):
+        for pk in ("abcdef", "-1"):
+            with self.subTest(pk=pk):
+                self.assertEqual(self.client.get(f"/api/recipes/{pk}/").status_code, 404)
+                self.assertIsNone(cache.get(VERSION_KEY.format(recipe_scope(pk))))
+
+    def test_if_modified_since_ignored(self):
+        # Без Last-Modified запрос только с If-Modified-Since получает 200
+        url = "/api/recipes/"
+        response = self.client.get(url)
+        self.assertNotIn("Last-Modified", response)
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE="Fri, 01 Jan 2100 00:00:00 GMT")
+        self.assertEqual(response.status_code, 200)
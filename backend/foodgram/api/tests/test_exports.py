@@ -0,0 +1,107 @@
+import csv
+import io
+import json
+
+from django.contrib.auth import get_user_model
+from rest_framework.authtoken.models import Token
+
+from recipes.models import Component, Ingredient, Recipe, ShoppingCart, ShoppingListItem
+from recipes.shopping import refresh_shopping_lists
+
+from .test_recipes import RecipeAPITestCase
+
+User = get_user_model()
+
+URL = "/api/recipes/download_shopping_cart/"
+
+
+class ShoppingListExportTests(RecipeAPITestCase):
+    """Список покупок в txt, csv и json, выдаваемый частями."""
+
+    def setUp(self):
+        super().setUp()
+        # Название с запятой и кавычками проверяет экранирование csv
+        salt = Ingredient.objects.create(name='соль "морская", крупная', measurement_unit="г")
+        recipe = Recipe.objects.create(
+            author=self.author, name="Суп", text="Описание", cooking_time=5
+        )
+        Component.objects.create(recipe=recipe, ingredient=salt, amount=15)
+        ShoppingCart.objects.create(user=self.user, recipe=recipe)
+        # Корзины класса созданы bulk_create, без сигналов
+        refresh_shopping_lists([self.user.id], Ingredient.objects.values_list("id", flat=True))
+        self.authenticate()
+        self.products = list(
+            ShoppingListItem.objects.filter(user=self.user).order_by("ingredient__name")
+            .values_list("ingredient__name", "amount", "ingredient__measurement_unit")
+        )
+        self.recipe_names = set(
+            Recipe.objects.filter(shopping_carts__user=self.user).values_list("name", flat=True)
+        )
+
+    def download(self, **params):
+        response = self.client.get(URL, params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b"".join(response.streaming_content).decode()
+
+    def test_txt(self):
+        response, content = self.download()
+        self.assertEqual(response["Content-Type"], "text/plain; charset=utf-8")
+        self.assertIn('filename="shopping_cart.txt"', response["Content-Disposition"])
+        products, recipes = content.split("\nПродукты:\n")[1].split("\nРецепты:\n")
+        self.assertEqual(products.splitlines(), [
+            f"{number}. {name[0].upper()}{name[1:]} — {amount} {unit}"
+            for number, (name, amount, unit) in enumerate(self.products, start=1)
+        ])
+        self.assertEqual(len(recipes.splitlines()), len(self.recipe_names))
+        self.assertIn("- Суп (@author)", recipes.splitlines())
+
+    def test_csv(self):
+        response, content = self.download(format="csv")
+        self.assertEqual(response["Content-Type"], "text/csv; charset=utf-8")
+        self.assertIn('filename="shopping_cart.csv"', response["Content-Disposition"])
+        rows = list(csv.reader(io.StringIO(content)))
+        self.assertEqual(rows[0], ["name", "amount", "measurement_unit"])
+        self.assertEqual(rows[1:], [
+            [name, str(amount), unit] for name, amount, unit in self.products
+        ])
+
+    def test_json(self):
+        response, content = self.download(format="json")
+        self.assertEqual(response["Content-Type"], "application/json")
+        data = json.loads(content)
+        self.assertEqual(data["products"], [
+            {"name": name, "amount": amount, "measurement_unit": unit}
+            for name, amount, unit in self.products
+        ])
+        self.assertEqual({recipe["name"] for recipe in data["recipes"]}, self.recipe_names)
+        self.assertIn({"name": "Суп", "author": "author"}, data["recipes"])
+
+    def test_empty(self):
+        user = User.objects.create_user(
+            username="empty", email="empty@example.com", password="password",
+            first_name="Пустая", last_name="Корзина",
+        )
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {Token.objects.create(user=user).key}")
+        content = self.download()[1]
+        self.assertIn("Нет продуктов в корзине", content)
+        self.assertIn("Нет рецептов в корзине", content)
+        self.assertEqual(self.download(format="csv")[1], "name,amount,measurement_unit\r\n")
+        data = json.loads(self.download(format="json")[1])
+        self.assertEqual((data["products"], data["recipes"]), ([], []))
+
+    def test_not_modified(self):
+        etags = {}
+        for format in ("txt", "csv", "json"):
+            response = self.client.get(URL, {"format": format})
+            etags[format] = response["ETag"]
+            with self.assertNumQueries(1):  # только токен
+                response = self.client.get(
+                    URL, {"format": format}, HTTP_IF_NONE_MATCH=etags[format]
+                )
+            self.assertEqual(response.status_code, 304)
+        self.assertEqual(len(set(etags.values())), 3)
+
+    def test_anonymous(self):
+        self.client.credentials()
+        self.assertEqual(self.client.get(URL).status_code, 401)
@@ -0,0 +1,166 @@
+import io
+import posixpath
+import shutil
+import tempfile
+from contextlib import contextmanager
+from unittest import mock
+
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+
+from api.storage import ContentHashStorage
+from recipes.models import FileReference
+
+from .test_recipes import RecipeAPITestCase, image_data_url
+
+
+class ImageTestCase(RecipeAPITestCase):
+    """Загрузки во временный MEDIA_ROOT, обработка сразу после фиксации."""
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(
+            MEDIA_ROOT=media_root, FOODGRAM_IMAGE_WORKERS=0, FOODGRAM_MEDIA_GRACE_PERIOD=0
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def put_avatar(self, color="red"):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.put(
+                "/api/users/me/avatar/", {"avatar": image_data_url(color)}, format="json"
+            )
+        self.assertEqual(response.status_code, 200)
+        self.user.refresh_from_db()
+
+
+class AvatarTests(ImageTestCase):
+
+    def test_paths(self):
+        self.authenticate()
+        self.put_avatar()
+        # <upload_to>/<2 символа хэша>/<sha256>.<расширение>, без вложенных каталогов хэша
+        self.assertEqual(posixpath.dirname(posixpath.dirname(self.user.avatar.name)),
+                         "users/avatars")
+        for name in self.user.avatar_variants.values():
+            self.assertEqual(posixpath.dirname(posixpath.dirname(name)),
+                             "users/avatars/variants")
+            self.assertTrue(default_storage.exists(name), name)
+
+    def test_delete_avatar(self):
+        self.authenticate()
+        self.put_avatar()
+        name = self.user.avatar.name
+        variants = self.user.avatar_variants
+        self.assertEqual(set(variants), {"thumbnail", "card", "full"})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete("/api/users/me/avatar/")
+        self.assertEqual(response.status_code, 204)
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.avatar)
+        self.assertEqual(self.user.avatar_variants, {})
+        self.assertEqual(self.user.avatar_status, "ready")
+        for file_name in [name, *variants.values()]:
+            self.assertFalse(default_storage.exists(file_name), file_name)
+
+        data = self.client.get("/api/users/me/?variants=1").data
+        self.assertIsNone(data["avatar"])
+        self.assertEqual(data["avatar_variants"], {})
+
+    def test_shared_file_kept(self):
+        self.authenticate()
+        self.put_avatar()
+        self.author.avatar = self.user.avatar.name
+        self.author.save(update_fields=["avatar"])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete("/api/users/me/avatar/")
+        self.assertTrue(default_storage.exists(self.author.avatar.name))
+
+    def test_references_counted(self):
+        self.authenticate()
+        self.put_avatar()
+        names = [self.user.avatar.name, *self.user.avatar_variants.values()]
+
+        def counts():
+            return [FileReference.objects.get(name=name).count for name in names]
+
+        self.assertEqual(counts(), [1, 1, 1, 1])
+        self.author.avatar = self.user.avatar.name
+        self.author.avatar_variants = self.user.avatar_variants
+        self.author.save()
+        self.assertEqual(counts(), [2, 2, 2, 2])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete("/api/users/me/avatar/")
+        self.assertEqual(counts(), [1, 1, 1, 1])
+        self.author.delete()
+        self.assertEqual(counts(), [0, 0, 0, 0])
+
+    def test_recount_references(self):
+        self.authenticate()
+        self.put_avatar()
+        name = self.user.avatar.name
+        FileReference.objects.filter(name=name).update(count=5)
+        FileReference.objects.exclude(name=name).delete()
+        call_command("recount_counters", stdout=io.StringIO())
+        self.assertEqual(
+            dict(FileReference.objects.values_list("name", "count")),
+            {file_name: 1 for file_name in [name, *self.user.avatar_variants.values()]},
+        )
+
+    def test_delete_queries_outside_lock(self):
+        self.authenticate()
+        self.put_avatar()
+        name = self.user.avatar.name
+        lock = ContentHashStorage.lock
+        queries_under_lock = []
+
+        @contextmanager
+        def recording_lock(storage):
+            with lock(storage), CaptureQueriesContext(connection) as queries:
+                yield
+            queries_under_lock.append(len(queries))
+
+        with mock.patch.object(ContentHashStorage, "lock", recording_lock):
+            # Файл используется: одна проверка счётчика, без блокировки
+            with self.assertNumQueries(1):
+                default_storage.delete(name)
+            self.assertTrue(default_storage.exists(name))
+            self.assertEqual(queries_under_lock, [])
+
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.delete("/api/users/me/avatar/")
+        self.assertFalse(default_storage.exists(name))
+        self.assertTrue(queries_under_lock)
+        self.assertEqual(set(queries_under_lock), {0})
+
+    def test_prune(self):
+        self.authenticate()
+        self.put_avatar("red")
+        old_name = self.user.avatar.name
+        # Замена не удаляет старый файл - его удаляет rehash_media --prune
+        self.put_avatar("blue")
+        self.assertTrue(default_storage.exists(old_name))
+        call_command("rehash_media", "--prune", stdout=io.StringIO())
+        self.assertFalse(default_storage.exists(old_name))
+        self.assertTrue(default_storage.exists(self.user.avatar.name))
+        for name in self.user.avatar_variants.values():
+            self.assertTrue(default_storage.exists(name), name)
+
+    def test_rehash_nested(self):
+        self.authenticate()
+        self.put_avatar()
+        name = self.user.avatar.name
+        with default_storage.open(name) as content:
+            nested = default_storage.save(name, content)
+        self.assertNotEqual(nested, name)
+        type(self.user).objects.filter(pk=self.user.pk).update(avatar=nested)
+        call_command("rehash_media", stdout=io.StringIO())
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.avatar.name, name)
+        self.assertFalse(default_storage.exists(nested))
@@ -0,0 +1,103 @@
+import gzip
+import json
+
+import brotli
+
+from recipes.models import Ingredient
+
+from .test_recipes import RecipeAPITestCase
+
+
+class IngredientSearchTests(RecipeAPITestCase):
+    """Поиск по префиксу названия идёт по каталогу в памяти, без БД."""
+
+    def setUp(self):
+        super().setUp()
+        for name in ("Яблоко", "яблочный сок", "Ёлочная мука", "Елей", "Груша"):
+            Ingredient.objects.create(name=name, measurement_unit="г")
+
+    def search(self, **params):
+        response = self.client.get("/api/ingredients/", params)
+        self.assertEqual(response.status_code, 200)
+        return [ingredient["name"] for ingredient in response.data]
+
+    def test_prefix(self):
+        for prefix, expected in (
+            ("ябл", ["Яблоко", "яблочный сок"]),
+            ("ЯБЛОЧ", ["яблочный сок"]),
+            ("ел", ["Ёлочная мука", "Елей"]),
+            ("ёл", ["Ёлочная мука", "Елей"]),
+            ("  гру ", ["Груша"]),
+            ("инг", [f"Ингредиент {number}" for number in range(5)]),
+            ("мука", []),
+        ):
+            with self.subTest(prefix=prefix):
+                self.assertEqual(self.search(name=prefix), expected)
+
+    def test_no_queries(self):
+        self.search(name="ябл")
+        with self.assertNumQueries(0):
+            self.assertEqual(self.search(name="гр"), ["Груша"])
+
+    def test_limit(self):
+        self.assertEqual(self.search(name="ябл", limit=1), ["Яблоко"])
+        for limit in ("0", "-1", "abc"):
+            with self.subTest(limit=limit):
+                self.assertEqual(self.search(name="ябл", limit=limit), ["Яблоко", "яблочный сок"])
+
+    def test_new_ingredient(self):
+        self.search(name="ябл")
+        with self.captureOnCommitCallbacks(execute=True):
+            Ingredient.objects.create(name="Яблочное пюре", measurement_unit="г")
+        self.assertEqual(
+            self.search(name="ябл"), ["Яблоко", "яблочный сок", "Яблочное пюре"]
+        )
+
+    def test_other_params_use_database(self):
+        # ordering обрабатывает OrderingFilter, поиск - SearchFilter по ^name
+        self.assertEqual(
+            self.search(name="Инг", ordering="-id"),
+            [f"Ингредиент {number}" for number in reversed(range(5))],
+        )
+
+
+class IngredientCatalogueResponseTests(RecipeAPITestCase):
+    """Полный каталог отдаётся заранее сжатым, с ETag и Vary."""
+
+    def get(self, **headers):
+        return self.client.get("/api/ingredients/", headers=headers)
+
+    def expected(self):
+        return list(Ingredient.objects.order_by("id").values("id", "name", "measurement_unit"))
+
+    def test_encodings(self):
+        for accept_encoding, encoding, decompress in (
+            ("gzip, deflate, br", "br", brotli.decompress),
+            ("gzip", "gzip", gzip.decompress),
+            ("br;q=0, gzip", "gzip", gzip.decompress),
+            ("BR", "br", brotli.decompress),
+            ("", None, bytes),
+            ("deflate", None, bytes),
+        ):
+            with self.subTest(accept_encoding=accept_encoding):
+                response = self.get(accept_encoding=accept_encoding)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.get("Content-Encoding"), encoding)
+                self.assertIn("Accept-Encoding", response["Vary"])
+                self.assertEqual(response["Content-Type"], "application/json")
+                self.assertEqual(json.loads(decompress(response.content)), self.expected())
+
+    def test_not_modified(self):
+        etag = self.get()["ETag"]
+        with self.assertNumQueries(0):
+            response = self.get(if_none_match=etag, accept_encoding="gzip")
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+        self.assertIn("Accept-Encoding", response["Vary"])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Ingredient.objects.create(name="Новый", measurement_unit="г")
+        response = self.get(if_none_match=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(json.loads(response.content), self.expected())
@@ -0,0 +1,57 @@
+import base64
+import json
+from unittest import skipUnless
+
+from recipes.models import Recipe
+from recipes.search import is_supported, search_recipes, update_search_documents
+from users.models import Subscription
+
+from .test_recipes import RecipeAPITestCase
+
+
+def make_cursor(position, reverse=False):
+    token = json.dumps({"p": position, "r": int(reverse)})
+    return base64.urlsafe_b64encode(token.encode()).decode().rstrip("=")
+
+
+class KeysetPaginationTests(RecipeAPITestCase):
+
+    def test_invalid_cursor_values(self):
+        self.authenticate()
+        for url, position in (
+            ("/api/recipes/", [{"a": 1}, 1]),
+            ("/api/recipes/", ["2020-01-01T00:00:00+00:00", [1]]),
+            ("/api/recipes/", [None, 1]),
+            ("/api/recipes/", [1]),
+            ("/api/users/subscriptions/", [{"a": 1}]),
+            ("/api/users/subscriptions/", ["abc"]),
+        ):
+            with self.subTest(url=url, position=position):
+                response = self.client.get(url, {"cursor": make_cursor(position)})
+                self.assertEqual(response.status_code, 404)
+
+    def test_subscriptions_cursor(self):
+        self.authenticate()
+        subscription = Subscription.objects.get(user=self.user)
+        response = self.client.get(
+            "/api/users/subscriptions/", {"cursor": make_cursor([subscription.id - 1])}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item["id"] for item in response.data["results"]], [self.author.id])
+
+    @skipUnless(is_supported(), "Ранжирование поиска есть только в PostgreSQL")
+    def test_search_cursor_follows_rank(self):
+        update_search_documents([recipe.id for recipe in self.recipes])
+        expected = list(
+            search_recipes(Recipe.objects.all(), "Рецепт 1").values_list("id", flat=True)
+        )
+        found = []
+        url, params = "/api/recipes/", {"search": "Рецепт 1", "pagination": "cursor"}
+        while url and len(found) <= len(expected):
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            found += [item["id"] for item in response.data["results"]]
+            url, params = response.data["next"], None
+        self.assertEqual(found, expected)
+        # Порядок по релевантности, а не по дате публикации
+        self.assertNotEqual(expected, sorted(expected, reverse=True))
@@ -0,0 +1,276 @@
+import base64
+import io
+import shutil
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+
+from api.catalogue import ingredient_catalogue
+from recipes.models import (
+    Component, Favorite, Ingredient, Recipe, ShoppingCart, ShoppingListItem
+)
+from recipes.counters import recount
+from recipes.shopping import live_totals, refresh_shopping_lists
+from users.models import Subscription
+
+User = get_user_model()
+
+RECIPES_COUNT = 110
+
+
+def image_data_url(color="red", size=(600, 400)):
+    buffer = io.BytesIO()
+    Image.new("RGB", size, color).save(buffer, "PNG")
+    return "data:image/png;base64," + base64.b64encode(buffer.getvalue()).decode()
+
+
+class RecipeAPITestCase(APITestCase):
+    """Рецепты с ингредиентами и пользователь с избранным, корзиной и подпиской."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username="author", email="author@example.com", password="password",
+            first_name="Автор", last_name="Рецептов",
+        )
+        cls.user = User.objects.create_user(
+            username="reader", email="reader@example.com", password="password",
+            first_name="Читатель", last_name="Рецептов",
+        )
+        cls.token = Token.objects.create(user=cls.user)
+        ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f"Ингредиент {number}", measurement_unit="г")
+            for number in range(5)
+        )
+        cls.recipes = Recipe.objects.bulk_create(
+            Recipe(author=cls.author, name=f"Рецепт {number}", text="Описание",
+                   cooking_time=10)
+            for number in range(RECIPES_COUNT)
+        )
+        Component.objects.bulk_create(
+            Component(recipe=recipe, ingredient=ingredient, amount=100)
+            for recipe in cls.recipes for ingredient in ingredients
+        )
+        Favorite.objects.bulk_create(
+            Favorite(user=cls.user, recipe=recipe) for recipe in cls.recipes[::2]
+        )
+        ShoppingCart.objects.bulk_create(
+            ShoppingCart(user=cls.user, recipe=recipe) for recipe in cls.recipes[::3]
+        )
+        Subscription.objects.create(user=cls.user, subscribed_to=cls.author)
+
+    def setUp(self):
+        cache.clear()
+
+    def authenticate(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.token.key}")
+
+
+class RecipeQueryCountTests(RecipeAPITestCase):
+    """Число запросов list и retrieve не зависит от размера страницы."""
+
+    # Первый запрос: число объектов (в PostgreSQL ещё оценка pg_class),
+    # id страницы, рецепты с авторами и ингредиенты. Повторный берёт count
+    # и представления из кэша. Авторизованному добавляются токен и снимок
+    # избранного, корзины и подписок.
+    ESTIMATE_QUERIES = 1 if connection.vendor == "postgresql" else 0
+    LIST_QUERIES = {
+        False: {"cold": 4 + ESTIMATE_QUERIES, "warm": 1},
+        True: {"cold": 8 + ESTIMATE_QUERIES, "warm": 5},
+    }
+    DETAIL_QUERIES = {
+        False: {"cold": 2, "warm": 0},
+        True: {"cold": 6, "warm": 4},
+    }
+
+    def test_list(self):
+        for authenticated in (False, True):
+            for limit in (6, 100):
+                with self.subTest(authenticated=authenticated, limit=limit):
+                    cache.clear()
+                    if authenticated:
+                        self.authenticate()
+                    url = f"/api/recipes/?limit={limit}"
+                    queries = self.LIST_QUERIES[authenticated]
+                    with self.assertNumQueries(queries["cold"]):
+                        response = self.client.get(url)
+                    self.assertEqual(len(response.data["results"]), limit)
+                    self.assertEqual(response["X-Recipe-Cache"], f"hits=0, misses={limit}")
+                    with self.assertNumQueries(queries["warm"]):
+                        warm = self.client.get(url)
+                    self.assertEqual(warm.data, response.data)
+                    self.assertEqual(warm["X-Recipe-Cache"], f"hits={limit}, misses=0")
+
+    def test_detail(self):
+        recipe = self.recipes[0]
+        for authenticated in (False, True):
+            with self.subTest(authenticated=authenticated):
+                cache.clear()
+                if authenticated:
+                    self.authenticate()
+                url = f"/api/recipes/{recipe.id}/"
+                queries = self.DETAIL_QUERIES[authenticated]
+                with self.assertNumQueries(queries["cold"]):
+                    response = self.client.get(url)
+                self.assertEqual(len(response.data["ingredients"]), 5)
+                self.assertEqual(response.data["is_favorited"], authenticated)
+                self.assertEqual(response.data["is_in_shopping_cart"], authenticated)
+                self.assertEqual(response.data["author"]["is_subscribed"], authenticated)
+                with self.assertNumQueries(queries["warm"]):
+                    self.client.get(url)
+
+    def test_flags_in_list(self):
+        self.authenticate()
+        response = self.client.get("/api/recipes/?limit=100")
+        favorite_ids = set(Favorite.objects.values_list("recipe_id", flat=True))
+        cart_ids = set(ShoppingCart.objects.values_list("recipe_id", flat=True))
+        for item in response.data["results"]:
+            self.assertEqual(item["is_favorited"], item["id"] in favorite_ids)
+            self.assertEqual(item["is_in_shopping_cart"], item["id"] in cart_ids)
+            self.assertTrue(item["author"]["is_subscribed"])
+
+
+class RecipeUpdateTests(RecipeAPITestCase):
+    """PATCH записывает только изменившиеся компоненты."""
+
+    def setUp(self):
+        super().setUp()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Token {Token.objects.create(user=self.author).key}"
+        )
+        self.recipe = self.recipes[0]  # в корзине у self.user
+        self.ingredients = list(Ingredient.objects.order_by("id"))
+        # Данные класса созданы bulk_create, без сигналов
+        recount(Ingredient, "recipes_count", Component, "ingredient")
+        refresh_shopping_lists([self.user.id], [ingredient.id for ingredient in self.ingredients])
+
+    def patch(self, amounts, **fields):
+        data = {
+            "ingredients": [
+                {"id": ingredient.id, "amount": amount} for ingredient, amount in amounts
+            ],
+            **fields,
+        }
+        with self.captureOnCommitCallbacks(execute=True), \
+                CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(f"/api/recipes/{self.recipe.id}/", data, format="json")
+        self.assertEqual(response.status_code, 200, response.data)
+        return response, [query["sql"] for query in queries]
+
+    def stored(self):
+        return dict(self.recipe.components.values_list("ingredient_id", "amount"))
+
+    def assert_shopping_list(self):
+        self.assertEqual(
+            dict(ShoppingListItem.objects.filter(user=self.user).values_list(
+                "ingredient_id", "amount"
+            )),
+            {ingredient_id: amount for user_id, ingredient_id, amount in live_totals()
+             if user_id == self.user.id},
+        )
+
+    def test_unchanged(self):
+        # Токен, рецепт с компонентами (с ними же сравнивается список),
+        # ингредиенты запроса, точка сохранения транзакции (2), компоненты
+        # для ответа и снимок избранного, корзины и подписок автора (3)
+        with self.assertNumQueries(10):
+            response, queries = self.patch(
+                [(ingredient, 100) for ingredient in self.ingredients],
+                name=self.recipe.name,
+            )
+        self.assertFalse([
+            sql for sql in queries
+            if sql.startswith(("INSERT", "UPDATE", "DELETE"))
+        ])
+        self.assertEqual(len(response.data["ingredients"]), 5)
+
+    def test_changed_amount(self):
+        first, *rest = self.ingredients
+        response, queries = self.patch([(first, 250), *((ingredient, 100) for ingredient in rest)])
+        self.assertEqual(self.stored()[first.id], 250)
+        self.assertEqual(
+            [sql for sql in queries if sql.startswith(("INSERT", "DELETE"))
+             and "recipes_component" in sql.split("(")[0]], []
+        )
+        self.assert_shopping_list()
+
+    def test_added_ingredient(self):
+        new = Ingredient.objects.create(name="Новый", measurement_unit="г")
+        self.patch([*((ingredient, 100) for ingredient in self.ingredients), (new, 30)])
+        self.assertEqual(self.stored()[new.id], 30)
+        self.assertEqual(len(self.stored()), 6)
+        new.refresh_from_db()
+        self.assertEqual(new.recipes_count, 1)
+        self.assert_shopping_list()
+
+    def test_removed_ingredient(self):
+        removed, *kept = self.ingredients
+        count = Ingredient.objects.get(pk=removed.pk).recipes_count
+        self.patch([(ingredient, 100) for ingredient in kept])
+        self.assertNotIn(removed.id, self.stored())
+        self.assertEqual(Ingredient.objects.get(pk=removed.pk).recipes_count, count - 1)
+        self.assert_shopping_list()
+
+
+class RecipeIngredientsValidationTests(RecipeAPITestCase):
+    """Ингредиенты рецепта находятся одним запросом, ошибки - как у поля id."""
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.authenticate()
+        self.ingredients = list(Ingredient.objects.order_by("id"))
+
+    def post(self, ingredients):
+        return self.client.post("/api/recipes/", {
+            "name": "Новый", "text": "Описание", "cooking_time": 5,
+            "image": image_data_url(), "ingredients": ingredients,
+        }, format="json")
+
+    def ingredient_queries(self, queries):
+        return [
+            query["sql"] for query in queries
+            if query["sql"].startswith("SELECT") and 'FROM "recipes_ingredient"' in query["sql"]
+        ]
+
+    def test_single_query(self):
+        ingredients = [{"id": ingredient.id, "amount": 10} for ingredient in self.ingredients]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.post(ingredients)
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(len(self.ingredient_queries(queries)), 1)
+
+    def test_loaded_catalogue(self):
+        # Загруженный каталог заменяет и этот запрос
+        self.client.get("/api/ingredients/")
+        self.assertIsNotNone(ingredient_catalogue.get_many([self.ingredients[0].id]))
+        ingredients = [{"id": ingredient.id, "amount": 10} for ingredient in self.ingredients]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.post(ingredients)
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(self.ingredient_queries(queries), [])
+
+    def test_errors(self):
+        first = self.ingredients[0]
+        for ingredients, errors in (
+            ([{"id": first.id, "amount": 10}, {"id": 10 ** 6, "amount": 10}],
+             [{}, {"id": [f'Недопустимый первичный ключ "{10 ** 6}" - объект не существует.']}]),
+            ([{"id": first.id, "amount": 10}, {"id": first.id, "amount": 20}],
+             ["Ингредиенты должны быть уникальными"]),
+        ):
+            with self.subTest(ingredients=ingredients):
+                response = self.post(ingredients)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json(), {"ingredients": errors})
+        self.assertFalse(Recipe.objects.filter(name="Новый").exists())
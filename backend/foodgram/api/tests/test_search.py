@@ -0,0 +1,40 @@
+from unittest import skipUnless
+
+from recipes.models import Component, Ingredient, Recipe
+from recipes.search import is_supported
+
+from .test_recipes import RecipeAPITestCase
+
+
+class RecipeSearchTests(RecipeAPITestCase):
+    """?search= по названию, ингредиентам и описанию рецепта."""
+
+    def setUp(self):
+        super().setUp()
+        beet = Ingredient.objects.create(name="Свёкла", measurement_unit="г")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.in_name = self.create("Борщ", "Описание")
+            self.in_text = self.create("Суп дня", "Почти как Борщ, но проще")
+            self.in_ingredients = self.create("Салат", "Описание")
+            Component.objects.create(recipe=self.in_ingredients, ingredient=beet, amount=50)
+
+    def create(self, name, text):
+        return Recipe.objects.create(author=self.author, name=name, text=text, cooking_time=5)
+
+    def search(self, query):
+        response = self.client.get("/api/recipes/", {"search": query, "limit": 50})
+        self.assertEqual(response.status_code, 200)
+        return [recipe["id"] for recipe in response.data["results"]]
+
+    def test_fields(self):
+        self.assertEqual(set(self.search("Борщ")), {self.in_name.id, self.in_text.id})
+        self.assertEqual(self.search("Свёкла"), [self.in_ingredients.id])
+        self.assertEqual(self.search("ананас"), [])
+
+    @skipUnless(is_supported(), "Ранжирование поиска есть только в PostgreSQL")
+    def test_ranking(self):
+        # Совпадение в названии важнее совпадения в описании, хотя рецепт
+        # с описанием опубликован позже
+        self.assertEqual(self.search("борщ"), [self.in_name.id, self.in_text.id])
+        # Словоформы приводятся к основе по словарю
+        self.assertEqual(self.search("борщи"), [self.in_name.id, self.in_text.id])
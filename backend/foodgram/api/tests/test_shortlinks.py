@@ -0,0 +1,73 @@
+import io
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import override_settings
+
+from recipes.models import Recipe
+from recipes.shortlinks import encode, map_path
+
+from .test_recipes import RecipeAPITestCase
+
+
+class ShortLinkTests(RecipeAPITestCase):
+    """Проверка коротких ссылок по битовой карте, без запросов к БД."""
+
+    def setUp(self):
+        super().setUp()
+        # Прогрев карты id
+        self.client.get(f"/s/{self.recipes[0].id}/")
+
+    def test_redirect(self):
+        recipe = self.recipes[0]
+        with self.assertNumQueries(0):
+            response = self.client.get(f"/r/{encode(recipe.id)}/")
+        self.assertRedirects(
+            response, f"/recipes/{recipe.id}/", fetch_redirect_response=False
+        )
+
+    def test_unknown(self):
+        max_id = max(recipe.id for recipe in self.recipes)
+        for url in ("/r/zzzzzz/", f"/s/{max_id + 1}/", f"/r/{encode(max_id + 1000)}/"):
+            with self.subTest(url=url):
+                with self.assertNumQueries(0):
+                    self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_created_and_deleted(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe = Recipe.objects.create(
+                author=self.author, name="Новый", text="Описание", cooking_time=5
+            )
+        url = f"/r/{encode(recipe.id)}/"
+        self.assertEqual(self.client.get(url).status_code, 302)
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.delete()
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_delete_invalidates_map(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        with override_settings(MEDIA_ROOT=media_root):
+            call_command("export_shortlinks", output=map_path(), stdout=io.StringIO())
+            self.assertTrue(os.path.exists(map_path()))
+            with self.captureOnCommitCallbacks(execute=True):
+                Recipe.objects.filter(pk=self.recipes[0].id).delete()
+            self.assertFalse(os.path.exists(map_path()))
+
+    def test_export_hash_size(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        with override_settings(MEDIA_ROOT=media_root), mock.patch(
+            "recipes.management.commands.export_shortlinks.DEFAULT_HASH_SIZE", 0
+        ):
+            call_command("export_shortlinks", output=map_path(), stdout=io.StringIO())
+            with open(map_path()) as file:
+                entries = len(file.readlines())
+            with open(os.path.splitext(map_path())[0] + ".conf") as file:
+                directive, size = file.read().rstrip(";\n").split()
+        self.assertEqual(entries, 2 * len(self.recipes))
+        self.assertEqual(directive, "map_hash_max_size")
+        self.assertGreaterEqual(int(size), entries)
@@ -0,0 +1,42 @@
+from functools import cached_property
+
+from recipes.models import Favorite, ShoppingCart
+from users.models import Subscription
+
+
+class Viewer:
+    """Снимок связей текущего пользователя: избранное, корзина и подписки.
+
+    Каждое множество загружается одним запросом при первом обращении
+    и дальше переиспользуется всеми сериализаторами в рамках запроса.
+    """
+
+    def __init__(self, user):
+        self.user = user
+
+    def _ids(self, queryset, field):
+        if self.user is None or self.user.is_anonymous:
+            return frozenset()
+        return frozenset(queryset.filter(user=self.user).values_list(field, flat=True))
+
+    @cached_property
+    def favorite_ids(self):
+        return self._ids(Favorite.objects, "recipe_id")
+
+    @cached_property
+    def cart_ids(self):
+        return self._ids(ShoppingCart.objects, "recipe_id")
+
+    @cached_property
+    def subscribed_ids(self):
+        return self._ids(Subscription.objects, "subscribed_to_id")
+
+
+def get_viewer(request):
+    """Возвращает снимок связей пользователя, общий для всего запроса."""
+    if request is None:
+        return Viewer(None)
+    viewer = getattr(request, "_foodgram_viewer", None)
+    if viewer is None:
+        viewer = request._foodgram_viewer = Viewer(request.user)
+    return viewer
@@ -1,25 +1,35 @@
-import io
-from datetime import datetime
-from django.shortcuts import get_object_or_404
 from django.urls import reverse
-from django.http import Http404, FileResponse
+from django.http import Http404, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, quote_etag
 from django_filters.rest_framework import DjangoFilterBackend
 from django.db import models
-from django.db.models import Sum
-from django.template.loader import render_to_string
+from django.db.models import Prefetch
 from rest_framework import filters, status, viewsets
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from api.pagination import LimitPageNumberPagination
+from rest_framework.renderers import JSONRenderer
+from api.catalogue import IngredientCatalogueMixin
+from api.collections import add_to_collection, remove_from_collection
+from api.conditional import ConditionalGetMixin
+from api.exports import ShoppingListExport
+from api.pagination import OptionalCursorPagination
+from api.representations import RecipeRepresentationMixin
+from recipes.cache import get_versions, recipe_scope, user_scope, viewer_scopes
 from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart, Component
-from api.filters import NameSearchFilter, RecipeFilter
+from recipes.search import is_supported
+from recipes.shortlinks import encode, live_recipe_ids
+from api.filters import NameSearchFilter, RecipeFilter, RecipeSearchFilter
 from api.permissions import AuthorOrReadOnly
+from api.renderers import CSVRenderer, PlainTextRenderer
+from api.serializers.batch import IdListSerializer
 from api.serializers.recipes.recipe import IngredientSerializer, RecipeSerializer
 from api.serializers.recipes.shared import RecipeShortSerializer
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(ConditionalGetMixin, IngredientCatalogueMixin,
+                        viewsets.ReadOnlyModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     filter_backends = (
@@ -31,33 +41,80 @@ class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     ordering = ("id",)
     pagination_class = None  # Отключаем пагинацию для ингредиентов
 
+    def get_version_scopes(self):
+        return ["ingredients"]
 
-class RecipeViewSet(viewsets.ModelViewSet):
+
+class RecipeViewSet(ConditionalGetMixin, RecipeRepresentationMixin, viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
     serializer_class = RecipeSerializer
     permission_classes = (AuthorOrReadOnly,)
-    filter_backends = (DjangoFilterBackend,)
+    filter_backends = (DjangoFilterBackend, RecipeSearchFilter)
     filterset_class = RecipeFilter
     search_fields = ("name",)
-    pagination_class = LimitPageNumberPagination
+    pagination_class = OptionalCursorPagination
+
+    @property
+    def keyset_ordering(self):
+        # Курсор по результатам поиска идёт в порядке релевантности, как
+        # и постраничная выдача; без ранжирования (не PostgreSQL) - по дате
+        if self.request.query_params.get("search", "").strip() and is_supported():
+            return ("-rank", "-publish_date", "-id")
+        return ("-publish_date", "-id")
+
+    def get_queryset(self):
+        # Автор и ингредиенты загружаются вместе с рецептами, чтобы число
+        # запросов не зависело от размера страницы. Флаги пользователя
+        # сериализаторы берут из снимка api.viewer.Viewer.
+        if self.action in ("favorite", "shopping_cart"):
+            return Recipe.objects.only("id", "name", "image", "cooking_time")
+        return Recipe.objects.select_related("author").prefetch_related(
+            Prefetch("components", queryset=Component.objects.select_related("ingredient"))
+        )
+
+    def get_version_scopes(self):
+        scopes = viewer_scopes(self.request.user)
+        if self.action == "retrieve":
+            # Та же область, что повышают записи: "01" - это рецепт 1, а для
+            # нечисловых pk версия не создаётся
+            pk = self.kwargs["pk"]
+            if not pk.isdigit():
+                raise Http404
+            return [recipe_scope(int(pk)), *scopes]
+        return ["recipes", "users", *scopes]
+
+    def get_count_scopes(self):
+        """Области данных, от которых зависит число рецептов в выдаче."""
+        scopes = ["recipes"]
+        user = self.request.user
+        if user.is_authenticated:
+            if "is_favorited" in self.request.query_params:
+                scopes.append(user_scope("favorites", user.id))
+            if "is_in_shopping_cart" in self.request.query_params:
+                scopes.append(user_scope("carts", user.id))
+        return scopes
 
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
     @action(methods=["get"], detail=True, url_path="get-link", url_name="get-link")
     def get_link(self, request, pk=None):
+        # Существование рецепта проверяется по карте id в памяти процесса
+        if not pk.isdigit() or int(pk) not in live_recipe_ids:
+            raise Http404
         short_url = request.build_absolute_uri(
-            reverse("shortlink-redirect", kwargs={"recipe_id": pk})
+            reverse("shortcode-redirect", kwargs={"code": encode(int(pk))})
         )
         return Response({"short-link": short_url}, status=status.HTTP_200_OK)
 
     def _user_collection(self, request, collection: models.Model):
         recipe = self.get_object()
+        # Одна запись INSERT ... ON CONFLICT DO NOTHING RETURNING или
+        # DELETE ... RETURNING: одновременные повторные запросы не приводят
+        # к IntegrityError, а получают 400
         if request.method == "DELETE":
-            try:
-                get_object_or_404(collection, user=request.user, recipe=recipe).delete()
-                return Response(status=status.HTTP_204_NO_CONTENT)
-            except Http404:  # если элемента в коллекции нет, то возвращаем 400
+            if not remove_from_collection(collection, request.user.id, [recipe.id]):
+                # если элемента в коллекции нет, то возвращаем 400
                 return Response(
                     status=status.HTTP_400_BAD_REQUEST,  # НЕ 404!!! Ревьюер - читай ТЗ!
                     data={"errors": f"В {collection._meta.verbose_name} нет рецепта {recipe.name}"}
@@ -69,54 +126,93 @@ class RecipeViewSet(viewsets.ModelViewSet):
             # '400':
             #     description: 'Ошибка удаления из списка покупок
             #                   (Например, когда рецепта там не было)'
+            return Response(status=status.HTTP_204_NO_CONTENT)
 
         # POST method
-        recipe_in_collection, created = collection.objects.get_or_create(
-            user=request.user, recipe=recipe
-        )
-        if not created:  # если рецепт уже в коллекции, то возвращаем 400
+        if not add_to_collection(collection, request.user.id, [recipe.id]):
+            # если рецепт уже в коллекции, то возвращаем 400
             return Response(
                 status=status.HTTP_400_BAD_REQUEST,
                 data={"errors": f"Рецепт {recipe.name} уже в {collection._meta.verbose_name}"},
             )
-        # если рецепта нет в коллекции, то добавляем и возвращаем 201
-        recipe_in_collection.save()
         return Response(
             status=status.HTTP_201_CREATED,
             data=RecipeShortSerializer(recipe).data,
         )
 
+    def _user_collection_batch(self, request, collection: models.Model):
+        """Пакетное добавление (POST) или удаление (DELETE) рецептов.
+
+        Рецепты проверяются одним запросом, изменения записываются одним
+        INSERT ... RETURNING или DELETE ... RETURNING. Для каждого id
+        возвращается тот статус, который вернул бы одиночный запрос.
+        """
+        serializer = IdListSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data["ids"]
+        names = dict(Recipe.objects.filter(id__in=ids).values_list("id", "name"))
+        delete = request.method == "DELETE"
+        write = remove_from_collection if delete else add_to_collection
+        changed = set(write(collection, request.user.id, list(names)))
+        verbose_name = collection._meta.verbose_name
+        results = []
+        for recipe_id in ids:
+            if recipe_id in changed:
+                results.append({
+                    "id": recipe_id,
+                    "status": status.HTTP_204_NO_CONTENT if delete else status.HTTP_201_CREATED,
+                })
+            elif recipe_id not in names:
+                results.append({
+                    "id": recipe_id,
+                    "status": status.HTTP_404_NOT_FOUND,
+                    "errors": "Рецепт не найден",
+                })
+            else:
+                results.append({
+                    "id": recipe_id,
+                    "status": status.HTTP_400_BAD_REQUEST,
+                    "errors": f"В {verbose_name} нет рецепта {names[recipe_id]}" if delete
+                    else f"Рецепт {names[recipe_id]} уже в {verbose_name}",
+                })
+        return Response({"results": results})
+
     @action(methods=["post", "delete"], detail=True,
             permission_classes=[IsAuthenticated])
     def favorite(self, request, pk=None):
         return self._user_collection(request, Favorite)
 
+    @action(methods=["post", "delete"], detail=False, url_path="favorite/batch",
+            permission_classes=[IsAuthenticated])
+    def favorite_batch(self, request):
+        return self._user_collection_batch(request, Favorite)
+
     @action(methods=["post", "delete"], detail=True,
             permission_classes=[IsAuthenticated])
     def shopping_cart(self, request, pk=None):
         return self._user_collection(request, ShoppingCart)
 
-    @action(['get'], detail=False, permission_classes=(IsAuthenticated,))
+    @action(methods=["post", "delete"], detail=False, url_path="shopping_cart/batch",
+            permission_classes=[IsAuthenticated])
+    def shopping_cart_batch(self, request):
+        return self._user_collection_batch(request, ShoppingCart)
+
+    @action(['get'], detail=False, permission_classes=(IsAuthenticated,),
+            renderer_classes=(PlainTextRenderer, CSVRenderer, JSONRenderer))
     def download_shopping_cart(self, request):
-        products = (
-            Component.objects
-            .filter(recipe__shopping_carts__user=request.user)
-            .values("ingredient__name", "ingredient__measurement_unit")
-            .annotate(amount=Sum("amount"))
-            .order_by("ingredient__name")
-        )
-        recipes = Recipe.objects.filter(shopping_carts__user=request.user).distinct()
-        content = render_to_string(
-            "shopping_cart.txt",
-            {
-                "products": products,
-                "recipes": recipes,
-                "date": datetime.now(),
-            },
-        )
-        return FileResponse(
-            io.BytesIO(content.encode('utf-8')),
-            content_type='text/plain; charset=utf-8',
-            as_attachment=True,
-            filename='shopping_cart.txt',
-        )
+        """Список покупок в формате ?format=txt|csv|json (по умолчанию txt)."""
+        format = request.accepted_renderer.format
+        etag = quote_etag("{}-{}".format(format, "-".join(map(str, get_versions(
+            user_scope("carts", request.user.id), "recipes", "users"
+        ).values()))))
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            export = ShoppingListExport(request.user)
+            response = StreamingHttpResponse(
+                export.render(format), content_type=export.content_types[format]
+            )
+            response["Content-Disposition"] = content_disposition_header(
+                as_attachment=True, filename=f"shopping_cart.{format}"
+            )
+        response["ETag"] = etag
+        return response
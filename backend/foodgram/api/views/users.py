@@ -1,39 +1,77 @@
 from django.contrib.auth import get_user_model
-from django.shortcuts import get_object_or_404
-from django.http import Http404
+from django.db import transaction
+from django.db.models import F, prefetch_related_objects
 from djoser.views import UserViewSet
 from rest_framework import status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from api.pagination import LimitPageNumberPagination
-from users.models import Subscription
-from api.serializers.users import UserWithRecipesSerializer, AvatarSerializer
+from api.collections import add_to_collection, remove_from_collection
+from api.conditional import ConditionalGetMixin
+from api.pagination import OptionalCursorPagination
+from api.serializers.batch import IdListSerializer
+from recipes.cache import user_scope, viewer_scopes
+from recipes.images import delete_files
+from users.models import ImageStatus, Subscription
+from api.serializers.users import (
+    AvatarSerializer, UserWithRecipesSerializer, get_recipes_limit, limited_recipes
+)
 
 
 User = get_user_model()
 
 
-class FoodgramUserViewSet(UserViewSet):
+class FoodgramUserViewSet(ConditionalGetMixin, UserViewSet):
     """ViewSet для работы с пользователями и подписками."""
-    pagination_class = LimitPageNumberPagination
+    pagination_class = OptionalCursorPagination
+
+    @property
+    def keyset_ordering(self):
+        if self.action == 'subscriptions':
+            return ('subscription_id',)
+        return ('id',)
+
+    def get_version_scopes(self):
+        scopes = ['users', *viewer_scopes(self.request.user)]
+        if self.action == 'subscriptions':
+            scopes.append('recipes')  # в выдаче есть рецепты авторов
+        return scopes
+
+    def get_count_scopes(self):
+        if self.action == 'subscriptions':
+            return [user_scope('subscriptions', self.request.user.id)]
+        return ['users']
 
     def get_queryset(self):
         if self.action == 'me':
             return User.objects.filter(id=self.request.user.id)
         if self.action == 'subscriptions':
-            return User.objects.filter(subscriptions__user=self.request.user)
+            # Авторы, на которых подписан пользователь, в порядке подписки
+            return (
+                User.objects.filter(authors__user=self.request.user)
+                .annotate(subscription_id=F('authors__id'))
+                .order_by('subscription_id')
+                .prefetch_related(limited_recipes(get_recipes_limit(self.request)))
+            )
         return super().get_queryset()
 
     @action(['put', 'delete'], detail=False, url_path='me/avatar',
             serializer_class=AvatarSerializer, permission_classes=(IsAuthenticated,))
     def me_avatar(self, request, *args, **kwargs):
         if request.method == 'DELETE':
-            request.user.avatar.delete()
+            user = request.user
+            name, variants = user.avatar.name, user.avatar_variants
+            # Сначала запись перестаёт ссылаться на файлы, иначе хранилище их не удалит
+            user.avatar = None
+            user.avatar_variants = {}
+            user.avatar_status = ImageStatus.READY
+            user.save(update_fields=['avatar', 'avatar_variants', 'avatar_status'])
+            transaction.on_commit(lambda: delete_files(name, variants))
             return Response(status=status.HTTP_204_NO_CONTENT)
         return self.me(request, *args, **kwargs)
 
-    @action(['get'], detail=False, serializer_class=UserWithRecipesSerializer)
+    @action(['get'], detail=False, serializer_class=UserWithRecipesSerializer,
+            permission_classes=(IsAuthenticated,))
     def subscriptions(self, request, *args, **kwargs):
         return self.list(request, *args, **kwargs)
 
@@ -47,11 +85,8 @@ class FoodgramUserViewSet(UserViewSet):
                             data={'errors': f"Нельзя {'от' if method_delete else 'под'}писаться "
                                             f"{'от' if method_delete else 'на'} самого себя"})
         if method_delete:
-            try:
-                get_object_or_404(Subscription, user=request.user, subscribed_to=user_to_subscribe
-                                  ).delete()
-                return Response(status=status.HTTP_204_NO_CONTENT)
-            except Http404:  # если подписки нет, то возвращаем 400 (НЕ 404!!! Ревьюер - читай ТЗ!)
+            if not remove_from_collection(Subscription, request.user.id, [user_to_subscribe.id]):
+                # если подписки нет, то возвращаем 400 (НЕ 404!!! Ревьюер - читай ТЗ!)
                 return Response(
                     status=status.HTTP_400_BAD_REQUEST,
                     data={'errors': f'Вы не подписаны на пользователя {user_to_subscribe.username}'}
@@ -60,18 +95,55 @@ class FoodgramUserViewSet(UserViewSet):
             # '400':
             #   description: 'Ошибка подписки
             #                 (Например, если уже подписан или при подписке на себя самого)'
+            return Response(status=status.HTTP_204_NO_CONTENT)
 
         # POST method
-        subscription, created = Subscription.objects.get_or_create(
-            user=request.user,
-            subscribed_to=user_to_subscribe
-        )
-        if not created:
+        if not add_to_collection(Subscription, request.user.id, [user_to_subscribe.id]):
             return Response(
                 status=status.HTTP_400_BAD_REQUEST,
                 data={
                     'errors': f'Вы уже подписаны на пользователя {user_to_subscribe.username}'
                 },
             )
+        prefetch_related_objects(
+            [user_to_subscribe], limited_recipes(get_recipes_limit(request))
+        )
         serializer = UserWithRecipesSerializer(user_to_subscribe, context={'request': request})
         return Response(status=status.HTTP_201_CREATED, data=serializer.data)
+
+    @action(['post', 'delete'], detail=False, url_path='subscribe/batch',
+            permission_classes=(IsAuthenticated,))
+    def subscribe_batch(self, request, *args, **kwargs):
+        """Пакетная подписка (POST) или отписка (DELETE) по списку id авторов.
+
+        Авторы проверяются одним запросом, изменения записываются одним
+        INSERT ... RETURNING или DELETE ... RETURNING. Для каждого id
+        возвращается тот статус, который вернул бы одиночный subscribe.
+        """
+        serializer = IdListSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data['ids']
+        usernames = dict(User.objects.filter(id__in=ids).values_list('id', 'username'))
+        delete = request.method == 'DELETE'
+        write = remove_from_collection if delete else add_to_collection
+        changed = set(write(Subscription, request.user.id, [
+            author_id for author_id in usernames if author_id != request.user.id
+        ]))
+        results = []
+        for author_id in ids:
+            if author_id in changed:
+                results.append({'id': author_id, 'status': status.HTTP_204_NO_CONTENT
+                                if delete else status.HTTP_201_CREATED})
+            elif author_id not in usernames:
+                results.append({'id': author_id, 'status': status.HTTP_404_NOT_FOUND,
+                                'errors': 'Пользователь не найден'})
+            elif author_id == request.user.id:
+                results.append({'id': author_id, 'status': status.HTTP_400_BAD_REQUEST,
+                                'errors': f"Нельзя {'от' if delete else 'под'}писаться "
+                                          f"{'от' if delete else 'на'} самого себя"})
+            else:
+                username = usernames[author_id]
+                results.append({'id': author_id, 'status': status.HTTP_400_BAD_REQUEST,
+                                'errors': f'Вы не подписаны на пользователя {username}' if delete
+                                else f'Вы уже подписаны на пользователя {username}'})
+        return Response({'results': results})
@@ -25,6 +25,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "rest_framework",
     "rest_framework.authtoken",
     "django_filters",
@@ -87,6 +88,23 @@ DATABASES = {
 #     }
 # }
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Версии данных, счётчики пагинации и представления рецептов хранятся в
+# кэше, общем для всех процессов gunicorn и management-команд (Redis из
+# docker-compose.yml): иначе инвалидация из одного процесса не дойдёт до
+# остальных. Для локального запуска в один процесс можно указать
+# CACHE_BACKEND=django.core.cache.backends.locmem.LocMemCache.
+
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv(
+            "CACHE_BACKEND", "django.core.cache.backends.redis.RedisCache"
+        ),
+        "LOCATION": os.getenv("CACHE_LOCATION", "redis://redis:6379/0"),
+    }
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -117,6 +135,24 @@ REST_FRAMEWORK = {
     "PAGE_SIZE": 6,
 }
 
+# Точные значения count кэшируются на указанное число секунд, а для
+# нефильтрованных списков больше порога отдаётся оценка планировщика.
+FOODGRAM_COUNT_CACHE_TIMEOUT = int(os.getenv("FOODGRAM_COUNT_CACHE_TIMEOUT", 300))
+FOODGRAM_ESTIMATED_COUNT_THRESHOLD = int(
+    os.getenv("FOODGRAM_ESTIMATED_COUNT_THRESHOLD", 100_000)
+)
+# Время жизни закэшированных представлений рецептов, в секундах
+FOODGRAM_RECIPE_CACHE_TIMEOUT = int(os.getenv("FOODGRAM_RECIPE_CACHE_TIMEOUT", 24 * 60 * 60))
+# Время жизни версий отдельных рецептов и коллекций пользователей, в секундах
+FOODGRAM_VERSION_TIMEOUT = int(os.getenv("FOODGRAM_VERSION_TIMEOUT", 24 * 60 * 60))
+# Ограничения загружаемых изображений (Base64ImageField) и их фоновая
+# обработка: наибольшая сторона после пережатия и число потоков
+# (0 - обрабатывать сразу после сохранения, в том же запросе)
+FOODGRAM_IMAGE_MAX_BYTES = int(os.getenv("FOODGRAM_IMAGE_MAX_BYTES", 5 * 1024 * 1024))
+FOODGRAM_IMAGE_MAX_PIXELS = int(os.getenv("FOODGRAM_IMAGE_MAX_PIXELS", 25_000_000))
+FOODGRAM_IMAGE_MAX_SIDE = int(os.getenv("FOODGRAM_IMAGE_MAX_SIDE", 2048))
+FOODGRAM_IMAGE_WORKERS = int(os.getenv("FOODGRAM_IMAGE_WORKERS", 2))
+
 
 DJOSER = {
     "LOGIN_FIELD": "email",
@@ -169,6 +205,16 @@ STATIC_ROOT = BASE_DIR / "collected_static"
 MEDIA_URL = "/media/"
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 
+# Загрузки хранятся под именами по содержимому (api.storage), одинаковые
+# файлы - один раз; nginx отдаёт их с Cache-Control: immutable
+STORAGES = {
+    "default": {"BACKEND": "api.storage.ContentHashStorage"},
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+}
+# Файлы без ссылок, сохранённые раньше этого числа секунд назад, удаляются
+# сразу; более новые - командой rehash_media --prune
+FOODGRAM_MEDIA_GRACE_PERIOD = int(os.getenv("FOODGRAM_MEDIA_GRACE_PERIOD", 60 * 60))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
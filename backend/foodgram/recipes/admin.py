@@ -1,8 +1,9 @@
 from django.contrib import admin
 from django.utils.safestring import mark_safe
 from django.contrib.admin import SimpleListFilter
-from django.db.models import Min, Max
+from django.db.models import Min, Max, Q
 from .models import Component, Ingredient, Recipe
+from .search import search_recipes
 
 
 # Inline-класс для компонентов
@@ -88,9 +89,14 @@ class RecipeAdmin(admin.ModelAdmin):
     list_filter = ("author", CookingTimeFilter)
     inlines = [ComponentInline]
 
-    @admin.display(description="В избранном")
-    def favorites_count(self, obj):
-        return obj.favorites.count()
+    def get_search_results(self, request, queryset, search_term):
+        """Поиск по поисковому документу рецепта или по нику автора."""
+        if not search_term:
+            return queryset, False
+        found = search_recipes(Recipe.objects.all(), search_term).values("pk")
+        return queryset.filter(
+            Q(pk__in=found) | Q(author__username__icontains=search_term)
+        ), False
 
     @admin.display(description="Продукты")
     @mark_safe
@@ -113,7 +119,3 @@ class IngredientAdmin(admin.ModelAdmin):
     list_display = ("name", "measurement_unit", "recipes_count")
     search_fields = ("name", "measurement_unit")
     list_filter = ("measurement_unit",)
-
-    @admin.display(description="Рецепты")
-    def recipes_count(self, obj):
-        return obj.components.count()
@@ -0,0 +1,63 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+VERSION_KEY = "foodgram:version:{}"
+
+
+def _stamp():
+    # Метка времени в наносекундах: после вытеснения ключа из кэша новая
+    # версия не совпадёт ни с одной из выданных ранее.
+    return time.time_ns()
+
+
+def _timeout(scope):
+    # Областей отдельных объектов ("recipe:<id>", "favorites:<id>") столько
+    # же, сколько объектов, и запрос любого id создаёт ключ, поэтому они
+    # истекают. Истёкшая версия заменяется новой, то есть кэш лишь промахнётся.
+    return settings.FOODGRAM_VERSION_TIMEOUT if ":" in scope else None
+
+
+def get_versions(*scopes):
+    """Возвращает версии областей данных одним обращением к кэшу.
+
+    Область без версии (новая или вытесненная) получает свежую метку,
+    то есть считается изменённой.
+    """
+    keys = {VERSION_KEY.format(scope): scope for scope in scopes}
+    found = cache.get_many(keys)
+    versions = {}
+    for key, scope in keys.items():
+        if key not in found:
+            cache.add(key, _stamp(), timeout=_timeout(scope))
+            found[key] = cache.get(key)
+        versions[scope] = found[key]
+    return versions
+
+
+def bump_versions(*scopes):
+    """Помечает области данных изменёнными."""
+    stamp = _stamp()
+    by_timeout = {}
+    for scope in scopes:
+        by_timeout.setdefault(_timeout(scope), {})[VERSION_KEY.format(scope)] = stamp
+    for timeout, values in by_timeout.items():
+        cache.set_many(values, timeout=timeout)
+
+
+def user_scope(name, user_id):
+    """Область данных конкретного пользователя, например избранное."""
+    return f"{name}:{user_id}"
+
+
+def recipe_scope(recipe_id):
+    """Область данных одного рецепта: поля, ингредиенты, автор и его аватар."""
+    return f"recipe:{recipe_id}"
+
+
+def viewer_scopes(user):
+    """Области данных, от которых зависят флаги пользователя в ответах."""
+    if user.is_anonymous:
+        return []
+    return [user_scope(name, user.id) for name in ("favorites", "carts", "subscriptions")]
@@ -0,0 +1,45 @@
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from users.models import Subscription
+from .models import Component, Favorite, Ingredient, Recipe
+
+User = get_user_model()
+
+# Денормализованные счётчики: (модель, поле, модель связей, внешний ключ
+# связи на модель). Значение поля - число связей, указывающих на объект.
+COUNTERS = (
+    (Recipe, "favorites_count", Favorite, "recipe"),
+    (Ingredient, "recipes_count", Component, "ingredient"),
+    (User, "recipes_count", Recipe, "author"),
+    (User, "subscriptions_count", Subscription, "user"),
+    (User, "followers_count", Subscription, "subscribed_to"),
+)
+
+
+def change_counter(model, field, pks, delta):
+    """Атомарно меняет счётчик объектов на delta (UPDATE ... SET x = x + delta)."""
+    if not pks:
+        return
+    lookups = {"pk__in": pks}
+    if delta < 0:  # не уходим ниже нуля, даже если счётчик разошёлся с данными
+        lookups[f"{field}__gte"] = -delta
+    model.objects.filter(**lookups).update(**{field: F(field) + delta})
+
+
+def actual_count(related_model, foreign_key):
+    """Подзапрос с числом связей, указывающих на объект внешнего запроса."""
+    return Coalesce(Subquery(
+        related_model.objects.filter(**{foreign_key: OuterRef("pk")})
+        .order_by()
+        .values(foreign_key)
+        .annotate(count=Count("pk"))
+        .values("count")
+    ), Value(0))
+
+
+def recount(model, field, related_model, foreign_key):
+    """Исправляет разошедшиеся значения счётчика, возвращает их число."""
+    count = actual_count(related_model, foreign_key)
+    return model.objects.exclude(**{field: count}).update(**{field: count})
@@ -0,0 +1,259 @@
+import io
+import logging
+import os
+import posixpath
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps
+
+from users.models import ImageStatus
+from .cache import bump_versions, recipe_scope
+from .counters import change_counter
+from .models import FileReference, Recipe
+
+logger = logging.getLogger(__name__)
+
+# Форматы, которые перекодируются; остальные (например, анимированный GIF)
+# сохраняются как есть
+SAVE_OPTIONS = {
+    "JPEG": {"quality": 85, "optimize": True, "progressive": True},
+    "PNG": {"optimize": True},
+    "WEBP": {"quality": 85, "method": 6},
+}
+
+# Модели с изображениями и их поля
+IMAGE_FIELDS = ((Recipe, "image"), (get_user_model(), "avatar"))
+
+# Варианты изображения: название -> наибольшая сторона, формат WebP
+VARIANTS = {"thumbnail": 160, "card": 480, "full": 1280}
+VARIANT_OPTIONS = {"quality": 80, "method": 6}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Пул потоков процесса; Pillow отпускает GIL при кодировании."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.FOODGRAM_IMAGE_WORKERS, thread_name_prefix="images"
+            )
+    return _executor
+
+
+def schedule_processing(instance, field_name):
+    """Ставит загруженное изображение в очередь после фиксации транзакции.
+
+    Оригинал к этому моменту уже сохранён, статус поля ``<field>_status``
+    - pending. При FOODGRAM_IMAGE_WORKERS = 0 обработка идёт сразу.
+    """
+    args = (instance._meta.label, instance.pk, field_name, getattr(instance, field_name).name)
+    if settings.FOODGRAM_IMAGE_WORKERS:
+        transaction.on_commit(lambda: get_executor().submit(process_in_thread, *args))
+    else:
+        transaction.on_commit(lambda: process_image(*args))
+
+
+def reencode(source):
+    """Поворачивает по EXIF, уменьшает до предельного размера и пережимает.
+
+    Возвращает байты или None, если формат не перекодируется.
+    """
+    with Image.open(source) as image:
+        image_format = image.format
+        if image_format not in SAVE_OPTIONS or getattr(image, "is_animated", False):
+            return None
+        image = ImageOps.exif_transpose(image)
+        side = settings.FOODGRAM_IMAGE_MAX_SIDE
+        image.thumbnail((side, side))
+        if image_format == "JPEG" and image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        output = io.BytesIO()
+        image.save(output, format=image_format, **SAVE_OPTIONS[image_format])
+    return output.getvalue()
+
+
+def make_variants(name, directory, storage=default_storage):
+    """Сохраняет варианты изображения в <directory>/variants/.
+
+    directory - upload_to поля: каталог берётся не из имени оригинала,
+    в котором уже есть каталог хэша. Возвращает {название варианта: имя
+    файла}. Не обращается к БД, поэтому подходит и для пула процессов
+    (команда generate_image_variants).
+    """
+    stem = os.path.splitext(os.path.basename(name))[0]
+    variants = {}
+    with storage.open(name) as source, Image.open(source) as original:
+        original = ImageOps.exif_transpose(original)
+        if original.mode not in ("RGB", "RGBA"):
+            original = original.convert(
+                "RGBA" if "transparency" in original.info or "A" in original.mode else "RGB"
+            )
+        for variant, side in VARIANTS.items():
+            image = original.copy()
+            image.thumbnail((side, side))
+            output = io.BytesIO()
+            image.save(output, format="WEBP", **VARIANT_OPTIONS)
+            variants[variant] = storage.save(
+                posixpath.join(directory, "variants", f"{stem}_{variant}.webp"),
+                ContentFile(output.getvalue()),
+            )
+    return variants
+
+
+def referenced_names(name, variants):
+    """Файлы, на которые ссылается поле: изображение и его варианты."""
+    return [file_name for file_name in (name, *variants.values()) if file_name]
+
+
+def move_references(previous, current):
+    """Меняет число ссылок на файлы: previous -> current (списки имён).
+
+    Вызывается в транзакции, которая меняет поля изображений, поэтому
+    счётчики фиксируются вместе с ними.
+    """
+    added = Counter(current) - Counter(previous)
+    removed = Counter(previous) - Counter(current)
+    if added:
+        FileReference.objects.bulk_create(
+            [FileReference(name=name) for name in added], ignore_conflicts=True
+        )
+    for changes, sign in ((added, 1), (removed, -1)):
+        by_delta = {}
+        for name, times in changes.items():
+            by_delta.setdefault(times * sign, []).append(name)
+        for delta, names in by_delta.items():
+            change_counter(FileReference, "count", names, delta)
+
+
+def recount_references():
+    """Пересчитывает ссылки на файлы по полям изображений.
+
+    Для загрузок без сигналов (bulk_create, COPY) и исправления
+    разошедшихся счётчиков. Возвращает число исправленных файлов.
+    """
+    counts = Counter()
+    for model, field in IMAGE_FIELDS:
+        for name, variants in model.objects.values_list(
+            field, f"{field}_variants"
+        ).iterator():
+            counts.update(referenced_names(name, variants))
+    fixed = []
+    for reference in FileReference.objects.iterator():
+        count = counts.pop(reference.name, 0)
+        if reference.count != count:
+            reference.count = count
+            fixed.append(reference)
+    FileReference.objects.bulk_update(fixed, ["count"], batch_size=1000)
+    FileReference.objects.bulk_create(
+        [FileReference(name=name, count=count) for name, count in counts.items()],
+        batch_size=1000, update_conflicts=True, unique_fields=["name"], update_fields=["count"],
+    )
+    return len(fixed) + len(counts)
+
+
+def update_image(model, pk, field_name, name, **values):
+    """update() полей изображения, если поле всё ещё ссылается на name.
+
+    Счётчики ссылок (FileReference) меняются в той же транзакции.
+    Возвращает True, если строка обновлена.
+    """
+    variants_field = f"{field_name}_variants"
+    current = model.objects.filter(pk=pk, **{field_name: name})
+    with transaction.atomic():
+        previous = current.select_for_update().values_list(variants_field, flat=True).first()
+        if previous is None or not current.update(**values):
+            return False
+        move_references(
+            referenced_names(name, previous),
+            referenced_names(values.get(field_name, name), values.get(variants_field, previous)),
+        )
+    return True
+
+
+def delete_variants(variants, storage=default_storage):
+    for variant_name in variants.values():
+        storage.delete(variant_name)
+
+
+def delete_files(name, variants, storage=default_storage):
+    """Удаляет изображение и его варианты.
+
+    Вызывается, когда запись уже не ссылается на файлы: хранилище не
+    удаляет файлы, на которые есть ссылки (см. ContentHashStorage.delete).
+    """
+    if name:
+        storage.delete(name)
+    delete_variants(variants, storage)
+
+
+def process_image(model_label, pk, field_name, name):
+    """Обрабатывает изображение в фоне и записывает результат.
+
+    Пережимает оригинал и создаёт варианты (VARIANTS). Строка обновляется,
+    только если изображение не заменили за время обработки; иначе
+    результат удаляется.
+    """
+    model = apps.get_model(model_label)
+    field = model._meta.get_field(field_name)
+    storage = field.storage
+    status_field = f"{field_name}_status"
+    try:
+        with storage.open(name) as source:
+            content = reencode(source)
+            original_size = source.size
+        new_name = name
+        if content is not None and len(content) < original_size:
+            # Каталог - из upload_to поля, а не из имени с каталогом хэша
+            new_name = storage.save(
+                field.generate_filename(None, os.path.basename(name)), ContentFile(content)
+            )
+        variants = make_variants(new_name, field.upload_to, storage)
+        if update_image(model, pk, field_name, name, **{
+            field_name: new_name,
+            status_field: ImageStatus.READY,
+            f"{field_name}_variants": variants,
+        }):
+            if new_name != name:
+                storage.delete(name)
+        else:
+            delete_variants(variants, storage)
+            if new_name != name:
+                storage.delete(new_name)
+    except Exception:
+        logger.exception("Image processing failed: %s %s %s", model_label, pk, name)
+        model.objects.filter(pk=pk, **{field_name: name}).update(
+            **{status_field: ImageStatus.FAILED}
+        )
+    finally:
+        image_changed(model, pk)
+
+
+def process_in_thread(*args):
+    """process_image в пуле потоков: поток закрывает свои соединения с БД."""
+    try:
+        process_image(*args)
+    finally:
+        close_old_connections()
+
+
+def image_changed(model, pk):
+    # update() не отправляет сигналы - сбрасываем кэш, как api.signals
+    if model is Recipe:
+        scopes = ["recipes", recipe_scope(pk)]
+    else:
+        scopes = ["users", *map(
+            recipe_scope, Recipe.objects.filter(author_id=pk).values_list("id", flat=True)
+        )]
+    transaction.on_commit(partial(bump_versions, *scopes))
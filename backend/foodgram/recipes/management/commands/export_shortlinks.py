@@ -0,0 +1,62 @@
+import os
+import tempfile
+
+from django.core.management.base import BaseCommand
+
+from recipes.shortlinks import encode, map_path
+from recipes.models import Recipe
+
+# Размер хэша map по умолчанию в nginx
+DEFAULT_HASH_SIZE = 2048
+
+
+def write_atomic(path, lines):
+    """Пишет файл во временный и подменяет целиком.
+
+    nginx при перезагрузке не прочитает файл наполовину записанным.
+    """
+    with tempfile.NamedTemporaryFile(
+        'w', dir=os.path.dirname(path), suffix='.tmp', delete=False
+    ) as file:
+        file.writelines(lines)
+    os.chmod(file.name, 0o644)
+    os.replace(file.name, path)
+
+
+class Command(BaseCommand):
+    help = (
+        'Export short links of all recipes as an nginx map '
+        '(reload nginx afterwards to apply it)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output',
+            default=map_path(),
+            help='Path of the map file (nginx includes shortlinks/*.map from media); '
+                 'the hash size is written next to it with the .conf extension'
+        )
+
+    def handle(self, *args, **options):
+        path = options['output']
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        count = Recipe.objects.count()
+        # На рецепт в map две записи (/r/ и /s/); хэш с запасом, чтобы nginx
+        # не отказался загрузить карту. Размер пишется первым: больший хэш
+        # подходит и к старой карте, если перезагрузка случится между файлами
+        hash_size = max(DEFAULT_HASH_SIZE, 4 * count)
+        write_atomic(
+            os.path.splitext(path)[0] + '.conf', [f'map_hash_max_size {hash_size};\n']
+        )
+        write_atomic(path, self.entries())
+        self.stdout.write(self.style.SUCCESS(
+            f'Exported {count} recipes to {path}'
+        ))
+
+    def entries(self):
+        for recipe_id in Recipe.objects.order_by('id').values_list(
+            'id', flat=True
+        ).iterator(chunk_size=10000):
+            target = f'/recipes/{recipe_id}/'
+            yield f'/r/{encode(recipe_id)}/ {target};\n'
+            yield f'/s/{recipe_id}/ {target};\n'
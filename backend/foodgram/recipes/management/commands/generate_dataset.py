@@ -0,0 +1,394 @@
+import io
+import json
+import random
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from functools import partial
+from itertools import accumulate
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from PIL import Image
+
+from recipes.cache import bump_versions
+from recipes.counters import recount
+from recipes.images import make_variants, recount_references
+from recipes.models import Component, Favorite, Ingredient, Recipe, ShoppingCart
+from recipes.search import update_search_documents
+from recipes.shopping import refresh_shopping_lists
+from users.models import ImageStatus, Subscription
+
+User = get_user_model()
+
+# Начало отсчёта дат: одинаковые параметры дают одинаковые данные
+EPOCH = datetime(2020, 1, 1, tzinfo=timezone.utc)
+PERIOD = timedelta(days=5 * 365)
+DISHES = (
+    'Салат', 'Суп', 'Рагу', 'Запеканка', 'Пирог', 'Омлет', 'Паста', 'Плов',
+    'Котлеты', 'Каша', 'Соус', 'Десерт', 'Смузи', 'Жаркое', 'Блины',
+)
+FIRST_NAMES = ('Анна', 'Иван', 'Мария', 'Пётр', 'Ольга', 'Сергей', 'Елена', 'Дмитрий')
+LAST_NAMES = ('Иванова', 'Петров', 'Смирнова', 'Кузнецов', 'Попова', 'Соколов')
+AMOUNTS = (1, 2, 3, 5, 10, 20, 50, 100, 150, 200, 250, 300, 500)
+
+
+class Zipf:
+    """Выбор элементов с вероятностью, обратной степени ранга (закон Ципфа)."""
+
+    def __init__(self, items, exponent, rng):
+        self.items = items
+        self.rng = rng
+        self.weights = [rank ** -exponent for rank in range(1, len(items) + 1)]
+        self.cum_weights = list(accumulate(self.weights))
+
+    def choices(self, k):
+        return self.rng.choices(self.items, cum_weights=self.cum_weights, k=k)
+
+    def counts(self, total, capacity):
+        """Распределяет total между элементами, не больше capacity на элемент.
+
+        Лишнее у заполненных элементов заново распределяется между
+        остальными с теми же весами.
+        """
+        if total > capacity * len(self.items):
+            raise ValueError(total)
+        counts = Counter()
+        items, weights = self.items, self.weights
+        while total:
+            for item in self.rng.choices(items, weights=weights, k=total):
+                if counts[item] < capacity:
+                    counts[item] += 1
+                    total -= 1
+            available = [
+                (item, weight) for item, weight in zip(items, weights) if counts[item] < capacity
+            ]
+            items = [item for item, weight in available]
+            weights = [weight for item, weight in available]
+        return counts
+
+    def sample(self, k, exclude=()):
+        """k разных элементов (меньше, если столько нет)."""
+        k = min(k, len(self.items) - len(exclude))
+        if k * 2 > len(self.items):
+            # Почти все элементы - быстрее равномерная выборка
+            return self.rng.sample([item for item in self.items if item not in exclude], k)
+        chosen = {}
+        while len(chosen) < k:
+            for item in self.choices(k - len(chosen)):
+                if item not in exclude:
+                    chosen.setdefault(item)
+        return list(chosen)
+
+
+class TableWriter:
+    """Пишет строки в таблицу модели пакетами.
+
+    В PostgreSQL - через COPY, в остальных БД - executemany по INSERT.
+    Значения передаются как есть: pre_save полей (auto_now_add) не
+    вызывается, недостающие поля получают значения по умолчанию.
+    """
+
+    def __init__(self, model, batch_size):
+        self.model = model
+        self.fields = model._meta.concrete_fields
+        self.defaults = {
+            field.attname: field.get_default() for field in self.fields if not field.primary_key
+        }
+        self.batch_size = batch_size
+        self.rows = []
+        self.written = 0
+
+    def add(self, **values):
+        self.rows.append(values)
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.rows:
+            return
+        if connection.vendor == 'postgresql':
+            self.copy()
+        else:
+            self.insert()
+        self.written += len(self.rows)
+        self.rows = []
+
+    def values(self, row):
+        return [row.get(field.attname, self.defaults.get(field.attname)) for field in self.fields]
+
+    def copy(self):
+        buffer = io.StringIO()
+        for row in self.rows:
+            buffer.write('\t'.join(map(self.copy_value, self.values(row))))
+            buffer.write('\n')
+        buffer.seek(0)
+        columns = ', '.join(connection.ops.quote_name(field.column) for field in self.fields)
+        with connection.cursor() as cursor:
+            cursor.copy_expert(
+                f'COPY {connection.ops.quote_name(self.model._meta.db_table)} '
+                f'({columns}) FROM STDIN',
+                buffer,
+            )
+
+    @staticmethod
+    def copy_value(value):
+        if type(value) is int:
+            return str(value)
+        if value is None:
+            return '\\N'
+        if isinstance(value, bool):
+            return 't' if value else 'f'
+        if isinstance(value, (dict, list)):
+            value = json.dumps(value, ensure_ascii=False)
+        elif isinstance(value, datetime):
+            value = value.isoformat()
+        return (
+            str(value).replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r')
+        )
+
+    def insert(self):
+        columns = ', '.join(connection.ops.quote_name(field.column) for field in self.fields)
+        placeholders = ', '.join(['%s'] * len(self.fields))
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {connection.ops.quote_name(self.model._meta.db_table)} '
+                f'({columns}) VALUES ({placeholders})',
+                [
+                    [
+                        field.get_db_prep_save(value, connection)
+                        for field, value in zip(self.fields, self.values(row))
+                    ]
+                    for row in self.rows
+                ],
+            )
+
+
+class Command(BaseCommand):
+    help = (
+        'Generate a deterministic synthetic dataset of users, recipes, favorites, '
+        'shopping carts and subscriptions for scale testing'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000, help='Number of users')
+        parser.add_argument('--recipes', type=int, default=10000, help='Number of recipes')
+        parser.add_argument(
+            '--favorites', type=int, default=50000, help='Number of favorites'
+        )
+        parser.add_argument(
+            '--carts', type=int, default=5000, help='Number of shopping cart entries'
+        )
+        parser.add_argument(
+            '--subscriptions', type=int, default=10000, help='Number of subscriptions'
+        )
+        parser.add_argument(
+            '--zipf', type=float, default=1.1,
+            help='Zipf exponent of popularity and activity distributions'
+        )
+        parser.add_argument(
+            '--images', type=int, default=10,
+            help='Number of distinct placeholder images (0 - recipes without images)'
+        )
+        parser.add_argument('--seed', type=int, default=0, help='Random seed')
+        parser.add_argument(
+            '--batch-size', type=int, default=10000, help='Number of rows per COPY/INSERT'
+        )
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.options = options
+        self.batch_size = max(options['batch_size'], 1)
+        self.prefix = f"gen{options['seed']}_"
+        if User.objects.filter(username__startswith=self.prefix).exists():
+            raise CommandError(f"Users '{self.prefix}*' already exist: use another --seed")
+        self.ingredients = dict(Ingredient.objects.values_list('id', 'name'))
+        if not self.ingredients:
+            raise CommandError('The ingredient catalogue is empty: run import_ingredients first')
+        if options['recipes'] > 0 and options['users'] < 1:
+            raise CommandError('Recipes need at least one user')
+        self.started = time.monotonic()
+
+        placeholders = self.make_placeholders(options['images'])
+        with transaction.atomic():
+            user_ids = self.id_range(User, options['users'])
+            recipe_ids = self.id_range(Recipe, options['recipes'])
+            # Популярность авторов, активность пользователей и популярность
+            # рецептов - случайные перестановки, частоты по рангу - закон
+            # Ципфа. Авторы, у которых больше рецептов, популярнее у подписчиков.
+            popularity = self.shuffled(user_ids)
+            authors = (
+                Zipf(popularity, options['zipf'], self.rng).choices(len(recipe_ids))
+                if recipe_ids else []
+            )
+            activity = Zipf(self.shuffled(user_ids), options['zipf'], self.rng)
+            recipes = Zipf(self.shuffled(recipe_ids), options['zipf'], self.rng)
+            # Связи пишутся раньше пользователей и рецептов (проверка внешних
+            # ключей отложена до фиксации), чтобы сразу записать счётчики
+            favorites = self.generate_relations(
+                Favorite, 'recipe_id', options['favorites'], activity, recipes
+            )
+            carts = self.generate_relations(
+                ShoppingCart, 'recipe_id', options['carts'], activity, recipes
+            )
+            subscriptions = self.generate_relations(
+                Subscription, 'subscribed_to_id', options['subscriptions'], activity,
+                Zipf(popularity, options['zipf'], self.rng),
+            )
+            self.generate_users(user_ids, Counter(authors), subscriptions)
+            self.generate_recipes(recipe_ids, authors, favorites[1], placeholders)
+            with connection.cursor() as cursor:
+                for sql in connection.ops.sequence_reset_sql(no_style(), [
+                    User, Recipe, Component, Favorite, ShoppingCart, Subscription
+                ]):
+                    cursor.execute(sql)
+            self.apply_side_effects(recipe_ids, sorted(carts[0]))
+            transaction.on_commit(partial(
+                bump_versions, 'ingredients', 'recipes', 'users', 'recipe_ids'
+            ))
+        self.report('Dataset generated')
+
+    def report(self, message):
+        self.stdout.write(f"[{time.monotonic() - self.started:7.1f}s] {message}")
+
+    def shuffled(self, items):
+        items = list(items)
+        self.rng.shuffle(items)
+        return items
+
+    def next_id(self, model):
+        return (model.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+
+    def id_range(self, model, count):
+        first_id = self.next_id(model)
+        return range(first_id, first_id + count)
+
+    def make_placeholders(self, count):
+        """Одноцветные изображения-заглушки и их варианты: (имя, варианты)."""
+        placeholders = []
+        for index in range(count):
+            color = tuple(self.rng.randrange(256) for _ in range(3))
+            output = io.BytesIO()
+            Image.new('RGB', (1280, 853), color).save(output, format='JPEG', quality=85)
+            directory = Recipe._meta.get_field('image').upload_to
+            name = default_storage.save(
+                f'{directory}placeholder_{index}.jpg', ContentFile(output.getvalue())
+            )
+            placeholders.append((name, make_variants(name, directory)))
+        return placeholders
+
+    def generate_users(self, user_ids, recipes, subscriptions):
+        subscribed, followers = subscriptions
+        # Хеширование PBKDF2 дорогое, у всех пользователей один пароль
+        password = make_password('password')
+        writer = TableWriter(User, self.batch_size)
+        for user_id in user_ids:
+            username = f'{self.prefix}{user_id}'
+            writer.add(
+                id=user_id,
+                username=username,
+                email=f'{username}@example.com',
+                password=password,
+                first_name=self.rng.choice(FIRST_NAMES),
+                last_name=self.rng.choice(LAST_NAMES),
+                date_joined=EPOCH + PERIOD * (user_id - user_ids.start) / len(user_ids),
+                recipes_count=recipes[user_id],
+                subscriptions_count=subscribed[user_id],
+                followers_count=followers[user_id],
+            )
+        writer.flush()
+        self.report(f"Users: {writer.written}")
+
+    def generate_recipes(self, recipe_ids, authors, favorites, placeholders):
+        ingredients = Zipf(self.shuffled(self.ingredients), self.options['zipf'], self.rng)
+        recipes = TableWriter(Recipe, self.batch_size)
+        components = TableWriter(Component, self.batch_size)
+        component_id = self.next_id(Component)
+        for recipe_id, author_id in zip(recipe_ids, authors):
+            # Ингредиентов в рецепте обычно 5-10, медиана около 7
+            recipe_ingredients = ingredients.sample(
+                min(max(round(self.rng.lognormvariate(2.0, 0.35)), 2), 25)
+            )
+            names = [self.ingredients[ingredient_id] for ingredient_id in recipe_ingredients]
+            cooking_time = max(round(self.rng.lognormvariate(3.4, 0.6)), 1)
+            image, variants = self.rng.choice(placeholders) if placeholders else (None, {})
+            recipes.add(
+                id=recipe_id,
+                name=f'{self.rng.choice(DISHES)} с {names[0]}'[:256],
+                author_id=author_id,
+                image=image,
+                image_status=ImageStatus.READY,
+                image_variants=variants,
+                text=f"Ингредиенты: {', '.join(names)}. Готовить {cooking_time} мин.",
+                cooking_time=cooking_time,
+                publish_date=EPOCH + PERIOD * (
+                    (recipe_id - recipe_ids.start + self.rng.random()) / len(recipe_ids)
+                ),
+                favorites_count=favorites[recipe_id],
+            )
+            for ingredient_id in recipe_ingredients:
+                components.add(
+                    id=component_id,
+                    recipe_id=recipe_id,
+                    ingredient_id=ingredient_id,
+                    amount=self.rng.choice(AMOUNTS),
+                )
+                component_id += 1
+        recipes.flush()
+        components.flush()
+        self.report(f"Recipes: {recipes.written}, components: {components.written}")
+
+    def generate_relations(self, model, target_field, total, activity, targets):
+        """Связи пользователь - объект: число связей пользователя и
+        популярность объектов распределены по закону Ципфа.
+
+        Возвращает число записанных связей по пользователям и по объектам.
+        """
+        writer = TableWriter(model, self.batch_size)
+        relation_id = self.next_id(model)
+        exclude_self = target_field == 'subscribed_to_id'
+        # Пользователь связан с каждым объектом не больше одного раза
+        capacity = max(len(targets.items) - exclude_self, 0)
+        try:
+            counts = activity.counts(max(total, 0), capacity)
+        except ValueError:
+            raise CommandError(
+                f"Cannot create {total} {model.__name__} rows: at most "
+                f"{capacity * len(activity.items)} fit the requested users and recipes"
+            )
+        by_user, by_target = Counter(), Counter()
+        for user_id in sorted(counts):
+            for target_id in targets.sample(
+                counts[user_id], exclude={user_id} if exclude_self else ()
+            ):
+                writer.add(**{'id': relation_id, 'user_id': user_id, target_field: target_id})
+                relation_id += 1
+                by_user[user_id] += 1
+                by_target[target_id] += 1
+        writer.flush()
+        self.report(f"{model._meta.verbose_name_plural}: {writer.written}")
+        return by_user, by_target
+
+    def apply_side_effects(self, recipe_ids, cart_users):
+        """Счётчики ингредиентов и ссылок на файлы, поисковые документы и
+        списки покупок: COPY не вызывает сигналы. Остальные счётчики уже
+        записаны.
+        """
+        recount(Ingredient, 'recipes_count', Component, 'ingredient')
+        self.report('Ingredient counters recounted')
+        recount_references()
+        self.report('File references recounted')
+        for start in range(0, len(recipe_ids), self.batch_size):
+            update_search_documents(recipe_ids[start:start + self.batch_size])
+        self.report('Search documents updated')
+        ingredient_ids = list(self.ingredients)
+        for start in range(0, len(cart_users), 500):
+            refresh_shopping_lists(cart_users[start:start + 500], ingredient_ids)
+        self.report('Shopping lists refreshed')
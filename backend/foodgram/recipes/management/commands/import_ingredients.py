@@ -1,49 +1,149 @@
+import csv
 import json
+import os
+from itertools import islice
+
 from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.cache import bump_versions
 from recipes.models import Ingredient
 
+NAME_LENGTH = Ingredient._meta.get_field('name').max_length
+UNIT_LENGTH = Ingredient._meta.get_field('measurement_unit').max_length
+
+
+def iter_json_array(file, chunk_size=1 << 16):
+    """Элементы JSON-массива верхнего уровня по одному, без чтения всего файла."""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    started = False
+    eof = False
+    while True:
+        buffer = buffer.lstrip()
+        if not started and buffer:
+            if buffer[0] != '[':
+                raise ValueError('JSON array expected')
+            buffer = buffer[1:].lstrip()
+            started = True
+        if started and buffer:
+            if buffer[0] == ']':
+                return
+            if buffer[0] == ',':
+                buffer = buffer[1:].lstrip()
+        if started and buffer:
+            try:
+                item, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            else:
+                # Элемент в конце буфера может быть обрезан (например, число)
+                if end < len(buffer) or eof:
+                    yield item
+                    buffer = buffer[end:]
+                    continue
+        if eof:
+            raise ValueError('Unexpected end of JSON array')
+        chunk = file.read(chunk_size)
+        eof = not chunk
+        buffer += chunk
+
+
+def read_json(file):
+    # Поддерживаются фикстура Django (db_ingredients.json) и исходный
+    # список словарей name/measurement_unit (ingredients.json)
+    for item in iter_json_array(file):
+        fields = item.get('fields', item)
+        yield fields['name'], fields['measurement_unit']
+
+
+def read_csv(file):
+    for row in csv.reader(file):
+        if row:
+            yield row[0], row[1]
+
+
+READERS = {'.json': read_json, '.csv': read_csv}
+
 
 class Command(BaseCommand):
-    help = 'Import ingredients from a JSON file into the database'
+    help = (
+        'Import ingredients from a JSON fixture, a raw JSON list '
+        'or a name,unit CSV file into the database'
+    )
 
     def add_arguments(self, parser):
         parser.add_argument(
             'file_path',
             type=str,
-            help='Path to the JSON file containing ingredients data'
+            help='Path to the JSON or CSV file containing ingredients data'
+        )
+        parser.add_argument(
+            '--format',
+            choices=('json', 'csv'),
+            help='File format (by default - from the file extension)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of ingredients inserted per query'
         )
 
     def handle(self, *args, **options):
         file_path = options['file_path']
+        self.verbosity = options['verbosity']
+        extension = (
+            f".{options['format']}" if options['format']
+            else os.path.splitext(file_path)[1].lower()
+        )
+        if extension not in READERS:
+            self.stderr.write(f"Error: Unknown format of {file_path}")
+            return
         try:
-            with open(file_path, 'r', encoding='utf-8') as file:
-                data = json.load(file)
+            with open(file_path, 'r', encoding='utf-8', newline='') as file:
+                created_count, processed = self.import_rows(
+                    READERS[extension](file), max(options['batch_size'], 1)
+                )
         except FileNotFoundError:
             self.stderr.write(f"Error: File {file_path} not found")
             return
-        except json.JSONDecodeError:
-            self.stderr.write(f"Error: File {file_path} is not a valid JSON")
+        except (ValueError, KeyError, IndexError) as e:
+            # json.JSONDecodeError - подкласс ValueError
+            self.stderr.write(f"Error: File {file_path} is not valid: {e!r}")
             return
 
-        created_count = 0
-        for item in data:
-            # Предполагаем, что JSON содержит поля модели Ingredient
-            try:
-                ingredient, created = Ingredient.objects.get_or_create(
-                    name=item['fields']['name'],
-                    measurement_unit=item['fields']['measurement_unit']
-                )
-                if created:
-                    created_count += 1
-            except KeyError as e:
-                self.stderr.write(f"Error: Missing field {e} in JSON data")
-                continue
-            except Exception as e:
-                self.stderr.write(f"Error processing item {item}: {e}")
-                continue
-
         self.stdout.write(
             self.style.SUCCESS(
-                f"Successfully imported {created_count} new ingredients"
+                f"Successfully imported {created_count} new ingredients "
+                f"({processed} processed)"
             )
         )
+
+    def import_rows(self, rows, batch_size):
+        """Пакетная вставка в одной транзакции; существующие пропускаются.
+
+        bulk_create не отправляет сигналы, поэтому версия каталога
+        ингредиентов повышается здесь.
+        """
+        processed = 0
+        with transaction.atomic():
+            before = Ingredient.objects.count()
+            while batch := list(islice(rows, batch_size)):
+                ingredients = []
+                for name, unit in batch:
+                    name, unit = name.strip(), unit.strip()
+                    if not name or not unit or len(name) > NAME_LENGTH \
+                            or len(unit) > UNIT_LENGTH:
+                        self.stderr.write(f"Error: Invalid ingredient {name!r}, {unit!r}")
+                        continue
+                    ingredients.append(Ingredient(name=name, measurement_unit=unit))
+                Ingredient.objects.bulk_create(ingredients, ignore_conflicts=True)
+                processed += len(batch)
+                if self.verbosity:
+                    self.stdout.write(f"Processed {processed} ingredients")
+            created_count = Ingredient.objects.count() - before
+            if created_count:
+                transaction.on_commit(lambda: bump_versions('ingredients'))
+        return created_count, processed
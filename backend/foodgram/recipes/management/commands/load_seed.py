@@ -0,0 +1,276 @@
+import multiprocessing
+import os
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import (
+    UNUSABLE_PASSWORD_PREFIX, identify_hasher, make_password
+)
+from django.core import serializers
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, connections, transaction
+from django.db.models import Q
+
+from recipes.cache import bump_versions, recipe_scope, user_scope
+from recipes.counters import COUNTERS, recount
+from recipes.images import IMAGE_FIELDS, make_variants, recount_references
+from recipes.models import (
+    Component, Favorite, Ingredient, Recipe, ShoppingCart, ShoppingListItem
+)
+from recipes.search import update_search_documents
+from recipes.shopping import refresh_shopping_lists
+from users.models import ImageStatus, Subscription
+
+User = get_user_model()
+
+# Модели в порядке зависимостей и поля, по которым запись считается уже
+# загруженной: None - по первичному ключу (на него ссылаются другие записи),
+# иначе по уникальному сочетанию, а id из фикстуры не используется.
+SEED_MODELS = (
+    (Ingredient, None),
+    (User, None),
+    (Recipe, None),
+    (Component, ('recipe', 'ingredient')),
+    (Favorite, ('user', 'recipe')),
+    (ShoppingCart, ('user', 'recipe')),
+    (Subscription, ('user', 'subscribed_to')),
+)
+
+
+def needs_hashing(password):
+    if not password or password.startswith(UNUSABLE_PASSWORD_PREFIX):
+        return False
+    try:
+        identify_hasher(password)
+    except ValueError:
+        return True
+    return False
+
+
+class Command(BaseCommand):
+    help = (
+        'Load users, recipes, components, favorites, shopping carts and '
+        'subscriptions from JSON fixtures with bulk inserts; can be re-run'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'fixtures',
+            nargs='+',
+            help='Django JSON fixtures, e.g. data/db_users.json data/db_recipes.json'
+        )
+        parser.add_argument(
+            '--images',
+            help='Directory with recipe images and avatars referenced by the fixtures'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=multiprocessing.cpu_count(),
+            help='Number of processes for password hashing and image variants'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of rows per INSERT'
+        )
+
+    def handle(self, *args, **options):
+        objects, m2m, skipped = self.read(options['fixtures'])
+        self.attach_images(objects, options['images'])
+        # Хеширование паролей и варианты изображений не обращаются к БД;
+        # соединения не должны достаться процессам пула по наследству
+        connections.close_all()
+        workers = max(options['workers'], 1)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            self.hash_passwords(pool, objects[User], workers)
+            self.make_variants(pool, objects)
+
+        batch_size = max(options['batch_size'], 1)
+        with transaction.atomic():
+            for model, unique_fields in SEED_MODELS:
+                self.insert(model, objects[model], unique_fields, batch_size)
+            for through, rows in m2m.items():
+                through.objects.bulk_create(rows, batch_size=batch_size, ignore_conflicts=True)
+            with connection.cursor() as cursor:
+                for sql in connection.ops.sequence_reset_sql(
+                    no_style(), [model for model, unique_fields in SEED_MODELS]
+                ):
+                    cursor.execute(sql)
+            self.apply_side_effects(objects)
+
+        for model, unique_fields in SEED_MODELS:
+            self.stdout.write(f"{model._meta.label}: {len(objects[model])}")
+        for label, count in skipped.items():
+            self.stdout.write(f"{label}: {count} skipped")
+        self.stdout.write(self.style.SUCCESS('Seed data loaded'))
+
+    def read(self, fixtures):
+        seed_models = dict(SEED_MODELS)
+        # Запись, встреченная в нескольких фикстурах, берётся из последней
+        objects = defaultdict(dict)
+        m2m = defaultdict(list)
+        skipped = Counter()
+        for path in fixtures:
+            try:
+                with open(path, encoding='utf-8') as file:
+                    for item in serializers.deserialize('json', file, ignorenonexistent=True):
+                        model = type(item.object)
+                        if model not in seed_models:
+                            skipped[model._meta.label] += 1
+                            continue
+                        objects[model][self.key(item.object, seed_models[model])] = item.object
+                        for name, values in (item.m2m_data or {}).items():
+                            field = model._meta.get_field(name)
+                            through = field.remote_field.through
+                            m2m[through].extend(
+                                through(**{
+                                    f'{field.m2m_field_name()}_id': item.object.pk,
+                                    f'{field.m2m_reverse_field_name()}_id': value,
+                                })
+                                for value in values
+                            )
+            except (OSError, serializers.base.DeserializationError) as error:
+                raise CommandError(f"Error: Can't load {path}: {error}")
+        return defaultdict(list, {
+            model: list(objs.values()) for model, objs in objects.items()
+        }), m2m, skipped
+
+    @staticmethod
+    def key(obj, unique_fields):
+        if unique_fields is None:
+            return obj.pk
+        return tuple(
+            getattr(obj, type(obj)._meta.get_field(field).attname) for field in unique_fields
+        )
+
+    def attach_images(self, objects, images_dir):
+        """Копирует изображения из каталога в хранилище (имя - по содержимому)."""
+        if not images_dir:
+            return
+        for model, field in IMAGE_FIELDS:
+            upload_to = model._meta.get_field(field).upload_to
+            for obj in objects[model]:
+                name = getattr(obj, field).name
+                if not name:
+                    continue
+                path = os.path.join(images_dir, os.path.basename(name))
+                if not os.path.isfile(path):
+                    self.stderr.write(f"Missing image: {path}")
+                    continue
+                with open(path, 'rb') as file:
+                    setattr(obj, field, default_storage.save(
+                        os.path.join(upload_to, os.path.basename(name)), File(file)
+                    ))
+
+    def hash_passwords(self, pool, users, workers):
+        users = [user for user in users if needs_hashing(user.password)]
+        passwords = pool.map(
+            make_password, [user.password for user in users],
+            chunksize=max(len(users) // (workers * 4), 1),
+        )
+        for user, password in zip(users, passwords):
+            user.password = password
+
+    def make_variants(self, pool, objects):
+        futures = []
+        for model, field in IMAGE_FIELDS:
+            directory = model._meta.get_field(field).upload_to
+            for obj in objects[model]:
+                setattr(obj, f'{field}_status', ImageStatus.READY)
+                setattr(obj, f'{field}_variants', {})
+                name = getattr(obj, field).name
+                if name and default_storage.exists(name):
+                    futures.append(
+                        (obj, field, name, pool.submit(make_variants, name, directory))
+                    )
+        for obj, field, name, future in futures:
+            try:
+                setattr(obj, f'{field}_variants', future.result())
+            except Exception as error:
+                self.stderr.write(f"{type(obj)._meta.label} {obj.pk} ({name}): {error}")
+
+    def insert(self, model, objs, unique_fields, batch_size):
+        """Вставка пакетами; уже загруженные записи обновляются."""
+        if not objs:
+            return
+        if unique_fields is None:
+            unique_fields = (model._meta.pk.name,)
+            extra = [
+                f'{field}_{suffix}' for image_model, field in IMAGE_FIELDS
+                if image_model is model for suffix in ('status', 'variants')
+            ]
+            update_fields = [
+                field.name for field in model._meta.concrete_fields
+                if (field.editable and not field.primary_key) or field.name in extra
+            ]
+        else:
+            for obj in objs:
+                obj.pk = None
+            update_fields = [
+                field.name for field in model._meta.concrete_fields
+                if field.editable and not field.primary_key and field.name not in unique_fields
+            ]
+        # bulk_create заменяет значения полей auto_now/auto_now_add текущим
+        # временем, поэтому значения из фикстуры записываются отдельно
+        auto_fields = [
+            field for field in model._meta.concrete_fields
+            if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+        ]
+        stamped = [
+            (obj, {field.attname: getattr(obj, field.attname) for field in auto_fields})
+            for obj in objs
+        ]
+        options = (
+            {'update_conflicts': True, 'unique_fields': unique_fields,
+             'update_fields': update_fields}
+            if update_fields else {'ignore_conflicts': True}
+        )
+        model.objects.bulk_create(objs, batch_size=batch_size, **options)
+        for field in auto_fields:
+            restored = []
+            for obj, values in stamped:
+                if values[field.attname] is not None:
+                    setattr(obj, field.attname, values[field.attname])
+                    restored.append(obj)
+            if restored and model._meta.pk.name in unique_fields:
+                model.objects.bulk_update(restored, [field.name], batch_size=batch_size)
+
+    def apply_side_effects(self, objects):
+        """То, что при обычном сохранении делают сигналы: bulk_create их не отправляет."""
+        for model, field, related_model, foreign_key in COUNTERS:
+            recount(model, field, related_model, foreign_key)
+        recount_references()
+        recipe_ids = {recipe.pk for recipe in objects[Recipe]}
+        recipe_ids.update(component.recipe_id for component in objects[Component])
+        update_search_documents(recipe_ids)
+
+        user_ids = set(ShoppingCart.objects.filter(
+            Q(user__in={cart.user_id for cart in objects[ShoppingCart]})
+            | Q(recipe__in=recipe_ids)
+        ).values_list('user_id', flat=True))
+        ingredient_ids = set(Component.objects.filter(
+            recipe__shopping_carts__user__in=user_ids
+        ).values_list('ingredient_id', flat=True))
+        ingredient_ids.update(ShoppingListItem.objects.filter(
+            user__in=user_ids
+        ).values_list('ingredient_id', flat=True))
+        refresh_shopping_lists(user_ids, ingredient_ids)
+
+        recipe_ids.update(Recipe.objects.filter(
+            author__in=[user.pk for user in objects[User]]
+        ).values_list('id', flat=True))
+        scopes = [recipe_scope(recipe_id) for recipe_id in recipe_ids]
+        for model, name in (
+            (Favorite, 'favorites'), (ShoppingCart, 'carts'), (Subscription, 'subscriptions')
+        ):
+            scopes.extend(user_scope(name, obj.user_id) for obj in objects[model])
+        transaction.on_commit(partial(
+            bump_versions, 'ingredients', 'recipes', 'users', 'recipe_ids', *set(scopes)
+        ))
@@ -0,0 +1,27 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.cache import bump_versions
+from recipes.counters import COUNTERS, recount
+from recipes.images import recount_references
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Recompute denormalized counters and repair the ones that drifted'
+
+    def handle(self, *args, **options):
+        users_fixed = 0
+        for model, field, related_model, foreign_key in COUNTERS:
+            fixed = recount(model, field, related_model, foreign_key)
+            self.stdout.write(f"{model._meta.label}.{field}: fixed {fixed}")
+            if model is User:
+                users_fixed += fixed
+        if users_fixed:
+            # update() не отправляет сигналы, а recipes_count пользователей
+            # есть в ответах API (подписки) с версией users
+            transaction.on_commit(lambda: bump_versions('users'))
+        self.stdout.write(f"FileReference.count: fixed {recount_references()}")
+        self.stdout.write(self.style.SUCCESS("Counters are up to date"))
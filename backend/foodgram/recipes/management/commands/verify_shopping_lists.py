@@ -0,0 +1,66 @@
+from functools import partial
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.cache import bump_versions, user_scope
+from recipes.models import ShoppingListItem
+from recipes.shopping import live_totals
+
+
+class Command(BaseCommand):
+    help = 'Compare stored shopping lists with the live cart aggregate'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fix',
+            action='store_true',
+            help='Rebuild the stored shopping lists from the live aggregate'
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            expected = {
+                (user_id, ingredient_id): amount
+                for user_id, ingredient_id, amount in live_totals().iterator()
+            }
+            stored = {
+                (user_id, ingredient_id): amount
+                for user_id, ingredient_id, amount in ShoppingListItem.objects.values_list(
+                    'user_id', 'ingredient_id', 'amount'
+                ).iterator()
+            }
+            differences = 0
+            changed_users = set()
+            for key in sorted(expected.keys() | stored.keys()):
+                if expected.get(key) != stored.get(key):
+                    differences += 1
+                    changed_users.add(key[0])
+                    self.stdout.write(
+                        f"user {key[0]}, ingredient {key[1]}: "
+                        f"stored {stored.get(key)}, expected {expected.get(key)}"
+                    )
+            if not differences:
+                self.stdout.write(self.style.SUCCESS(
+                    f"Shopping lists are consistent ({len(stored)} items)"
+                ))
+                return
+            if not options['fix']:
+                self.stderr.write(f"Found {differences} mismatched items, run with --fix")
+                return
+            ShoppingListItem.objects.all().delete()
+            ShoppingListItem.objects.bulk_create(
+                (
+                    ShoppingListItem(user_id=user_id, ingredient_id=ingredient_id, amount=amount)
+                    for (user_id, ingredient_id), amount in expected.items()
+                ),
+                batch_size=1000,
+            )
+            # bulk_create не отправляет сигналы: ETag выгрузки списка
+            # покупок меняется вместе с версией корзины пользователя
+            transaction.on_commit(partial(bump_versions, *(
+                user_scope('carts', user_id) for user_id in changed_users
+            )))
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt shopping lists: fixed {differences} items"
+        ))
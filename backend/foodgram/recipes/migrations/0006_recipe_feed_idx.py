@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 19:59
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("recipes", "0005_alter_shoppingcart_options_remove_recipe_urn"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="recipe",
+            index=models.Index(fields=["-publish_date", "-id"], name="recipe_feed_idx"),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2 on 2026-10-18 20:08
+
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+# Индексы нужны только в PostgreSQL: в SQLite (локальные тесты) поиск
+# работает без них, через LIKE (см. recipes.search).
+CREATE_INDEXES = """
+CREATE INDEX recipe_search_vector_idx ON recipes_recipe USING gin (search_vector);
+CREATE INDEX recipe_name_trgm_idx ON recipes_recipe USING gin (name gin_trgm_ops);
+UPDATE recipes_recipe AS recipe SET search_vector =
+    setweight(to_tsvector('russian', recipe.name), 'A')
+    || setweight(to_tsvector('russian', coalesce((
+        SELECT string_agg(ingredient.name, ' ')
+        FROM recipes_component AS component
+        JOIN recipes_ingredient AS ingredient ON ingredient.id = component.ingredient_id
+        WHERE component.recipe_id = recipe.id
+    ), '')), 'B')
+    || setweight(to_tsvector('russian', recipe.text), 'C');
+"""
+
+DROP_INDEXES = """
+DROP INDEX IF EXISTS recipe_search_vector_idx;
+DROP INDEX IF EXISTS recipe_name_trgm_idx;
+"""
+
+
+def create_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(CREATE_INDEXES)
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(DROP_INDEXES)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("recipes", "0006_recipe_feed_idx"),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name="recipe",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2 on 2026-10-18 20:15
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+COUNTERS = (
+    ('recipes.Recipe', 'favorites_count', 'recipes.Favorite', 'recipe'),
+    ('recipes.Ingredient', 'recipes_count', 'recipes.Component', 'ingredient'),
+    ('users.FoodgramUser', 'recipes_count', 'recipes.Recipe', 'author'),
+    ('users.FoodgramUser', 'subscriptions_count', 'users.Subscription', 'user'),
+    ('users.FoodgramUser', 'followers_count', 'users.Subscription', 'subscribed_to'),
+)
+
+
+def fill_counters(apps, schema_editor):
+    for model, field, related_model, foreign_key in COUNTERS:
+        count = Coalesce(Subquery(
+            apps.get_model(related_model).objects.filter(**{foreign_key: OuterRef('pk')})
+            .order_by().values(foreign_key).annotate(count=Count('pk')).values('count')
+        ), Value(0))
+        apps.get_model(model).objects.update(**{field: count})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_shopping_list_item'),
+        ('users', '0004_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingredient',
+            name='recipes_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Рецепты'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В избранном'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2 on 2026-10-18 22:10
+
+from collections import Counter
+
+from django.db import migrations, models
+
+IMAGE_FIELDS = (('recipes.Recipe', 'image'), ('users.FoodgramUser', 'avatar'))
+
+
+def fill_references(apps, schema_editor):
+    counts = Counter()
+    for model, field in IMAGE_FIELDS:
+        for name, variants in apps.get_model(model).objects.values_list(
+            field, f'{field}_variants'
+        ).iterator():
+            counts.update(filter(None, [name, *variants.values()]))
+    apps.get_model('recipes.FileReference').objects.bulk_create(
+        [apps.get_model('recipes.FileReference')(name=name, count=count)
+         for name, count in counts.items()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0011_image_variants'),
+        ('users', '0006_image_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FileReference',
+            fields=[
+                ('name', models.CharField(max_length=255, primary_key=True, serialize=False, verbose_name='Файл')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='Ссылки')),
+            ],
+            options={
+                'verbose_name': 'Ссылки на файл',
+                'verbose_name_plural': 'Ссылки на файлы',
+            },
+        ),
+        migrations.RunPython(fill_references, migrations.RunPython.noop),
+    ]
@@ -1,7 +1,10 @@
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 from django.core.validators import MinValueValidator
 
+from users.models import ImageStatus
+
 User = get_user_model()
 
 
@@ -18,6 +21,17 @@ class Recipe(models.Model):
         blank=True,
         verbose_name="Изображение",
     )
+    image_status = models.CharField(
+        max_length=8,
+        choices=ImageStatus.choices,
+        default=ImageStatus.READY,
+        editable=False,
+        verbose_name="Обработка изображения",
+    )
+    # Уменьшенные копии изображения в WebP: {"thumbnail": имя файла, ...}
+    image_variants = models.JSONField(
+        default=dict, blank=True, editable=False, verbose_name="Варианты изображения"
+    )
     text = models.TextField(verbose_name="Описание")
     cooking_time = models.PositiveBigIntegerField(
         verbose_name="Время готовки (мин)",
@@ -27,10 +41,20 @@ class Recipe(models.Model):
         "Ingredient", through="Component", verbose_name="Ингредиенты"
     )
     publish_date = models.DateTimeField(auto_now_add=True)
+    # Поисковый документ: название, ингредиенты и описание (см. recipes.search).
+    # GIN-индексы по нему и по названию создаются миграцией только в PostgreSQL.
+    search_vector = SearchVectorField(null=True, editable=False)
+    favorites_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name="В избранном"
+    )
 
     class Meta:
         default_related_name = "recipes"
         ordering = ("-publish_date",)
+        indexes = [
+            # Ключ курсорной пагинации ленты рецептов
+            models.Index(fields=["-publish_date", "-id"], name="recipe_feed_idx"),
+        ]
         verbose_name = "Рецепт"
         verbose_name_plural = "Рецепты"
 
@@ -41,6 +65,9 @@ class Recipe(models.Model):
 class Ingredient(models.Model):
     name = models.CharField(max_length=150, unique=True, verbose_name="Название")
     measurement_unit = models.CharField(max_length=15, verbose_name="Единица измерения")
+    recipes_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name="Рецепты"
+    )
 
     class Meta:
         constraints = [models.UniqueConstraint(fields=["name", "measurement_unit"],
@@ -115,3 +142,52 @@ class ShoppingCart(UserRecipeRelationModel):
         default_related_name = "shopping_carts"
         verbose_name = "Список покупок"
         verbose_name_plural = "Списки покупок"
+
+
+class ShoppingListItem(models.Model):
+    """Сумма ингредиента по всем рецептам в корзине пользователя.
+
+    Материализованный агрегат Component x ShoppingCart: поддерживается
+    функциями recipes.shopping при изменении корзин и состава рецептов
+    и сверяется командой verify_shopping_lists.
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name="Пользователь",
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        verbose_name="Ингредиент",
+    )
+    amount = models.PositiveIntegerField(verbose_name="Количество")
+
+    class Meta:
+        default_related_name = "shopping_list_items"
+        constraints = [models.UniqueConstraint(fields=["user", "ingredient"],
+                                               name="unique_shopping_list_item")]
+        verbose_name = "Продукт из списка покупок"
+        verbose_name_plural = "Продукты из списков покупок"
+
+    def __str__(self):
+        return f"{self.user.username} - {self.ingredient.name} - {self.amount}"
+
+
+class FileReference(models.Model):
+    """Число записей, ссылающихся на файл хранилища.
+
+    Имена файлов - по SHA-256 содержимого (см. api.storage), одинаковые
+    изображения разных записей - один файл. Счётчик меняется вместе с
+    полями изображений (см. recipes.images.move_references), и хранилище
+    удаляет файл, только когда ссылок не осталось.
+    """
+    name = models.CharField(max_length=255, primary_key=True, verbose_name="Файл")
+    count = models.PositiveIntegerField(default=0, verbose_name="Ссылки")
+
+    class Meta:
+        verbose_name = "Ссылки на файл"
+        verbose_name_plural = "Ссылки на файлы"
+
+    def __str__(self):
+        return f"{self.name} - {self.count}"
@@ -0,0 +1,91 @@
+import threading
+
+from django.contrib.postgres.search import (
+    SearchQuery, SearchRank, SearchVector, TrigramSimilarity
+)
+from django.contrib.postgres.aggregates import StringAgg
+from django.db import connection, transaction
+from django.db.models import F, FloatField, OuterRef, Q, Subquery, TextField, Value
+from django.db.models.functions import Cast, Coalesce
+
+from .models import Component, Recipe
+
+# Конфигурация полнотекстового поиска PostgreSQL
+SEARCH_CONFIG = "russian"
+
+# id рецептов, документы которых пересчитываются при фиксации транзакции
+_pending = threading.local()
+
+
+def is_supported():
+    """Полнотекстовый и триграммный поиск есть только в PostgreSQL."""
+    return connection.vendor == "postgresql"
+
+
+def update_search_documents(recipe_ids):
+    """Пересчитывает поисковый документ (название, ингредиенты, описание)."""
+    if not is_supported():
+        return
+    ingredient_names = Subquery(
+        Component.objects.filter(recipe=OuterRef("pk"))
+        .values("recipe")
+        .annotate(names=StringAgg("ingredient__name", " "))
+        .values("names")
+    )
+    Recipe.objects.filter(pk__in=recipe_ids).update(search_vector=(
+        SearchVector("name", weight="A", config=SEARCH_CONFIG)
+        + SearchVector(
+            Coalesce(ingredient_names, Value(""), output_field=TextField()),
+            weight="B", config=SEARCH_CONFIG,
+        )
+        + SearchVector("text", weight="C", config=SEARCH_CONFIG)
+    ))
+
+
+def schedule_search_documents(recipe_ids):
+    """Пересчитывает поисковые документы после фиксации транзакции.
+
+    Все изменения рецепта и его ингредиентов в одной транзакции (создание
+    рецепта, затем компоненты) дают один UPDATE, когда ингредиенты уже
+    сохранены. Вне транзакции документ пересчитывается сразу.
+    """
+    if not is_supported():
+        return
+    if not hasattr(_pending, "ids"):
+        _pending.ids = set()
+    _pending.ids.update(recipe_ids)
+    # Повторные вызовы находят множество уже пустым; id из отменённой
+    # транзакции пересчитаются со следующей - это безвредно
+    transaction.on_commit(_flush_search_documents)
+
+
+def _flush_search_documents():
+    recipe_ids, _pending.ids = getattr(_pending, "ids", set()), set()
+    if recipe_ids:
+        update_search_documents(recipe_ids)
+
+
+def search_recipes(recipes, query):
+    """Рецепты, подходящие под запрос, от более релевантных к менее.
+
+    В PostgreSQL - совпадение по поисковому документу (GIN-индекс) или
+    нечёткое совпадение названия по триграммам (GIN-индекс pg_trgm).
+    В остальных СУБД - поиск подстроки без ранжирования.
+    """
+    if not is_supported():
+        return recipes.filter(
+            Q(name__icontains=query)
+            | Q(text__icontains=query)
+            | Q(ingredients__name__icontains=query)
+        ).distinct()
+    search_query = SearchQuery(query, config=SEARCH_CONFIG, search_type="websearch")
+    return recipes.filter(
+        Q(search_vector=search_query) | Q(name__trigram_similar=query)
+    ).annotate(
+        # Ранг вычисляется в real; double precision переживает JSON курсора
+        # без потери точности, и условие "после ранга" сравнивает те же числа
+        rank=Cast(
+            SearchRank(F("search_vector"), search_query) + TrigramSimilarity("name", query),
+            FloatField(),
+        )
+    ).order_by("-rank", "-publish_date", "-id")
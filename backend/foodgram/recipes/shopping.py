@@ -0,0 +1,78 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Sum
+
+from .models import Component, ShoppingCart, ShoppingListItem
+
+
+def live_totals(user_ids=None, ingredient_ids=None):
+    """Суммы ингредиентов по корзинам: (user_id, ingredient_id, amount).
+
+    Считаются заново по Component и ShoppingCart; None - без ограничения.
+    """
+    lookups = {"recipe__components__amount__isnull": False}
+    if user_ids is not None:
+        lookups["user__in"] = user_ids
+    if ingredient_ids is not None:
+        lookups["recipe__components__ingredient__in"] = ingredient_ids
+    return (
+        ShoppingCart.objects.filter(**lookups)
+        .values_list("user_id", "recipe__components__ingredient_id")
+        .annotate(amount=Sum("recipe__components__amount"))
+        .order_by()
+    )
+
+
+def refresh_shopping_lists(user_ids, ingredient_ids):
+    """Пересчитывает строки списков покупок для пар (пользователь, ингредиент).
+
+    Агрегат считается только по затронутым пользователям и ингредиентам,
+    а записываются только изменившиеся строки.
+    """
+    user_ids, ingredient_ids = list(user_ids), list(ingredient_ids)
+    if not user_ids or not ingredient_ids:
+        return
+    with transaction.atomic():
+        # Пересчёты одного пользователя идут по очереди: иначе параллельный
+        # пересчёт, не увидевший чужую корзину, перезапишет более новые суммы
+        list(get_user_model().objects.select_for_update().filter(
+            pk__in=user_ids
+        ).order_by("pk").values_list("pk", flat=True))
+        totals = {
+            (user_id, ingredient_id): amount
+            for user_id, ingredient_id, amount in live_totals(user_ids, ingredient_ids)
+        }
+        stale = []
+        for item_id, user_id, ingredient_id, amount in ShoppingListItem.objects.filter(
+            user__in=user_ids, ingredient__in=ingredient_ids
+        ).values_list("id", "user_id", "ingredient_id", "amount"):
+            if (user_id, ingredient_id) not in totals:
+                stale.append(item_id)
+            elif totals[user_id, ingredient_id] == amount:
+                del totals[user_id, ingredient_id]
+        if stale:
+            ShoppingListItem.objects.filter(id__in=stale).delete()
+        if totals:
+            ShoppingListItem.objects.bulk_create(
+                (
+                    ShoppingListItem(user_id=user_id, ingredient_id=ingredient_id, amount=amount)
+                    for (user_id, ingredient_id), amount in totals.items()
+                ),
+                update_conflicts=True,
+                unique_fields=("user", "ingredient"),
+                update_fields=("amount",),
+            )
+
+
+def refresh_for_cart(user_id, recipe_id):
+    """Рецепт добавлен в корзину пользователя или удалён из неё."""
+    refresh_shopping_lists([user_id], Component.objects.filter(
+        recipe_id=recipe_id
+    ).values_list("ingredient_id", flat=True))
+
+
+def refresh_for_recipe(recipe_id, ingredient_ids):
+    """Изменился состав рецепта: пересчёт у всех, у кого он в корзине."""
+    refresh_shopping_lists(ShoppingCart.objects.filter(
+        recipe_id=recipe_id
+    ).values_list("user_id", flat=True), ingredient_ids)
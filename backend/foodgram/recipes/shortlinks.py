@@ -0,0 +1,109 @@
+import os
+import string
+import threading
+
+from django.conf import settings
+
+from .cache import get_versions
+from .models import Recipe
+
+ALPHABET = string.digits + string.ascii_letters
+CODE_LENGTH = 6
+# Коды длины CODE_LENGTH - это id, умноженный на MULTIPLIER по модулю
+# 62 ** CODE_LENGTH: соседние рецепты получают непохожие коды. Это не защита,
+# а только способ не показывать порядковые номера в ссылках.
+MODULUS = len(ALPHABET) ** CODE_LENGTH
+MULTIPLIER = 35_104_476_157
+INVERSE = pow(MULTIPLIER, -1, MODULUS)
+
+
+def _to_base62(number, length=0):
+    digits = []
+    while number:
+        number, digit = divmod(number, len(ALPHABET))
+        digits.append(ALPHABET[digit])
+    return "".join(reversed(digits)).rjust(length, ALPHABET[0])
+
+
+def encode(recipe_id):
+    """Короткий код рецепта: 6 символов base62 для id < 62 ** 6, длиннее - для остальных."""
+    if recipe_id < MODULUS:
+        return _to_base62(recipe_id * MULTIPLIER % MODULUS, CODE_LENGTH)
+    return _to_base62(recipe_id)
+
+
+def decode(code):
+    """id рецепта по короткому коду; ValueError, если код некорректен."""
+    if len(code) < CODE_LENGTH or any(char not in ALPHABET for char in code):
+        raise ValueError(code)
+    number = 0
+    for char in code:
+        number = number * len(ALPHABET) + ALPHABET.index(char)
+    if len(code) == CODE_LENGTH:
+        return number * INVERSE % MODULUS
+    if number < MODULUS or code[0] == ALPHABET[0]:
+        raise ValueError(code)  # у id из этого диапазона другой код
+    return number
+
+
+def map_path():
+    """Карта коротких ссылок для nginx (см. команду export_shortlinks)."""
+    return os.path.join(settings.MEDIA_ROOT, "shortlinks", "recipes.map")
+
+
+def invalidate_map():
+    """Удаляет выгруженную карту: в ней остались удалённые рецепты.
+
+    Загруженную карту nginx применяет до перезагрузки; после неё короткие
+    ссылки проверяет Django, пока карту не выгрузят заново.
+    """
+    try:
+        os.remove(map_path())
+    except FileNotFoundError:
+        pass
+
+
+class LiveRecipeIds:
+    """Множество id существующих рецептов в памяти процесса (битовая карта).
+
+    Загружается одним запросом и перезагружается, когда меняется версия
+    области "recipe_ids" (её повышает создание и удаление рецептов после
+    фиксации, см. api.signals). Проверка id не обращается к БД: id больше
+    максимального загруженного не существует - иначе версия уже сменилась
+    бы и карта была бы перезагружена.
+    """
+
+    def __init__(self):
+        self.version = None
+        self.lock = threading.Lock()
+        # (битовая карта, максимальный id в ней)
+        self.bitmap = (bytearray(1), 0)
+
+    def ensure_fresh(self):
+        version = get_versions("recipe_ids")["recipe_ids"]
+        if version == self.version:
+            return
+        with self.lock:
+            if version != self.version:
+                self.load()
+                self.version = version
+
+    def load(self):
+        ids = list(Recipe.objects.order_by().values_list("id", flat=True))
+        max_id = max(ids, default=0)
+        bitmap = bytearray(max_id // 8 + 1)
+        for recipe_id in ids:
+            bitmap[recipe_id >> 3] |= 1 << (recipe_id & 7)
+        self.bitmap = (bitmap, max_id)
+
+    def __contains__(self, recipe_id):
+        if recipe_id < 1:
+            return False
+        self.ensure_fresh()
+        bitmap, max_id = self.bitmap
+        if recipe_id > max_id:
+            return False
+        return bool(bitmap[recipe_id >> 3] & (1 << (recipe_id & 7)))
+
+
+live_recipe_ids = LiveRecipeIds()
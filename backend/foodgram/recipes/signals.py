@@ -0,0 +1,103 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .counters import change_counter
+from .images import IMAGE_FIELDS, move_references, referenced_names
+from .models import Component, Favorite, Ingredient, Recipe, ShoppingCart
+from .search import schedule_search_documents
+from .shopping import refresh_for_cart, refresh_for_recipe
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved(sender, instance, created, raw=False, **kwargs):
+    schedule_search_documents([instance.id])
+    if created and not raw:
+        change_counter(User, "recipes_count", [instance.author_id], 1)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    change_counter(User, "recipes_count", [instance.author_id], -1)
+
+
+@receiver(pre_save, sender=Component)
+def component_saving(sender, instance, **kwargs):
+    # Ингредиент компонента могли заменить - старый тоже нужно пересчитать
+    instance._previous_ingredient_id = Component.objects.filter(
+        pk=instance.pk
+    ).values_list("ingredient_id", flat=True).first() if instance.pk else None
+
+
+@receiver((post_save, post_delete), sender=Component)
+def component_changed(sender, instance, **kwargs):
+    schedule_search_documents([instance.recipe_id])
+    previous_ingredient_id = getattr(instance, "_previous_ingredient_id", None)
+    refresh_for_recipe(instance.recipe_id, {
+        instance.ingredient_id, previous_ingredient_id
+    } - {None})
+    if kwargs.get("raw"):
+        return
+    if kwargs["signal"] is post_delete:
+        change_counter(Ingredient, "recipes_count", [instance.ingredient_id], -1)
+    elif previous_ingredient_id != instance.ingredient_id:
+        change_counter(Ingredient, "recipes_count", [instance.ingredient_id], 1)
+        if previous_ingredient_id is not None:
+            change_counter(Ingredient, "recipes_count", [previous_ingredient_id], -1)
+
+
+@receiver((post_save, post_delete), sender=ShoppingCart)
+def shopping_cart_changed(sender, instance, **kwargs):
+    refresh_for_cart(instance.user_id, instance.recipe_id)
+
+
+@receiver(post_save, sender=Favorite)
+def favorite_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        change_counter(Recipe, "favorites_count", [instance.recipe_id], 1)
+
+
+@receiver(post_delete, sender=Favorite)
+def favorite_deleted(sender, instance, **kwargs):
+    change_counter(Recipe, "favorites_count", [instance.recipe_id], -1)
+
+
+# Модель -> поле изображения
+IMAGE_FIELD = dict(IMAGE_FIELDS)
+
+
+def image_files(instance):
+    field = IMAGE_FIELD[type(instance)]
+    return referenced_names(getattr(instance, field).name, getattr(instance, f"{field}_variants"))
+
+
+@receiver(pre_save, sender=Recipe)
+@receiver(pre_save, sender=User)
+def image_saving(sender, instance, update_fields=None, **kwargs):
+    # Прежние файлы записи, чтобы после сохранения поменять число ссылок;
+    # None - поля изображения не сохраняются (например, last_login)
+    field = IMAGE_FIELD[sender]
+    instance._previous_files = None
+    if update_fields is not None and not {field, f"{field}_variants"} & set(update_fields):
+        return
+    previous = None
+    if not instance._state.adding:
+        previous = sender.objects.filter(pk=instance.pk).values_list(
+            field, f"{field}_variants"
+        ).first()
+    instance._previous_files = referenced_names(*previous) if previous else []
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=User)
+def image_saved(sender, instance, **kwargs):
+    if instance._previous_files is not None:
+        move_references(instance._previous_files, image_files(instance))
+
+
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=User)
+def image_deleted(sender, instance, **kwargs):
+    move_references(image_files(instance), [])
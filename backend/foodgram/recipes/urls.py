@@ -1,7 +1,9 @@
 from django.urls import path
-from .views import redirect_to_recipe
+from .views import redirect_by_code, redirect_to_recipe
 
 
 urlpatterns = [
+    path("r/<str:code>/", redirect_by_code, name="shortcode-redirect"),
+    # Старые ссылки по id продолжают работать
     path("s/<int:recipe_id>/", redirect_to_recipe, name="shortlink-redirect"),
 ]
@@ -1,9 +1,18 @@
 from django.shortcuts import redirect
 from django.http import Http404
-from recipes.models import Recipe
+from .shortlinks import decode, live_recipe_ids
 
 
 def redirect_to_recipe(request, recipe_id):
-    if not Recipe.objects.filter(pk=recipe_id).exists():
+    # Наличие рецепта проверяется по битовой карте в памяти, без запроса к БД
+    if recipe_id not in live_recipe_ids:
         raise Http404
     return redirect(f"/recipes/{recipe_id}/")
+
+
+def redirect_by_code(request, code):
+    try:
+        recipe_id = decode(code)
+    except ValueError:
+        raise Http404
+    return redirect_to_recipe(request, recipe_id)
@@ -89,15 +89,3 @@ class FoodgramUserAdmin(BaseUserAdmin):
     @mark_safe
     def avatar_image(self, obj):
         return f'<img src="{obj.avatar.url}" width="50" height="50" />' if obj.avatar else ""
-
-    @admin.display(description="Рецепты")
-    def recipes_count(self, obj):
-        return obj.recipes.count()
-
-    @admin.display(description="Подписки")
-    def subscriptions_count(self, obj):
-        return obj.subscriptions.count()
-
-    @admin.display(description="Подписчики")
-    def followers_count(self, obj):
-        return obj.authors.count()
@@ -4,6 +4,13 @@ from django.db import models
 from django.core.validators import RegexValidator
 
 
+class ImageStatus(models.TextChoices):
+    """Состояние фоновой обработки загруженного изображения (recipes.images)."""
+    PENDING = "pending", "Обрабатывается"
+    READY = "ready", "Готово"
+    FAILED = "failed", "Ошибка обработки"
+
+
 class FoodgramUser(AbstractUser):
     email = models.EmailField(
         "Электронная почта",
@@ -23,6 +30,17 @@ class FoodgramUser(AbstractUser):
     first_name = models.CharField("Имя", max_length=150, null=False, blank=False)
     last_name = models.CharField("Фамилия", max_length=150, null=False, blank=False)
     avatar = models.ImageField("Аватар", upload_to="users/avatars/", null=True, blank=True)
+    avatar_status = models.CharField(
+        "Обработка аватара", max_length=8, choices=ImageStatus.choices,
+        default=ImageStatus.READY, editable=False,
+    )
+    avatar_variants = models.JSONField(
+        "Варианты аватара", default=dict, blank=True, editable=False
+    )
+    # Счётчики поддерживаются recipes.counters, пересчёт - recount_counters
+    recipes_count = models.PositiveIntegerField("Рецепты", default=0, editable=False)
+    subscriptions_count = models.PositiveIntegerField("Подписки", default=0, editable=False)
+    followers_count = models.PositiveIntegerField("Подписчики", default=0, editable=False)
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS = ["username", "first_name", "last_name"]
 
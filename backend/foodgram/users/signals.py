@@ -0,0 +1,18 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from recipes.counters import change_counter
+from .models import FoodgramUser, Subscription
+
+
+@receiver(post_save, sender=Subscription)
+def subscription_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        change_counter(FoodgramUser, "subscriptions_count", [instance.user_id], 1)
+        change_counter(FoodgramUser, "followers_count", [instance.subscribed_to_id], 1)
+
+
+@receiver(post_delete, sender=Subscription)
+def subscription_deleted(sender, instance, **kwargs):
+    change_counter(FoodgramUser, "subscriptions_count", [instance.user_id], -1)
+    change_counter(FoodgramUser, "followers_count", [instance.subscribed_to_id], -1)